@@ -39,16 +39,30 @@ from email.mime.application import MIMEApplication
 import warnings
 import psutil
 import socket
+import threading
 import re
 import glob
 import atexit
 import math
+import queue
+import shlex
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 from typing import Optional, Dict, Any, List, Tuple
 import shutil
 
+from compartido import (
+    DiarioCambios, FUNCION_APLICAR, MigradorEsquema, PoolConexionesSSH,
+    RepositorioRespaldos, SentenciasRemotas, TransferenciaComprimida,
+    TransferenciaDeltaSQLite, usar_logger
+)
+
 warnings.filterwarnings('ignore')
 
+# Inicio de esta ejecución del script (Streamlit lo vuelve a ejecutar en cada rerun)
+INICIO_EJECUCION = time.time()
+
 # Intentar importar tomllib/tomli
 try:
     import tomllib
@@ -62,6 +76,13 @@ except ImportError:
         st.warning("⚠️ Instalar tomli: pip install tomli")
         # Continuar sin tomllib
 
+# Pillow es opcional: sin él los documentos se guardan tal como se eligieron
+try:
+    from PIL import Image, ImageOps
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
 # ============================================================================
 # CAPA 2: CONSTANTES, CONFIGURACIÓN Y DATOS ESTÁTICOS
 # ============================================================================
@@ -77,10 +98,14 @@ APP_CONFIG = {
     'backup_dir': 'backups_aspirantes',
     'uploads_dir': 'uploads',
     'max_backups': 10,
+    'retencion_respaldos': {'horas': 24, 'dias': 30, 'meses': 12},
     'estado_file': 'estado_aspirantes.json',
     'session_timeout': 60  # minutos
 }
 
+# Tamaño máximo de una petición de escritura SFTP (paramiko parte las escrituras mayores)
+BLOQUE_SFTP = 32768
+
 # Constantes de tiempo
 TIME_CONFIG = {
     'recordatorio_dias': 14,
@@ -142,6 +167,10 @@ class EnhancedLogger:
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
         
+        # Solo configurar si no tiene handlers: cada rerun vuelve a crear el logger
+        if self.logger.handlers:
+            return
+        
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
@@ -174,12 +203,14 @@ class EnhancedLogger:
         self.logger.critical(message, exc_info=exc_info, extra=extra)
 
 logger = EnhancedLogger()
+usar_logger(logger)
 
 class EstadoPersistente:
     """Maneja el estado persistente para el sistema de aspirantes"""
     
     def __init__(self, archivo_estado="estado_aspirantes.json"):
         self.archivo_estado = archivo_estado
+        self._candado = threading.Lock()
         self.estado = self._cargar_estado()
     
     def _cargar_estado(self):
@@ -228,7 +259,8 @@ class EstadoPersistente:
     
     def guardar_estado(self):
         try:
-            with open(self.archivo_estado, 'w') as f:
+            # La instancia es compartida por las sesiones (hilos) del proceso
+            with self._candado, open(self.archivo_estado, 'w') as f:
                 json.dump(self.estado, f, indent=2, default=str)
             logger.debug(f"Estado guardado en {self.archivo_estado}")
         except Exception as e:
@@ -295,7 +327,12 @@ class EstadoPersistente:
                 return None
         return None
 
-estado_sistema = EstadoPersistente()
+@st.cache_resource(show_spinner=False)
+def obtener_estado_sistema():
+    """Estado único por proceso: el JSON se lee una vez y no en cada rerun"""
+    return EstadoPersistente()
+
+estado_sistema = obtener_estado_sistema()
 
 # ============================================================================
 # CAPA 4: UTILIDADES Y SERVICIOS BASE
@@ -432,19 +469,204 @@ def cargar_configuracion_secrets():
         logger.error(f"❌ Error cargando secrets.toml: {e}", exc_info=True)
         return {}
 
+class PoolConexionesArchivos(PoolConexionesSSH):
+    """Pool SSH que además recuerda qué directorios remotos ya se comprobaron
+    con cada conexión, para no repetir un stat por nivel en cada subida.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._directorios = {}      # id(ssh) -> directorios remotos que ya se sabe que existen
+        self.estructura_creada = False
+    
+    def _al_cerrar(self, ssh):
+        self._directorios.pop(id(ssh), None)
+    
+    def directorios_conocidos(self, ssh):
+        """Directorios remotos ya comprobados con esta conexión (se olvidan al cerrarla)"""
+        return self._directorios.setdefault(id(ssh), set())
+    
+    def olvidar_directorios(self):
+        """Tras un error de escritura no se confía en lo que se sabía del árbol remoto"""
+        self._directorios.clear()
+        self.estructura_creada = False
+
+@st.cache_resource(show_spinner=False)
+def obtener_pool_conexiones(host, port, username, password, timeout=TIME_CONFIG['ssh_connect_timeout'],
+                            max_conexiones=4, keepalive=30, max_inactividad=300):
+    """Pool único por proceso y servidor: sobrevive a reruns y sesiones de Streamlit"""
+    pool = PoolConexionesArchivos(host, port, username, password, timeout,
+                                  max_conexiones, keepalive, max_inactividad)
+    atexit.register(pool.cerrar_todo)
+    return pool
+
+class ColaRegistrosRemota:
+    """Cola de registros en el servidor con un único fusionador.
+    
+    Cada envío deja su changeset como un archivo JSON pequeño en el
+    directorio de la cola (escritura a un temporal y rename, así el fusionador
+    nunca ve un registro a medias) y después invoca al fusionador. Un flock
+    garantiza que solo un fusionador aplique registros a la vez: toma los
+    pendientes en orden de llegada, aplica cada uno en su propia transacción y
+    deja el resultado en `resultados/`. Los envíos concurrentes esperan el
+    candado y encuentran su resultado ya escrito, de modo que la latencia
+    depende del tamaño del registro y no del de la base. Si la base está
+    bloqueada el registro queda en la cola para la siguiente fusión.
+    """
+    
+    SCRIPT_FUSIONADOR = FUNCION_APLICAR + r'''
+import fcntl, time
+
+ruta, cola, propio = sys.argv[1], sys.argv[2], sys.argv[3]
+if not os.path.exists(ruta):
+    sys.stderr.write('No existe la base remota: ' + ruta)
+    sys.exit(2)
+
+resultados = os.path.join(cola, 'resultados')
+os.makedirs(resultados, exist_ok=True)
+
+def guardar_resultado(nombre, resultado):
+    temporal = os.path.join(resultados, '.' + nombre + '.tmp')
+    with open(temporal, 'w') as archivo:
+        json.dump(resultado, archivo)
+    os.replace(temporal, os.path.join(resultados, nombre))
+
+with open(os.path.join(cola, '.fusionador.lock'), 'w') as candado:
+    fcntl.flock(candado, fcntl.LOCK_EX)
+    conn = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    bloqueada = False
+    while not bloqueada:
+        pendientes = sorted(n for n in os.listdir(cola) if n.endswith('.json') and not n.startswith('.'))
+        if not pendientes:
+            break
+        for nombre in pendientes:
+            origen = os.path.join(cola, nombre)
+            try:
+                with open(origen, 'rb') as archivo:
+                    paquete = json.loads(archivo.read().decode('utf-8'))
+            except ValueError as e:
+                guardar_resultado(nombre, {'ok': False, 'conflictos': [
+                    {'tabla': '', 'operacion': '', 'fila': None, 'motivo': 'registro ilegible: ' + str(e)}]})
+                os.remove(origen)
+                continue
+            try:
+                resultado = aplicar_paquete(conn, paquete)
+            except sqlite3.OperationalError:
+                # Base ocupada por otro escritor: el registro espera a la siguiente fusión
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                bloqueada = True
+                break
+            guardar_resultado(nombre, resultado)
+            os.remove(origen)
+    conn.close()
+    
+    limite = time.time() - 86400
+    for nombre in os.listdir(resultados):
+        if os.path.getmtime(os.path.join(resultados, nombre)) < limite:
+            os.remove(os.path.join(resultados, nombre))
+
+propio = os.path.join(resultados, propio)
+if os.path.exists(propio):
+    with open(propio) as archivo:
+        sys.stdout.write(archivo.read())
+    os.remove(propio)
+else:
+    sys.stdout.write(json.dumps({'ok': None, 'pendiente': True}))
+'''
+    
+    def __init__(self, ssh, sftp, ruta_cola, timeout=120):
+        self.ssh = ssh
+        self.sftp = sftp
+        self.ruta_cola = ruta_cola.rstrip('/')
+        self.timeout = timeout
+    
+    def encolar(self, paquete):
+        """Dejar el registro en la cola con un nombre que ordena por llegada"""
+        nombre = f"{time.time_ns():020d}_{os.urandom(4).hex()}.json"
+        temporal = f"{self.ruta_cola}/.{nombre}.tmp"
+        with self.sftp.open(temporal, 'wb') as archivo:
+            archivo.write(json.dumps(paquete).encode('utf-8'))
+        try:
+            self.sftp.rename(temporal, f"{self.ruta_cola}/{nombre}")
+        except IOError:
+            # El rename pudo aplicarse aunque se perdiera la respuesta
+            self.sftp.stat(f"{self.ruta_cola}/{nombre}")
+        return nombre
+    
+    def resultado(self, nombre):
+        """Resultado ya escrito de `nombre` en resultados/ (se consume), o None si no está"""
+        ruta = f"{self.ruta_cola}/resultados/{nombre}"
+        try:
+            with self.sftp.open(ruta, 'rb') as archivo:
+                resultado = json.loads(archivo.read().decode('utf-8'))
+            self.sftp.remove(ruta)
+            return resultado
+        except (IOError, OSError, ValueError):
+            return None
+    
+    def fusionar(self, ruta_db, nombre):
+        """Correr el fusionador y regresar el resultado del registro `nombre`.
+        
+        {'ok': True|False, ...} si ya se aplicó o se rechazó, y
+        {'ok': None, 'pendiente': True} si sigue en la cola.
+        """
+        comando = (
+            f"python3 -c {shlex.quote(self.SCRIPT_FUSIONADOR)} "
+            f"{shlex.quote(ruta_db)} {shlex.quote(self.ruta_cola)} {shlex.quote(nombre)}"
+        )
+        stdin, stdout, stderr = self.ssh.exec_command(comando, timeout=self.timeout)
+        stdin.channel.shutdown_write()
+        
+        respuesta = stdout.read().decode('utf-8')
+        resultado = json.loads(respuesta) if respuesta.strip() else {}
+        if 'ok' not in resultado:
+            raise Exception(stderr.read().decode('utf-8', errors='ignore').strip() or "El fusionador no respondió")
+        return resultado
+    
+    def fusionar_o_pendiente(self, ruta_db, nombre):
+        """Como `fusionar`, pero un registro ya encolado nunca se reporta como fallo de transporte.
+        
+        Si el fusionador no responde se busca su resultado en `resultados/`;
+        sin él, el registro sigue en la cola y se reporta pendiente. El
+        resultado lleva el nombre del registro en 'registro'.
+        """
+        try:
+            resultado = self.fusionar(ruta_db, nombre)
+        except Exception as e:
+            logger.warning(f"⚠️ Fusión sin respuesta para {nombre}: {e}")
+            resultado = self.resultado(nombre) or {'ok': None, 'pendiente': True}
+        resultado['registro'] = nombre
+        return resultado
+
 # ============================================================================
 # CAPA 5: GESTIÓN DE CONEXIÓN SSH COMPLETA CON SUBIDA DE ARCHIVOS
 # ============================================================================
 
 class GestorConexionRemota:
-    """Gestor de conexión SSH al servidor remoto con gestión completa de archivos"""
+    """Gestor de conexión SSH al servidor remoto con gestión completa de archivos.
+    
+    Hay una sola instancia por proceso (ver obtener_gestor_remoto), así que
+    la conexión en uso (ssh/sftp) se guarda por hilo: cada sesión de
+    Streamlit corre en su propio hilo y recibe su propia conexión del pool.
+    """
     
     def __init__(self):
+        self._hilo = threading.local()
         self.ssh = None
         self.sftp = None
+        self.pool = None
         self.temp_files = []
         
         self.auto_connect = True
+        self.cola_registros = True
+        self.canales_subida = 4
+        self.presubida_documentos = True
+        self.horas_staging = 24
+        self.optimizar_documentos = True
+        self.lado_maximo_imagen = 2000
+        self.calidad_imagen = 85
+        self.retencion_respaldos = dict(APP_CONFIG['retencion_respaldos'])
         self.retry_attempts = TIME_CONFIG['retry_attempts']
         self.retry_delay_base = TIME_CONFIG['retry_delay_base']
         self.timeouts = {
@@ -469,6 +691,15 @@ class GestorConexionRemota:
         if 'system' in self.config_completa:
             sys_config = self.config_completa['system']
             self.auto_connect = sys_config.get('auto_connect', True)
+            self.cola_registros = bool(sys_config.get('cola_registros', True))
+            self.canales_subida = max(1, int(sys_config.get('canales_subida', 4)))
+            self.presubida_documentos = bool(sys_config.get('presubida_documentos', True))
+            self.horas_staging = int(sys_config.get('horas_staging', 24))
+            self.optimizar_documentos = bool(sys_config.get('optimizar_documentos', True))
+            self.lado_maximo_imagen = int(sys_config.get('lado_maximo_imagen', 2000))
+            self.calidad_imagen = int(sys_config.get('calidad_imagen', 85))
+            for periodo in self.retencion_respaldos:
+                self.retencion_respaldos[periodo] = int(sys_config.get(f"retencion_{periodo}", self.retencion_respaldos[periodo]))
             self.retry_attempts = sys_config.get('retry_attempts', 3)
             self.retry_delay_base = sys_config.get('retry_delay', 5)
         
@@ -479,14 +710,45 @@ class GestorConexionRemota:
         self.db_path_remoto = self.config.get('remote_db_aspirantes')
         self.uploads_path_remoto = self.config.get('remote_uploads_path')
         self.uploads_inscritos_remoto = self.config.get('remote_uploads_inscritos')
+        self.staging_path_remoto = self.config.get('remote_staging_path') or (
+            f"{self.uploads_path_remoto}/staging" if self.uploads_path_remoto else ''
+        )
+        self.blobs_path_remoto = self.config.get('remote_blobs_path') or (
+            f"{self.uploads_path_remoto}/blobs" if self.uploads_path_remoto else ''
+        )
         
         logger.info(f"🔗 Configuración SSH cargada para {self.config.get('host', 'No configurado')}")
         logger.info(f"📁 Ruta remota uploads: {self.uploads_path_remoto}")
         logger.info(f"📁 Ruta remota inscritos: {self.uploads_inscritos_remoto}")
         
-        if self.auto_connect and self.config.get('host'):
-            self.probar_conexion_inicial()
+        # Pool de conexiones compartido por el proceso (sobrevive a reruns)
+        self.pool = obtener_pool_conexiones(
+            self.config['host'],
+            self.config.get('port', 22),
+            self.config['username'],
+            self.config['password'],
+            self.timeouts['ssh_connect'],
+            self.config.get('pool_max', 4),
+            self.config.get('keepalive', 30),
+            self.config.get('pool_idle', 300)
+        )
+    
+    @property
+    def ssh(self):
+        return getattr(self._hilo, 'ssh', None)
+    
+    @ssh.setter
+    def ssh(self, valor):
+        self._hilo.ssh = valor
     
+    @property
+    def sftp(self):
+        return getattr(self._hilo, 'sftp', None)
+    
+    @sftp.setter
+    def sftp(self, valor):
+        self._hilo.sftp = valor
+
     def _cargar_configuracion_completa(self):
         config = {}
         
@@ -498,6 +760,9 @@ class GestorConexionRemota:
                 'username': ssh_config.get('username', ''),
                 'password': ssh_config.get('password', ''),
                 'timeout': int(ssh_config.get('timeout', 30)),
+                'keepalive': int(ssh_config.get('keepalive', 30)),
+                'pool_max': int(ssh_config.get('pool_max', 4)),
+                'pool_idle': int(ssh_config.get('pool_idle', 300)),
                 'remote_dir': ssh_config.get('remote_dir', ''),
                 'enabled': bool(ssh_config.get('enabled', True))
             })
@@ -507,9 +772,12 @@ class GestorConexionRemota:
                 'remote_db_aspirantes': paths_config.get('remote_db_aspirantes', ''),
                 'remote_uploads_path': paths_config.get('remote_uploads_path', ''),
                 'remote_uploads_inscritos': paths_config.get('remote_uploads_inscritos', ''),
+                'remote_staging_path': paths_config.get('remote_staging_path', ''),
                 'remote_uploads_estudiantes': paths_config.get('remote_uploads_estudiantes', ''),
                 'remote_uploads_egresados': paths_config.get('remote_uploads_egresados', ''),
                 'remote_uploads_contratados': paths_config.get('remote_uploads_contratados', ''),
+                'remote_cola_registros': paths_config.get('remote_cola_registros', ''),
+                'remote_backup_path': paths_config.get('backup_path', ''),
                 'db_local_path': paths_config.get('db_aspirantes', ''),
                 'uploads_path_local': paths_config.get('uploads_path', '')
             })
@@ -546,6 +814,8 @@ class GestorConexionRemota:
         pattern = os.path.join(temp_dir, "aspirantes_*.db")
         for old_file in glob.glob(pattern):
             try:
+                if os.path.basename(old_file).startswith("aspirantes_espejo_"):
+                    continue
                 if os.path.getmtime(old_file) < time.time() - 3600:
                     os.remove(old_file)
                     logger.debug(f"🗑️ Archivo temporal antiguo eliminado: {old_file}")
@@ -568,29 +838,11 @@ class GestorConexionRemota:
                 logger.warning("⚠️ No hay conectividad de red")
                 return False
             
-            ssh_test = paramiko.SSHClient()
-            ssh_test.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            port = self.config.get('port', 22)
-            timeout = self.timeouts['ssh_connect']
-            
-            ssh_test.connect(
-                hostname=self.config['host'],
-                port=port,
-                username=self.config['username'],
-                password=self.config['password'],
-                timeout=timeout,
-                banner_timeout=timeout,
-                allow_agent=False,
-                look_for_keys=False
-            )
-            
-            # Verificar estructura de directorios remotos
-            stdin, stdout, stderr = ssh_test.exec_command(f'ls -la "{self.uploads_path_remoto}"', timeout=self.timeouts['ssh_command'])
-            output = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-            
-            ssh_test.close()
+            # Verificar estructura de directorios remotos (reutiliza la conexión del pool)
+            with self.pool.conexion() as ssh_test:
+                stdin, stdout, stderr = ssh_test.exec_command(f'ls -la "{self.uploads_path_remoto}"', timeout=self.timeouts['ssh_command'])
+                output = stdout.read().decode().strip()
+                error = stderr.read().decode().strip()
             
             if error and "No such file" in error:
                 logger.warning(f"⚠️ Directorio remoto no encontrado: {self.uploads_path_remoto}")
@@ -623,29 +875,13 @@ class GestorConexionRemota:
                 logger.error("No hay configuración SSH disponible")
                 return False
                 
-            logger.info(f"🔗 Conectando SSH a {self.config['host']}:{self.config.get('port', 22)}...")
-            
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            port = self.config.get('port', 22)
-            timeout = self.timeouts['ssh_connect']
+            logger.debug(f"🔗 Obteniendo conexión SSH del pool para {self.config['host']}:{self.config.get('port', 22)}...")
             
-            self.ssh.connect(
-                hostname=self.config['host'],
-                port=port,
-                username=self.config['username'],
-                password=self.config['password'],
-                timeout=timeout,
-                banner_timeout=timeout,
-                allow_agent=False,
-                look_for_keys=False
-            )
-            
-            self.sftp = self.ssh.open_sftp()
+            self.ssh = self.pool.obtener()
+            self.sftp = self.pool.obtener_sftp(self.ssh)
             self.sftp.get_channel().settimeout(self.timeouts['sftp_transfer'])
             
-            logger.info(f"✅ Conexión SSH establecida a {self.config['host']}")
+            logger.debug(f"✅ Conexión SSH establecida a {self.config['host']}")
             estado_sistema.set_ssh_conectado(True, None)
             return True
             
@@ -666,20 +902,33 @@ class GestorConexionRemota:
             return False
     
     def desconectar_ssh(self):
+        """Devolver la conexión SSH al pool (el transporte queda abierto para reutilizarse)"""
         try:
-            if self.sftp:
-                self.sftp.close()
-            if self.ssh:
-                self.ssh.close()
-            logger.debug("🔌 Conexión SSH cerrada")
+            if self.ssh and self.pool:
+                if self.pool.liberar(self.ssh) == 0:
+                    self.ssh = None
+                    self.sftp = None
+            logger.debug("🔌 Conexión SSH devuelta al pool")
         except Exception as e:
-            logger.warning(f"⚠️ Error cerrando conexión SSH: {e}")
+            logger.warning(f"⚠️ Error liberando conexión SSH: {e}")
+    
+    def _descartar_conexion(self):
+        """Descartar la conexión actual del pool tras un error de transporte"""
+        if self.ssh and self.pool:
+            self.pool.invalidar(self.ssh)
+        self.ssh = None
+        self.sftp = None
     
     def _crear_directorio_remoto_recursivo(self, remote_path):
-        """Crear directorio remoto recursivamente"""
+        """Crear directorio remoto recursivamente (sin consultar los ya conocidos en esta conexión)"""
+        conocidos = self.pool.directorios_conocidos(self.ssh) if self.pool else set()
+        remote_path = remote_path.rstrip('/') or '/'
+        if remote_path in conocidos:
+            return True
         try:
             self.sftp.stat(remote_path)
             logger.info(f"📁 Directorio remoto ya existe: {remote_path}")
+            conocidos.add(remote_path)
             return True
         except FileNotFoundError:
             try:
@@ -688,6 +937,7 @@ class GestorConexionRemota:
                     self._crear_directorio_remoto_recursivo(parent_dir)
                 self.sftp.mkdir(remote_path)
                 logger.info(f"✅ Directorio remoto creado: {remote_path}")
+                conocidos.add(remote_path)
                 return True
             except Exception as e:
                 logger.error(f"❌ Error creando directorio remoto {remote_path}: {e}")
@@ -696,35 +946,53 @@ class GestorConexionRemota:
             logger.error(f"❌ Error verificando directorio remoto {remote_path}: {e}")
             return False
     
-    def crear_estructura_directorios_remota(self):
-        """Crear estructura completa de directorios en el servidor remoto"""
+    def _olvidar_directorios(self):
+        """Invalidar la caché de directorios después de un error al escribir en el servidor"""
+        if self.pool:
+            self.pool.olvidar_directorios()
+    
+    def crear_estructura_directorios_remota(self, forzar=False):
+        """Crear estructura completa de directorios en el servidor remoto.
+        
+        Se hace con un solo `mkdir -p` y una vez por proceso: en los reruns
+        siguientes no hay ninguna consulta al servidor, salvo que un error de
+        escritura haya invalidado la caché o se pida forzar.
+        """
+        if self.pool and self.pool.estructura_creada and not forzar:
+            return True
         try:
             if not self.conectar_ssh():
                 return False
             
             # Directorios a crear
-            directorios = [
-                self.uploads_path_remoto,
-                self.uploads_inscritos_remoto,
-                os.path.join(self.uploads_path_remoto, 'estudiantes'),
-                os.path.join(self.uploads_path_remoto, 'egresados'),
-                os.path.join(self.uploads_path_remoto, 'contratados')
-            ]
+            directorios = [self.uploads_inscritos_remoto, self.staging_path_remoto, self.blobs_path_remoto]
+            if self.uploads_path_remoto:
+                directorios += [
+                    self.uploads_path_remoto,
+                    os.path.join(self.uploads_path_remoto, 'estudiantes'),
+                    os.path.join(self.uploads_path_remoto, 'egresados'),
+                    os.path.join(self.uploads_path_remoto, 'contratados')
+                ]
+            directorios = [d.rstrip('/') for d in directorios if d]
             
-            for directorio in directorios:
-                if directorio:
-                    self._crear_directorio_remoto_recursivo(directorio)
+            stdin, stdout, stderr = self.ssh.exec_command(
+                "mkdir -p -- " + " ".join(shlex.quote(d) for d in directorios), timeout=self.timeouts['ssh_command']
+            )
+            if stdout.channel.recv_exit_status() != 0:
+                raise Exception(stderr.read().decode('utf-8', errors='ignore').strip() or "mkdir falló")
             
-            logger.info("✅ Estructura de directorios remota creada/verificada")
+            self.pool.directorios_conocidos(self.ssh).update(directorios)
+            self.pool.estructura_creada = True
+            logger.info(f"✅ Estructura de directorios remota creada/verificada ({len(directorios)} directorios)")
             return True
-            
+        
         except Exception as e:
             logger.error(f"❌ Error creando estructura de directorios remota: {e}")
             return False
         finally:
             if self.ssh:
                 self.desconectar_ssh()
-    
+
     def subir_archivo_remoto(self, archivo_local, ruta_remota):
         """Subir un archivo directamente al servidor remoto"""
         try:
@@ -743,45 +1011,287 @@ class GestorConexionRemota:
             
         except Exception as e:
             logger.error(f"❌ Error subiendo archivo a remoto: {e}")
+            self._olvidar_directorios()
             return False
         finally:
             if self.ssh:
                 self.desconectar_ssh()
     
-    def subir_buffer_remoto(self, buffer_archivo, nombre_archivo, ruta_remota):
-        """Subir un archivo desde buffer (Streamlit uploaded file) al servidor remoto"""
+    @staticmethod
+    def _escribir_buffer_remoto(sftp, contenido, ruta_remota):
+        """Escribir un buffer en ruta_remota sin pasar por disco local.
+        
+        Se recorre una vista de memoria en bloques del tamaño de una petición
+        SFTP con escrituras en pipeline; el tamaño y el sha256 salen de la
+        misma pasada. Si falla, no se deja un archivo remoto a medias.
+        """
+        vista = memoryview(contenido).cast('B')
+        huella = hashlib.sha256()
+        try:
+            with sftp.open(ruta_remota, 'wb') as remoto:
+                remoto.set_pipelined(True)
+                for inicio in range(0, vista.nbytes, BLOQUE_SFTP):
+                    bloque = vista[inicio:inicio + BLOQUE_SFTP]
+                    huella.update(bloque)
+                    # paramiko solo acepta bytes: se copia un bloque a la vez, nunca el archivo completo
+                    remoto.write(bytes(bloque))
+        except Exception:
+            try:
+                sftp.remove(ruta_remota)
+            except Exception:
+                pass
+            raise
+        return {'ruta': ruta_remota, 'tamano': vista.nbytes, 'sha256': huella.hexdigest()}
+    
+    def subir_buffer_remoto(self, buffer_archivo, ruta_remota):
+        """Subir un archivo desde buffer (Streamlit uploaded file) al servidor remoto.
+        
+        Regresa {'ruta', 'tamano', 'sha256'} o None si falló.
+        """
         try:
             if not self.conectar_ssh():
-                return False
+                return None
             
             # Crear directorio remoto si no existe
             remote_dir = os.path.dirname(ruta_remota)
             self._crear_directorio_remoto_recursivo(remote_dir)
             
-            # Guardar temporalmente el archivo
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, nombre_archivo)
-            
-            with open(temp_path, 'wb') as f:
-                f.write(buffer_archivo)
-            
-            # Subir archivo
-            self.sftp.put(temp_path, ruta_remota)
-            
-            # Eliminar temporal
-            os.remove(temp_path)
+            resumen = self._escribir_buffer_remoto(self.sftp, buffer_archivo, ruta_remota)
             
             logger.info(f"✅ Buffer subido a remoto: {ruta_remota}")
             estado_sistema.registrar_archivo_subido_remoto()
-            return True
+            return resumen
             
         except Exception as e:
             logger.error(f"❌ Error subiendo buffer a remoto: {e}")
-            return False
+            self._olvidar_directorios()
+            return None
         finally:
             if self.ssh:
                 self.desconectar_ssh()
     
+    def _subir_en_paralelo(self, archivos, progreso=None):
+        """Subir [(clave, contenido, ruta_remota, sha256_esperado)] por la conexión abierta.
+        
+        Los archivos se reparten entre varios canales SFTP del mismo
+        transporte, empezando por los más grandes, para que el lote tarde
+        cerca de lo que tarda el mayor. Cuando se indica sha256_esperado el
+        archivo se escribe en `{ruta}.part`, se compara el hash calculado al
+        transmitir y solo entonces se renombra a su ruta final. progreso(clave,
+        resultado) se llama desde el hilo que invoca al terminar cada archivo.
+        Regresa {clave: resultado} con 'ok', 'ruta', 'tamano', 'sha256' y, si
+        falló, 'error'.
+        """
+        canales_extra = []
+        try:
+            # Un canal SFTP por subida concurrente, todos sobre el mismo transporte
+            canales = queue.Queue()
+            canales.put(self.sftp)
+            for _ in range(min(self.canales_subida, len(archivos)) - 1):
+                try:
+                    canal = self.ssh.open_sftp()
+                    canal.get_channel().settimeout(self.timeouts['sftp_transfer'])
+                    canales_extra.append(canal)
+                    canales.put(canal)
+                except Exception as e:
+                    logger.warning(f"⚠️ Solo se abrieron {len(canales_extra) + 1} canales SFTP: {e}")
+                    break
+            
+            def subir(contenido, ruta_remota, esperado):
+                sftp = canales.get()
+                try:
+                    if not esperado:
+                        return {'ok': True, **self._escribir_buffer_remoto(sftp, contenido, ruta_remota)}
+                    
+                    resumen = self._escribir_buffer_remoto(sftp, contenido, f"{ruta_remota}.part")
+                    if resumen['sha256'] != esperado:
+                        sftp.remove(resumen['ruta'])
+                        return {'ok': False, 'ruta': ruta_remota, 'error': "El contenido transmitido no coincide con su sha256"}
+                    sftp.posix_rename(resumen['ruta'], ruta_remota)
+                    return {'ok': True, **resumen, 'ruta': ruta_remota}
+                except Exception as e:
+                    return {'ok': False, 'ruta': ruta_remota, 'error': str(e)}
+                finally:
+                    canales.put(sftp)
+            
+            resultados = {}
+            ordenados = sorted(archivos, key=lambda a: len(a[1]), reverse=True)
+            with ThreadPoolExecutor(max_workers=canales.qsize(), thread_name_prefix='subida_lote') as ejecutor:
+                futuros = {
+                    ejecutor.submit(subir, contenido, ruta_remota, esperado): clave
+                    for clave, contenido, ruta_remota, esperado in ordenados
+                }
+                for futuro in as_completed(futuros):
+                    clave = futuros[futuro]
+                    resultados[clave] = futuro.result()
+                    if resultados[clave]['ok']:
+                        estado_sistema.registrar_archivo_subido_remoto()
+                    else:
+                        logger.error(f"❌ Error subiendo {resultados[clave]['ruta']}: {resultados[clave]['error']}")
+                    if progreso:
+                        progreso(clave, resultados[clave])
+            
+            if not all(r['ok'] for r in resultados.values()):
+                self._olvidar_directorios()
+            logger.debug(f"Subida en paralelo por {len(canales_extra) + 1} canales")
+            return resultados
+        
+        finally:
+            for canal in canales_extra:
+                try:
+                    canal.close()
+                except Exception:
+                    pass
+    
+    def subir_lote_remoto(self, archivos, directorio_remoto, progreso=None):
+        """Subir varios archivos en paralelo por una sola conexión SSH.
+        
+        archivos es una lista de (nombre_archivo, contenido) con contenido
+        tipo bytes/buffer. El directorio se crea una sola vez.
+        progreso(nombre, resultado) se llama al terminar cada archivo.
+        Regresa {nombre: resultado} con 'ok', 'ruta', 'tamano', 'sha256' y,
+        si falló, 'error'; None si no hubo conexión.
+        """
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            if not self._crear_directorio_remoto_recursivo(directorio_remoto):
+                return {
+                    nombre: {'ok': False, 'error': f"No se pudo crear {directorio_remoto}"}
+                    for nombre, _ in archivos
+                }
+            
+            inicio = time.time()
+            resultados = self._subir_en_paralelo(
+                [(nombre, contenido, f"{directorio_remoto}/{nombre}", None) for nombre, contenido in archivos],
+                progreso
+            )
+            
+            subidos = [r for r in resultados.values() if r['ok']]
+            logger.info(
+                f"✅ Lote subido a {directorio_remoto}: {len(subidos)}/{len(archivos)} archivos, "
+                f"{sum(r['tamano'] for r in subidos) / 1024:.1f} KB en {time.time() - inicio:.1f}s"
+            )
+            return resultados
+        
+        except Exception as e:
+            logger.error(f"❌ Error subiendo lote a remoto: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def ruta_blob(self, huella):
+        """Ruta en el almacén por contenido: {blobs}/ab/abcdef..."""
+        return f"{self.blobs_path_remoto}/{huella[:2]}/{huella}"
+    
+    def almacenar_documentos_remotos(self, documentos, directorio_remoto, progreso=None):
+        """Guardar documentos en el almacén por contenido y enlazarlos en directorio_remoto.
+        
+        documentos es una lista de (nombre_archivo, contenido, sha256,
+        ruta_staging o None). Cada contenido se guarda una sola vez en
+        `{blobs}/ab/{sha256}`: si el blob ya existe (un stat) no se sube otra
+        vez, si ya está en staging solo se mueve, y el resto se sube en
+        paralelo verificando el hash calculado al transmitir. En la carpeta
+        de la matrícula queda un enlace duro con el nombre legible, así que no
+        ocupa espacio extra (si el enlace no es posible se copia).
+        progreso(nombre, resultado) se llama al tener el contenido de cada
+        documento en el servidor. Regresa {nombre: resultado} con 'ok', 'ruta',
+        'tamano', 'sha256', 'reutilizado' y, si falló, 'error'; None si no hubo
+        conexión.
+        """
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            if not self._crear_directorio_remoto_recursivo(directorio_remoto):
+                return {
+                    nombre: {'ok': False, 'error': f"No se pudo crear {directorio_remoto}"}
+                    for nombre, _, _, _ in documentos
+                }
+            
+            inicio = time.time()
+            por_huella, blobs, pendientes, reutilizados = {}, {}, [], set()
+            for nombre, contenido, huella, ruta_staging in documentos:
+                por_huella.setdefault(huella, {'nombres': [], 'contenido': contenido, 'staging': None})
+                por_huella[huella]['nombres'].append(nombre)
+                por_huella[huella]['staging'] = por_huella[huella]['staging'] or ruta_staging
+            
+            def avisar(huella, resultado):
+                for nombre in por_huella[huella]['nombres']:
+                    blobs[nombre] = resultado
+                    if progreso:
+                        progreso(nombre, resultado)
+            
+            for huella, datos in por_huella.items():
+                ruta = self.ruta_blob(huella)
+                tamano = memoryview(datos['contenido']).nbytes
+                try:
+                    # Comprobación barata: el nombre del blob es su hash
+                    self.sftp.stat(ruta)
+                    reutilizados.add(huella)
+                    if datos['staging'] and datos['staging'] != ruta:
+                        self.sftp.remove(datos['staging'])
+                    avisar(huella, {'ok': True, 'ruta': ruta, 'tamano': tamano, 'sha256': huella})
+                    continue
+                except FileNotFoundError:
+                    pass
+                
+                if not self._crear_directorio_remoto_recursivo(os.path.dirname(ruta)):
+                    avisar(huella, {'ok': False, 'ruta': ruta, 'error': f"No se pudo crear {os.path.dirname(ruta)}"})
+                    continue
+                if datos['staging']:
+                    try:
+                        self.sftp.posix_rename(datos['staging'], ruta)
+                        estado_sistema.registrar_archivo_subido_remoto()
+                        avisar(huella, {'ok': True, 'ruta': ruta, 'tamano': tamano, 'sha256': huella})
+                        continue
+                    except Exception as e:
+                        logger.warning(f"⚠️ No se pudo mover {datos['staging']} al almacén, se sube de nuevo: {e}")
+                pendientes.append((huella, datos['contenido'], ruta, huella))
+            
+            if pendientes:
+                self._subir_en_paralelo(pendientes, avisar)
+            
+            # Enlaces con nombre legible en la carpeta de la matrícula, en un solo comando
+            resultados, enlaces = {}, []
+            for nombre, _, huella, _ in documentos:
+                if not blobs[nombre]['ok']:
+                    resultados[nombre] = blobs[nombre]
+                    continue
+                blob, destino = shlex.quote(self.ruta_blob(huella)), shlex.quote(f"{directorio_remoto}/{nombre}")
+                enlaces.append((nombre, huella, f"{{ ln -f -- {blob} {destino} || cp -f -- {blob} {destino}; }} || echo {len(enlaces)}"))
+            
+            if enlaces:
+                stdin, stdout, stderr = self.ssh.exec_command(
+                    "; ".join(comando for _, _, comando in enlaces), timeout=self.timeouts['ssh_command']
+                )
+                fallidos = set(stdout.read().decode('utf-8', errors='ignore').split())
+                error = stderr.read().decode('utf-8', errors='ignore').strip()
+                for indice, (nombre, huella, _) in enumerate(enlaces):
+                    if str(indice) in fallidos:
+                        self._olvidar_directorios()
+                        resultados[nombre] = {'ok': False, 'ruta': f"{directorio_remoto}/{nombre}", 'error': error or "No se pudo enlazar"}
+                    else:
+                        resultados[nombre] = {**blobs[nombre], 'ruta': f"{directorio_remoto}/{nombre}", 'reutilizado': huella in reutilizados}
+            
+            guardados = [r for r in resultados.values() if r['ok']]
+            logger.info(
+                f"✅ {len(guardados)}/{len(documentos)} documentos en {directorio_remoto}: "
+                f"{len(reutilizados)} ya estaban en el almacén, {len(pendientes)} subidos "
+                f"({sum(memoryview(p[1]).nbytes for p in pendientes) / 1024:.1f} KB) en {time.time() - inicio:.1f}s"
+            )
+            return resultados
+        
+        except Exception as e:
+            logger.error(f"❌ Error almacenando documentos remotos: {e}")
+            self._olvidar_directorios()
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+
     def descargar_db_remota(self):
         inicio_tiempo = time.time()
         
@@ -799,8 +1309,11 @@ class GestorConexionRemota:
                     else:
                         raise Exception("No se pudo conectar SSH después de múltiples intentos")
                 
+                if not self.db_path_remoto:
+                    raise Exception("No se configuró la ruta de la base de datos remota")
+                
                 temp_dir = tempfile.gettempdir()
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
                 temp_db_path = os.path.join(temp_dir, f"aspirantes_temp_{timestamp}.db")
                 self.temp_files.append(temp_db_path)
                 
@@ -808,13 +1321,17 @@ class GestorConexionRemota:
                 if not espacio_ok:
                     raise Exception(f"Espacio en disco insuficiente: {espacio_mb:.1f} MB disponibles")
                 
-                if not self.db_path_remoto:
-                    raise Exception("No se configuró la ruta de la base de datos remota")
+                # Sin cambios en el servidor: la copia de esta sesión sale del espejo
+                # local sin tocar la red. Cada llamada regresa un archivo propio.
+                firma_remota = self._firma_remota()
+                if self._copiar_espejo_vigente(firma_remota, temp_db_path):
+                    logger.info(f"✅ Base de datos remota sin cambios, copia local desde el espejo: {temp_db_path}")
+                    return temp_db_path
                 
                 logger.info(f"📥 Descargando base de datos desde: {self.db_path_remoto}")
                 
                 start_time = time.time()
-                self.sftp.get(self.db_path_remoto, temp_db_path)
+                self._descargar_db_delta(temp_db_path, firma_remota)
                 download_time = time.time() - start_time
                 
                 if os.path.exists(temp_db_path) and os.path.getsize(temp_db_path) > 0:
@@ -835,6 +1352,7 @@ class GestorConexionRemota:
                     
             except socket.timeout:
                 logger.error(f"❌ Timeout en intento {attempt + 1}")
+                self._descartar_conexion()
                 if attempt < self.retry_attempts - 1:
                     wait_time = self._intento_conexion_con_backoff(attempt)
                     logger.info(f"⏳ Esperando {wait_time:.1f} segundos antes de reintentar...")
@@ -859,6 +1377,137 @@ class GestorConexionRemota:
         
         return None
     
+    def _ruta_espejo(self):
+        """Copia local persistente de la base remota que sirve de base para los deltas"""
+        sufijo = hashlib.md5(f"{self.config.get('host')}:{self.db_path_remoto}".encode()).hexdigest()[:12]
+        return os.path.join(tempfile.gettempdir(), f"aspirantes_espejo_{sufijo}.db")
+    
+    def _firma_remota(self):
+        """Firma barata de la base remota: tamaño, mtime y contador de cambios del encabezado"""
+        info = self.sftp.stat(self.db_path_remoto)
+        with self.sftp.open(self.db_path_remoto, 'rb') as archivo:
+            archivo.seek(24)
+            contador = archivo.read(4).hex()
+        return [info.st_size, int(info.st_mtime), contador]
+    
+    @staticmethod
+    def _firma_local(ruta):
+        info = os.stat(ruta)
+        return [info.st_size, info.st_mtime_ns]
+    
+    def _leer_estado_espejo(self):
+        try:
+            with open(f"{self._ruta_espejo()}.json", 'r', encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return {}
+    
+    def _copiar_espejo_vigente(self, firma_remota, destino):
+        """Copiar el espejo a destino si refleja la firma remota; False si hay que descargar.
+        
+        Las copias de trabajo no se comparten: cada sesión edita la suya y
+        el espejo solo cambia bajo su candado al descargar o subir.
+        """
+        espejo = self._ruta_espejo()
+        with TransferenciaDeltaSQLite.candado_espejo(espejo):
+            estado = self._leer_estado_espejo()
+            if estado.get('firma_remota') != firma_remota or not os.path.exists(espejo):
+                return False
+            if self._firma_local(espejo) != estado.get('firma_espejo'):
+                return False
+            try:
+                TransferenciaDeltaSQLite.copiar_verificada(espejo, destino, estado.get('sha256'))
+                return True
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Espejo local descartado: {e}")
+                return False
+    
+    def _registrar_espejo(self, firma_remota, sha256):
+        """Guardar la firma remota que refleja el espejo; se llama con su candado tomado"""
+        try:
+            estado = {
+                'firma_remota': firma_remota,
+                'sha256': sha256,
+                'firma_espejo': self._firma_local(self._ruta_espejo())
+            }
+            with open(f"{self._ruta_espejo()}.json", 'w', encoding='utf-8') as archivo:
+                json.dump(estado, archivo)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo registrar el estado del espejo: {e}")
+    
+    def _descargar_db_delta(self, destino, firma_remota):
+        """Traer solo las páginas que cambiaron al espejo local y copiarlo a destino.
+        
+        Parche y copia ocurren bajo el candado del espejo, que comparten las
+        sesiones del proceso, y lo que se compara con el SHA-256 del servidor
+        es la copia entregada. Si el servidor no puede ejecutar el protocolo
+        por bloques se descarga el archivo completo con SFTP, que también
+        deja listo el espejo. La firma tomada antes de la descarga es a lo
+        sumo más vieja que el contenido: en el peor caso la siguiente vista
+        repite un delta vacío.
+        """
+        espejo = self._ruta_espejo()
+        with TransferenciaDeltaSQLite.candado_espejo(espejo):
+            if not os.path.exists(espejo):
+                # Sin espejo el delta mandaría todas las páginas sin comprimir
+                self._descargar_completo(self.db_path_remoto, espejo)
+                sha256 = TransferenciaDeltaSQLite.copiar_verificada(espejo, destino)
+            else:
+                try:
+                    resumen = TransferenciaDeltaSQLite(self.ssh, self.timeouts['sftp_transfer']).descargar(
+                        self.db_path_remoto, espejo
+                    )
+                    logger.info(
+                        f"📦 Delta de descarga: {resumen['bloques_transferidos']}/{resumen['bloques_total']} páginas "
+                        f"({resumen['bytes_transferidos'] / 1024:.1f} KB de {resumen['tamano'] / 1024:.1f} KB)"
+                    )
+                    sha256 = TransferenciaDeltaSQLite.copiar_verificada(espejo, destino, resumen['sha256'])
+                except Exception as e:
+                    logger.warning(f"⚠️ Delta de descarga no disponible, descargando completo: {e}")
+                    self._descargar_completo(self.db_path_remoto, destino)
+                    sha256 = TransferenciaDeltaSQLite.copiar_verificada(destino, espejo)
+            self._registrar_espejo(firma_remota, sha256)
+    
+    def _descargar_completo(self, ruta_remota, destino):
+        """Descargar el archivo completo, comprimido en el servidor si el enlace lo amerita"""
+        transferencia = TransferenciaComprimida(self.ssh, self.timeouts['sftp_transfer'])
+        if transferencia.nivel():
+            try:
+                resumen = transferencia.descargar(ruta_remota, destino)
+                logger.info(
+                    f"🗜️ Descarga comprimida (gzip -{resumen['nivel']}): {resumen['bytes_transferidos'] / 1024:.1f} KB "
+                    f"de {resumen['tamano'] / 1024:.1f} KB en {resumen['segundos']:.1f}s"
+                )
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Descarga comprimida no disponible, usando SFTP: {e}")
+        
+        inicio = time.time()
+        self.sftp.get(ruta_remota, destino)
+        TransferenciaComprimida.registrar_ancho_banda(
+            transferencia.servidor, os.path.getsize(destino), time.time() - inicio
+        )
+    
+    def _subir_completo(self, ruta_local, ruta_remota):
+        """Subir el archivo completo, comprimido si el enlace lo amerita"""
+        transferencia = TransferenciaComprimida(self.ssh, self.timeouts['sftp_transfer'])
+        if transferencia.nivel():
+            try:
+                resumen = transferencia.subir(ruta_local, ruta_remota)
+                logger.info(
+                    f"🗜️ Subida comprimida (gzip -{resumen['nivel']}): {resumen['bytes_transferidos'] / 1024:.1f} KB "
+                    f"de {resumen['tamano'] / 1024:.1f} KB en {resumen['segundos']:.1f}s"
+                )
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Subida comprimida no disponible, usando SFTP: {e}")
+        
+        inicio = time.time()
+        self.sftp.put(ruta_local, ruta_remota)
+        TransferenciaComprimida.registrar_ancho_banda(
+            transferencia.servidor, os.path.getsize(ruta_local), time.time() - inicio
+        )
+    
     def _verificar_integridad_db(self, db_path):
         try:
             conn = sqlite3.connect(db_path)
@@ -1014,6 +1663,8 @@ class GestorConexionRemota:
                     ruta_archivo TEXT NOT NULL,
                     fecha_subida TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     tamano_bytes INTEGER,
+                    tamano_original_bytes INTEGER,
+                    sha256 TEXT,
                     tipo_archivo TEXT,
                     verificado INTEGER DEFAULT 0,
                     observaciones TEXT,
@@ -1073,6 +1724,7 @@ class GestorConexionRemota:
                 logger.warning(f"⚠️ Error insertando admin: {e}")
             
             conn.commit()
+            MigradorEsquema.para_conexion(conn, 'aspirantes').aplicar()
             conn.close()
             logger.info(f"✅ Estructura de base de datos COMPLETA inicializada en {db_path}")
             
@@ -1093,19 +1745,39 @@ class GestorConexionRemota:
                 logger.error("No se configuró la ruta de la base de datos remota")
                 return False
             
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            backup_path = f"{self.db_path_remoto}.backup_{timestamp}"
+            start_time = time.time()
+            
             try:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_path = f"{self.db_path_remoto}.backup_{timestamp}"
-                self.sftp.rename(self.db_path_remoto, backup_path)
+                # El servidor conserva el respaldo y reemplaza la base con un rename atómico
+                resumen = TransferenciaDeltaSQLite(self.ssh, self.timeouts['sftp_transfer']).subir(
+                    ruta_local, self.db_path_remoto, backup_path
+                )
                 logger.info(f"✅ Backup creado en servidor: {backup_path}")
                 estado_sistema.registrar_backup()
+                logger.info(
+                    f"📦 Delta de subida: {resumen['bloques_transferidos']}/{resumen['bloques_total']} páginas "
+                    f"({resumen['bytes_transferidos'] / 1024:.1f} KB de {resumen['tamano'] / 1024:.1f} KB)"
+                )
             except Exception as e:
-                logger.warning(f"⚠️ No se pudo crear backup en servidor: {e}")
+                logger.warning(f"⚠️ Delta de subida no disponible, subiendo completo: {e}")
+                try:
+                    self.sftp.rename(self.db_path_remoto, backup_path)
+                    logger.info(f"✅ Backup creado en servidor: {backup_path}")
+                    estado_sistema.registrar_backup()
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo crear backup en servidor: {e}")
+                
+                self._subir_completo(ruta_local, self.db_path_remoto)
             
-            start_time = time.time()
-            self.sftp.put(ruta_local, self.db_path_remoto)
             upload_time = time.time() - start_time
             
+            # Lo subido es ahora la versión remota: base del siguiente delta
+            with TransferenciaDeltaSQLite.candado_espejo(self._ruta_espejo()):
+                sha256 = TransferenciaDeltaSQLite.copiar_verificada(ruta_local, self._ruta_espejo())
+                self._registrar_espejo(self._firma_remota(), sha256)
+            
             logger.info(f"✅ Base de datos subida a servidor: {self.db_path_remoto} ({upload_time:.1f}s)")
             
             return True
@@ -1120,21 +1792,496 @@ class GestorConexionRemota:
             if self.ssh:
                 self.desconectar_ssh()
     
+    def aplicar_cambios_remotos(self, diario):
+        """Aplicar el changeset del diario en la base remota.
+        
+        None si el servidor no lo recibió o lo rechazó sin aplicarlo, y
+        {'ok': None, 'desconocido': True} si se envió y la respuesta se perdió.
+        """
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            start_time = time.time()
+            resultado = diario.aplicar_remoto(self.ssh, self.db_path_remoto, self.timeouts['sftp_transfer'])
+            if resultado.get('ok'):
+                logger.info(
+                    f"✅ Changeset aplicado en servidor: {resultado['aplicados']} cambios, "
+                    f"{resultado['reasignados']} ids reasignados ({time.time() - start_time:.1f}s)"
+                )
+            elif resultado.get('desconocido'):
+                logger.warning(f"⚠️ Sin respuesta del servidor al aplicar el changeset: {resultado['error']}")
+            return resultado
+            
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo aplicar el changeset en el servidor: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def _sentencias_remotas(self):
+        return SentenciasRemotas(self.ssh, self.db_path_remoto, self.timeouts['sftp_transfer'])
+    
+    def aplicar_migraciones_remotas(self):
+        """Aplicar las migraciones de esquema pendientes directamente en la base remota (None si falla)"""
+        try:
+            if not self.conectar_ssh():
+                return None
+            return self._sentencias_remotas().migrador('aspirantes').aplicar()
+        except Exception as e:
+            logger.error(f"❌ Error aplicando migraciones en el servidor: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def inicializar_db_remota(self, ruta_local):
+        """Crear en la base remota vacía la estructura de una copia local recién inicializada.
+        
+        True si se creó, False si otra sesión ya la había inicializado y None
+        si el servidor no la aplicó.
+        """
+        conn = None
+        try:
+            if not self.conectar_ssh():
+                return None
+            conn = sqlite3.connect(ruta_local)
+            creada = self._sentencias_remotas().inicializar(conn)
+            logger.info(f"✅ Estructura inicial creada en servidor: {self.db_path_remoto}" if creada
+                        else "⚠️ La base remota ya fue inicializada por otra sesión")
+            return creada
+        except Exception as e:
+            logger.error(f"❌ Error inicializando la base remota: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def _ruta_cola(self):
+        """Directorio remoto de la cola de registros (por defecto junto a la base)"""
+        return self.config.get('remote_cola_registros') or f"{os.path.dirname(self.db_path_remoto)}/cola_registros"
+    
+    def encolar_cambios(self, diario):
+        """Dejar el changeset en la cola remota y fusionarlo.
+        
+        Regresa None solo si el registro no llegó a la cola, y entonces el
+        llamador puede usar otra vía. Ya encolado, aplicarlo por otra vía lo
+        duplicaría: si la fusión falla o no responde el resultado es
+        {'ok': None, 'pendiente': True, 'registro': nombre}.
+        """
+        nombre = None
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            start_time = time.time()
+            ruta_cola = self._ruta_cola()
+            if not self._crear_directorio_remoto_recursivo(ruta_cola):
+                return None
+            
+            cola = ColaRegistrosRemota(self.ssh, self.sftp, ruta_cola, self.timeouts['sftp_transfer'])
+            nombre = cola.encolar(diario.paquete())
+            logger.info(f"📨 Registro encolado en servidor: {nombre}")
+            
+            resultado = cola.fusionar_o_pendiente(self.db_path_remoto, nombre)
+            if resultado.get('ok'):
+                logger.info(
+                    f"✅ Registro fusionado: {resultado['aplicados']} cambios, "
+                    f"{resultado['reasignados']} ids reasignados ({time.time() - start_time:.1f}s)"
+                )
+            elif resultado.get('pendiente'):
+                logger.warning(f"⚠️ Registro {nombre} en cola sin confirmar: lo aplicará la siguiente fusión")
+            return resultado
+        
+        except Exception as e:
+            if nombre:
+                logger.warning(f"⚠️ Registro {nombre} en cola sin confirmar: {e}")
+                return {'ok': None, 'pendiente': True, 'registro': nombre}
+            logger.warning(f"⚠️ Cola de registros no disponible: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def consultar_registro(self, nombre):
+        """Estado de un registro encolado: corre el fusionador y lee su resultado.
+        
+        {'ok': True|False, ...} si ya se aplicó o se rechazó, y
+        {'ok': None, 'pendiente': True} mientras siga en la cola o el
+        servidor no responda.
+        """
+        try:
+            if not self.conectar_ssh():
+                return {'ok': None, 'pendiente': True, 'registro': nombre}
+            cola = ColaRegistrosRemota(self.ssh, self.sftp, self._ruta_cola(), self.timeouts['sftp_transfer'])
+            return cola.fusionar_o_pendiente(self.db_path_remoto, nombre)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo consultar el registro {nombre}: {e}")
+            return {'ok': None, 'pendiente': True, 'registro': nombre}
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def _ruta_respaldos(self):
+        """Directorio remoto del repositorio de respaldos (por defecto junto a la base)"""
+        return self.config.get('remote_backup_path') or f"{os.path.dirname(self.db_path_remoto)}/backups"
+    
+    def _repositorio_respaldos(self):
+        return RepositorioRespaldos(self.ssh, self._ruta_respaldos(), self.timeouts['db_download'])
+    
+    def crear_respaldo_remoto(self, etiqueta):
+        """Guardar una instantánea deduplicada en el repositorio remoto y aplicar la retención.
+        
+        Regresa el resumen de la instantánea con el resultado de la poda en
+        'poda', o None si el repositorio no está disponible.
+        """
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            repositorio = self._repositorio_respaldos()
+            info = repositorio.guardar(self.db_path_remoto, etiqueta)
+            logger.info(
+                f"✅ Instantánea {info['id']} guardada: {info['bloques_nuevos']}/{info['total_bloques']} bloques nuevos, "
+                f"{info['bytes_nuevos'] / 1024:.1f} KB escritos de {info['tamano'] / 1024:.1f} KB ({info['segundos']:.1f}s)"
+            )
+            estado_sistema.registrar_backup()
+            
+            try:
+                info['poda'] = repositorio.podar(**self.retencion_respaldos)
+                if info['poda']['eliminadas']:
+                    logger.info(
+                        f"🗑️ Retención: {len(info['poda']['eliminadas'])} instantáneas eliminadas, "
+                        f"{info['poda']['bytes_liberados'] / 1024:.1f} KB liberados"
+                    )
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo aplicar la retención de respaldos: {e}")
+            return info
+            
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar la instantánea remota: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
+    def restaurar_respaldo_remoto(self, instantanea, ruta_local):
+        """Reconstruir una instantánea en el servidor y traerla a ruta_local"""
+        ruta_remota = f"{self._ruta_respaldos()}/restauraciones/{instantanea}.db"
+        try:
+            if not self.conectar_ssh():
+                return False
+            
+            info = self._repositorio_respaldos().restaurar(instantanea, ruta_remota)
+            logger.info(f"♻️ Instantánea {instantanea} reconstruida en {info['segundos']:.1f}s")
+            self._descargar_completo(ruta_remota, ruta_local)
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error restaurando la instantánea {instantanea}: {e}")
+            return False
+        finally:
+            if self.ssh:
+                try:
+                    self.sftp.remove(ruta_remota)
+                except Exception:
+                    pass
+                self.desconectar_ssh()
+    
+    def verificar_respaldos_remotos(self, *instantaneas):
+        """Comprobar la integridad del repositorio de respaldos (None si no responde)"""
+        try:
+            if not self.conectar_ssh():
+                return None
+            
+            resultado = self._repositorio_respaldos().verificar(*instantaneas)
+            if resultado['ok']:
+                logger.info(f"✅ Repositorio de respaldos íntegro ({resultado['objetos_verificados']} bloques verificados)")
+            else:
+                danadas = [i for i, r in resultado['instantaneas'].items() if not r['ok']]
+                logger.error(f"❌ Instantáneas con bloques faltantes o dañados: {', '.join(danadas)}")
+            return resultado
+            
+        except Exception as e:
+            logger.error(f"❌ Error verificando el repositorio de respaldos: {e}")
+            return None
+        finally:
+            if self.ssh:
+                self.desconectar_ssh()
+    
     def verificar_conexion_ssh(self):
         return self.probar_conexion_inicial()
 
-gestor_remoto = GestorConexionRemota()
+@st.cache_resource(show_spinner=False)
+def obtener_gestor_remoto():
+    """Gestor único por proceso; la prueba de conexión corre en segundo plano.
+    
+    El primer render no espera al servidor SSH, y si el servidor responde,
+    la primera operación real ya encuentra la conexión abierta en el pool.
+    """
+    gestor = GestorConexionRemota()
+    if gestor.auto_connect and gestor.config.get('host'):
+        threading.Thread(target=gestor.probar_conexion_inicial, name='prueba_ssh', daemon=True).start()
+    return gestor
+
+gestor_remoto = obtener_gestor_remoto()
 
 # ============================================================================
 # CAPA 6: SISTEMA DE GESTIÓN DE ARCHIVOS REMOTOS
 # ============================================================================
 
+class PreSubidaDocumentos:
+    """Subida en segundo plano de los documentos a un área de staging remota.
+    
+    En cuanto el aspirante elige un archivo se sube a `{staging}/{sha256}`
+    desde un hilo de fondo, así el tiempo de transferencia corre mientras
+    llena el resto del formulario. Al enviar, los documentos ya preparados
+    solo se mueven (rename en el mismo sistema de archivos) al almacén por
+    contenido; si el almacén ya tiene ese sha256 ni siquiera se suben. La
+    subida escribe primero en `{sha256}.part`: si se corta, el siguiente
+    intento continúa desde el tamaño que ya está en el servidor y el
+    resultado se comprueba con sha256sum antes de publicarlo. Un mismo
+    contenido se sube una sola vez por proceso y los archivos que nadie
+    reclamó se borran pasadas `horas_retencion` horas.
+    """
+    
+    INTERVALO_RECOLECCION = 3600
+    
+    def __init__(self, pool, ruta_staging, trabajadores=2, horas_retencion=24, timeout=300, ruta_blobs=''):
+        self.pool = pool
+        self.ruta_staging = ruta_staging
+        self.ruta_blobs = ruta_blobs
+        self.horas_retencion = horas_retencion
+        self.timeout = timeout
+        self.ejecutor = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='presubida')
+        self._tareas = {}
+        self._enviados = {}
+        self._candado = threading.Lock()
+        self._directorio_listo = False
+        self._ultima_recoleccion = 0
+    
+    def ruta(self, huella):
+        return f"{self.ruta_staging}/{huella}"
+    
+    def programar(self, contenido, huella):
+        """Encolar la subida de contenido (bytes/buffer) si no está hecha o en curso"""
+        with self._candado:
+            tarea = self._tareas.get(huella)
+            if tarea is None or (tarea.done() and tarea.exception() is not None):
+                if tarea is not None:
+                    self._directorio_listo = False
+                self._enviados[huella] = 0
+                self._tareas[huella] = self.ejecutor.submit(self._subir, contenido, huella)
+    
+    def estado(self, huella, tamano):
+        """('listo' | 'subiendo' | 'error' | None, fracción enviada)"""
+        tarea = self._tareas.get(huella)
+        if tarea is None:
+            return None, 0.0
+        if not tarea.done():
+            return 'subiendo', self._enviados.get(huella, 0) / tamano if tamano else 0.0
+        return ('listo', 1.0) if tarea.exception() is None else ('error', 0.0)
+    
+    def esperar(self, huella, timeout=None):
+        """Ruta del contenido ya subido (en staging o en el almacén), o None si no se programó o falló"""
+        tarea = self._tareas.get(huella)
+        if tarea is None:
+            return None
+        try:
+            return tarea.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Pre-subida {huella[:12]} no disponible: {e}")
+            return None
+    
+    def olvidar(self, huella):
+        """El contenido ya se movió fuera de staging"""
+        with self._candado:
+            self._tareas.pop(huella, None)
+            self._enviados.pop(huella, None)
+    
+    def _ejecutar(self, ssh, comando):
+        stdin, stdout, stderr = ssh.exec_command(comando, timeout=self.timeout)
+        salida = stdout.read().decode('utf-8', errors='ignore')
+        if stdout.channel.recv_exit_status() != 0:
+            raise Exception(stderr.read().decode('utf-8', errors='ignore').strip() or f"Falló: {comando}")
+        return salida
+    
+    def _subir(self, contenido, huella):
+        vista = memoryview(contenido).cast('B')
+        destino = self.ruta(huella)
+        parcial = f"{destino}.part"
+        inicio_tiempo = time.time()
+        
+        with self.pool.conexion() as ssh:
+            sftp = self.pool.obtener_sftp(ssh)
+            if not self._directorio_listo:
+                self._ejecutar(ssh, f"mkdir -p -- {shlex.quote(self.ruta_staging)}")
+                self._directorio_listo = True
+            
+            # Ya guardado antes por este u otro aspirante (o ya en staging): no se sube
+            for existente in ([f"{self.ruta_blobs}/{huella[:2]}/{huella}"] if self.ruta_blobs else []) + [destino]:
+                try:
+                    sftp.stat(existente)
+                    self._enviados[huella] = vista.nbytes
+                    return existente
+                except FileNotFoundError:
+                    pass
+            
+            # Reanudar una subida cortada del mismo contenido
+            try:
+                inicio = sftp.stat(parcial).st_size
+            except FileNotFoundError:
+                inicio = 0
+            if inicio > vista.nbytes:
+                inicio = 0
+            
+            with sftp.open(parcial, 'ab' if inicio else 'wb') as remoto:
+                remoto.set_pipelined(True)
+                for posicion in range(inicio, vista.nbytes, BLOQUE_SFTP):
+                    bloque = vista[posicion:posicion + BLOQUE_SFTP]
+                    remoto.write(bytes(bloque))
+                    self._enviados[huella] = posicion + len(bloque)
+            
+            salida = self._ejecutar(ssh, f"sha256sum -- {shlex.quote(parcial)}")
+            if salida.split()[0] != huella:
+                sftp.remove(parcial)
+                raise Exception("El contenido en staging no coincide con su sha256")
+            sftp.posix_rename(parcial, destino)
+            
+            logger.info(
+                f"☁️ Pre-subida {huella[:12]}: {(vista.nbytes - inicio) / 1024:.1f} KB "
+                f"{'(reanudada) ' if inicio else ''}en {time.time() - inicio_tiempo:.1f}s"
+            )
+            self._recolectar(ssh)
+        return destino
+    
+    def _recolectar(self, ssh):
+        """Borrar lo que quedó en staging de envíos abandonados (como mucho una vez por hora)"""
+        if time.time() - self._ultima_recoleccion < self.INTERVALO_RECOLECCION:
+            return
+        self._ultima_recoleccion = time.time()
+        try:
+            self._ejecutar(
+                ssh,
+                f"find {shlex.quote(self.ruta_staging)} -maxdepth 1 -type f "
+                f"-mmin +{int(self.horas_retencion * 60)} -delete"
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo limpiar staging: {e}")
+
+@st.cache_resource(show_spinner=False)
+def obtener_presubida_documentos(_pool, ruta_staging, horas_retencion=24, ruta_blobs=''):
+    """Pre-subida única por proceso: las tareas de fondo sobreviven a reruns y sesiones"""
+    return PreSubidaDocumentos(_pool, ruta_staging, horas_retencion=horas_retencion, ruta_blobs=ruta_blobs)
+
+class OptimizadorDocumentos:
+    """Normalización de las imágenes de documentos antes de guardarlas.
+    
+    Las fotos de un celular llegan a varios MB con una resolución que no hace
+    falta para revisar un acta o un certificado. Cada imagen (jpg/png) se
+    endereza según su EXIF, se reduce a `lado_maximo` píxeles por lado y se
+    vuelve a codificar: JPEG progresivo con `calidad`, o PNG si tiene
+    transparencia. Al recodificar se descartan los metadatos (EXIF, GPS). Si
+    el resultado no es más chico se conserva el original, y sin Pillow los
+    archivos pasan tal cual. El trabajo corre en un pool de hilos propio y de
+    paso calcula el sha256 del contenido final, así la página no se bloquea.
+    Lo que no se recodifica (PDF, Word, imágenes que no se achican) no se
+    copia: el resultado apunta al mismo buffer del archivo subido.
+    """
+    
+    EXTENSIONES_IMAGEN = ('jpg', 'jpeg', 'png')
+    
+    def __init__(self, lado_maximo=2000, calidad=85, trabajadores=2, activo=True):
+        self.lado_maximo = lado_maximo
+        self.calidad = calidad
+        self.activo = activo and HAS_PIL
+        self.ejecutor = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='optimizador')
+    
+    @staticmethod
+    def original(contenido, extension):
+        """Resultado para un contenido (bytes o buffer) que se guarda sin cambios ni copias"""
+        tamano = memoryview(contenido).nbytes
+        return {
+            'contenido': contenido,
+            'extension': extension,
+            'tamano_original': tamano,
+            'tamano': tamano,
+            'sha256': hashlib.sha256(contenido).hexdigest(),
+            'optimizado': False
+        }
+    
+    def programar(self, contenido, extension, al_terminar=None):
+        """Optimizar en segundo plano; al_terminar(resultado) corre en el hilo de trabajo"""
+        def tarea():
+            resultado = self.optimizar(contenido, extension)
+            if al_terminar:
+                try:
+                    al_terminar(resultado)
+                except Exception as e:
+                    logger.warning(f"⚠️ Error después de optimizar: {e}")
+            return resultado
+        return self.ejecutor.submit(tarea)
+    
+    def optimizar(self, contenido, extension):
+        """Regresa {'contenido', 'extension', 'tamano_original', 'tamano', 'sha256', 'optimizado'}"""
+        if not self.activo or extension.lower() not in self.EXTENSIONES_IMAGEN:
+            return self.original(contenido, extension)
+        
+        try:
+            inicio = time.time()
+            tamano = memoryview(contenido).nbytes
+            with Image.open(io.BytesIO(contenido)) as imagen:
+                imagen = ImageOps.exif_transpose(imagen)
+                imagen.thumbnail((self.lado_maximo, self.lado_maximo), Image.LANCZOS)
+                salida = io.BytesIO()
+                if imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info):
+                    imagen.save(salida, format='PNG', optimize=True)
+                    extension_nueva = 'png'
+                else:
+                    imagen.convert('RGB').save(
+                        salida, format='JPEG', quality=self.calidad, optimize=True, progressive=True
+                    )
+                    extension_nueva = extension if extension.lower() in ('jpg', 'jpeg') else 'jpg'
+            
+            optimizada = salida.getvalue()
+            if len(optimizada) >= tamano:
+                return self.original(contenido, extension)
+            
+            logger.info(
+                f"🗜️ Imagen optimizada: {tamano / 1024:.1f} KB -> {len(optimizada) / 1024:.1f} KB "
+                f"({imagen.width}x{imagen.height}) en {time.time() - inicio:.2f}s"
+            )
+            resultado = self.original(optimizada, extension_nueva)
+            resultado['tamano_original'] = tamano
+            resultado['optimizado'] = True
+            return resultado
+        
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo optimizar la imagen, se guarda el original: {e}")
+            return self.original(contenido, extension)
+
+@st.cache_resource(show_spinner=False)
+def obtener_optimizador_documentos(lado_maximo=2000, calidad=85, activo=True):
+    """Optimizador único por proceso: su pool de hilos se comparte entre sesiones"""
+    return OptimizadorDocumentos(lado_maximo, calidad, activo=activo)
+
 class SistemaGestionArchivosRemotos:
     """Sistema para gestionar la subida y almacenamiento de documentos directamente en el servidor remoto"""
     
     def __init__(self):
         self.gestor = gestor_remoto
-        self.crear_estructura_directorios()
+        self.optimizador = obtener_optimizador_documentos(
+            self.gestor.lado_maximo_imagen, self.gestor.calidad_imagen, self.gestor.optimizar_documentos
+        )
+        self.presubida = None
+        if self.gestor.pool and self.gestor.presubida_documentos and self.gestor.staging_path_remoto:
+            self.presubida = obtener_presubida_documentos(
+                self.gestor.pool, self.gestor.staging_path_remoto, self.gestor.horas_staging,
+                self.gestor.blobs_path_remoto
+            )
     
     def crear_estructura_directorios(self):
         """Crear estructura de directorios en el servidor remoto"""
@@ -1144,50 +2291,173 @@ class SistemaGestionArchivosRemotos:
         except Exception as e:
             logger.error(f"❌ Error creando estructura de directorios: {e}")
     
+    @staticmethod
+    def _extension(archivo):
+        return archivo.name.split('.')[-1] if '.' in archivo.name else 'pdf'
+    
+    @classmethod
+    def _nombre_seguro(cls, archivo, nombre_documento, extension=None):
+        """Nombre de archivo remoto: documento sin símbolos, marca de tiempo y extensión
+        (la original, o la del documento optimizado si se indica)"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = extension or cls._extension(archivo)
+        
+        nombre_doc_simple = re.sub(r'[^\w\s-]', '', nombre_documento)
+        nombre_doc_simple = re.sub(r'[-\s]+', '_', nombre_doc_simple)
+        
+        return f"{nombre_doc_simple}_{timestamp}.{extension}", extension
+    
     def subir_documento_remoto(self, archivo, nombre_documento, matricula):
         """Subir documento directamente al servidor remoto"""
         try:
             if archivo is None:
                 return None
             
-            # Generar nombre seguro para el archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            nombre_original = archivo.name
-            extension = nombre_original.split('.')[-1] if '.' in nombre_original else 'pdf'
-            
-            # Nombre seguro
-            nombre_doc_simple = re.sub(r'[^\w\s-]', '', nombre_documento)
-            nombre_doc_simple = re.sub(r'[-\s]+', '_', nombre_doc_simple)
-            
-            nombre_seguro = f"{nombre_doc_simple}_{timestamp}.{extension}"
+            subidos, fallidos = self.subir_documentos_remotos([(archivo, nombre_documento)], matricula)
+            if subidos:
+                logger.info(f"✅ Documento subido a remoto: {matricula}/{subidos[0]['nombre_archivo']} ({subidos[0]['tamano_bytes']} bytes)")
+                return subidos[0]
             
-            # Construir ruta remota
-            ruta_remota = os.path.join(
-                self.gestor.uploads_inscritos_remoto,
-                matricula,
-                nombre_seguro
-            )
+            return None
+        
+        except Exception as e:
+            logger.error(f"❌ Error subiendo documento remoto: {e}")
+            return None
+
+    @staticmethod
+    def _clave_preparacion(archivo):
+        return (getattr(archivo, 'file_id', None) or archivo.name, archivo.size)
+    
+    def _preparacion(self, archivo):
+        """Tarea de optimización del archivo, programada una sola vez por archivo elegido en la sesión.
+        
+        Al terminar encadena la pre-subida del contenido ya optimizado, así que
+        lo que viaja al servidor es el archivo final. La tarea recibe el buffer
+        del archivo subido (getbuffer), no una copia.
+        """
+        preparados = st.session_state.setdefault('documentos_preparados', {})
+        clave = self._clave_preparacion(archivo)
+        if clave not in preparados:
+            al_terminar = None
+            if self.presubida:
+                presubida = self.presubida
+                al_terminar = lambda resultado: presubida.programar(resultado['contenido'], resultado['sha256'])
+            preparados[clave] = self.optimizador.programar(archivo.getbuffer(), self._extension(archivo), al_terminar)
+        return preparados[clave]
+    
+    def olvidar_preparados(self, archivos):
+        """Soltar las preparaciones de archivos que ya no están elegidos en el formulario"""
+        vigentes = {self._clave_preparacion(archivo) for archivo in archivos}
+        preparados = st.session_state.get('documentos_preparados', {})
+        for clave in [clave for clave in preparados if clave not in vigentes]:
+            del preparados[clave]
+    
+    def _documento_preparado(self, archivo):
+        """Resultado de la optimización; si no terminó a tiempo se usa el archivo original"""
+        try:
+            return self._preparacion(archivo).result(timeout=self.gestor.timeouts['sftp_transfer'])
+        except Exception as e:
+            logger.warning(f"⚠️ {archivo.name} no se optimizó, se guarda el original: {e}")
+            return OptimizadorDocumentos.original(archivo.getbuffer(), self._extension(archivo))
+    
+    def preparar(self, archivo):
+        """Optimizar y subir al staging remoto en segundo plano un archivo recién elegido.
+        
+        Regresa {'estado', 'avance', 'tamano_original', 'tamano'} con estado
+        'optimizando', 'listo', 'subiendo', 'error' o None si la pre-subida no
+        está disponible; 'tamano' es None mientras se optimiza.
+        """
+        estado = {'estado': None, 'avance': 0.0, 'tamano_original': getattr(archivo, 'size', 0), 'tamano': None}
+        if archivo is None:
+            return estado
+        try:
+            preparacion = self._preparacion(archivo)
+            if not preparacion.done():
+                estado['estado'] = 'optimizando'
+                return estado
+            
+            resultado = preparacion.result()
+            estado['tamano'] = resultado['tamano']
+            if self.presubida:
+                # Vuelve a programar solo si la pre-subida anterior falló
+                self.presubida.programar(resultado['contenido'], resultado['sha256'])
+                estado['estado'], estado['avance'] = self.presubida.estado(resultado['sha256'], resultado['tamano'])
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo preparar {archivo.name}: {e}")
+        return estado
+    
+    def subir_documentos_remotos(self, documentos, matricula, progreso=None):
+        """Subir en un solo lote los documentos [(archivo, nombre_documento)] de una matrícula.
+        
+        Cada contenido se guarda una vez en el almacén por contenido del
+        servidor y en la carpeta de la matrícula queda un enlace: lo que ya
+        estaba en el almacén no se sube, lo que ya está en staging solo se
+        mueve y el resto se sube en paralelo. Regresa (subidos, fallidos):
+        subidos con el mismo formato que subir_documento_remoto y fallidos
+        como [(nombre_documento, error)].
+        """
+        try:
+            # Una vez por proceso: las ejecuciones siguientes no consultan al servidor
+            self.crear_estructura_directorios()
             
-            # Subir archivo directamente al servidor remoto
-            if self.gestor.subir_buffer_remoto(archivo.getbuffer(), nombre_seguro, ruta_remota):
-                tamano_bytes = len(archivo.getbuffer())
-                
-                logger.info(f"✅ Documento subido a remoto: {matricula}/{nombre_seguro} ({tamano_bytes} bytes)")
+            directorio = f"{self.gestor.uploads_inscritos_remoto}/{matricula}"
+            info, lote = {}, []
+            for archivo, nombre_documento in documentos:
+                if archivo is None:
+                    continue
+                documento = self._documento_preparado(archivo)
+                nombre_seguro, extension = self._nombre_seguro(archivo, nombre_documento, documento['extension'])
+                # Dos documentos con el mismo nombre simple no deben pisarse dentro del lote
+                if nombre_seguro in info:
+                    base, _ = os.path.splitext(nombre_seguro)
+                    nombre_seguro = f"{base}_{len(info)}.{extension}"
+                info[nombre_seguro] = (nombre_documento, documento)
                 
-                return {
+                # Espera a las pre-subidas en curso: corren en paralelo, así que tarda lo que la más lenta
+                ruta_staging = None
+                if self.presubida:
+                    ruta_staging = self.presubida.esperar(documento['sha256'], self.gestor.timeouts['sftp_transfer'])
+                lote.append((nombre_seguro, documento['contenido'], documento['sha256'], ruta_staging))
+            
+            def avisar(nombre, resultado):
+                if progreso:
+                    progreso(info[nombre][0], resultado)
+            
+            resultados = self.gestor.almacenar_documentos_remotos(lote, directorio, avisar) if lote else {}
+            if resultados is None:
+                resultados = {nombre: {'ok': False, 'error': "Sin conexión con el servidor"} for nombre in info}
+            if self.presubida:
+                for nombre, resultado in resultados.items():
+                    if resultado['ok']:
+                        self.presubida.olvidar(info[nombre][1]['sha256'])
+
+            subidos, fallidos = [], []
+            for nombre_seguro, (nombre_documento, documento) in info.items():
+                resultado = resultados.get(nombre_seguro, {'ok': False, 'error': "Sin resultado"})
+                if not resultado['ok']:
+                    fallidos.append((nombre_documento, resultado['error']))
+                    continue
+                subidos.append({
                     'nombre_documento': nombre_documento,
                     'nombre_archivo': nombre_seguro,
-                    'ruta_archivo': ruta_remota,  # Ruta remota
-                    'tamano_bytes': tamano_bytes,
-                    'tipo_archivo': extension,
-                    'matricula': matricula
-                }
+                    'ruta_archivo': resultado['ruta'],
+                    'tamano_bytes': resultado['tamano'],
+                    'tamano_original_bytes': documento['tamano_original'],
+                    'tipo_archivo': documento['extension'],
+                    'matricula': matricula,
+                    'sha256': resultado['sha256']
+                })
             
-            return None
+            logger.info(
+                f"✅ Documentos de {matricula}: {len(subidos)} guardados "
+                f"({sum(1 for r in resultados.values() if r.get('reutilizado'))} ya estaban en el servidor), "
+                f"{len(fallidos)} con error"
+            )
+            return subidos, fallidos
             
         except Exception as e:
-            logger.error(f"❌ Error subiendo documento remoto: {e}")
-            return None
+            logger.error(f"❌ Error subiendo documentos remotos: {e}")
+            return [], [(nombre_documento, str(e)) for _, nombre_documento in documentos]
     
     def obtener_ruta_archivo_remoto(self, nombre_archivo, matricula):
         """Obtener ruta remota completa de un archivo"""
@@ -1275,17 +2545,42 @@ class SistemaGestionArchivosRemotos:
 class SistemaBaseDatosCompleto:
     """Sistema de base de datos SQLite COMPLETO que trabaja directamente en el servidor remoto"""
     
+    # sincronizar_hacia_remoto: el registro quedó en la cola del servidor sin confirmarse
+    PENDIENTE = 'pendiente'
+    
     def __init__(self):
         self.gestor = gestor_remoto
         self.gestor_archivos = SistemaGestionArchivosRemotos()
         self.db_local_temp = None
+        self._liberar_copia = None
         self.conexion_actual = None
         self.ultima_sincronizacion = None
         self.validador = ValidadorDatos()
+        self.diario = DiarioCambios()
+        self.registro_pendiente = None
     
     def _intento_conexion_con_backoff(self, attempt):
         return self.gestor._intento_conexion_con_backoff(attempt)
     
+    def _adoptar_copia(self, ruta):
+        """Hacer de `ruta` la copia de trabajo de esta instancia y liberar la anterior.
+        
+        Cada instancia tiene su propia copia y solo borra la suya, al
+        reemplazarla o cuando la instancia deja de usarse.
+        """
+        if self._liberar_copia is not None:
+            self._liberar_copia()
+        self.db_local_temp = ruta
+        self._liberar_copia = weakref.finalize(self, self._borrar_copia, ruta) if ruta else None
+    
+    @staticmethod
+    def _borrar_copia(ruta):
+        try:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        except OSError:
+            pass
+    
     def sincronizar_desde_remoto(self):
         inicio_tiempo = time.time()
         
@@ -1293,7 +2588,7 @@ class SistemaBaseDatosCompleto:
             try:
                 logger.info(f"🔄 Intento {attempt + 1}/{self.gestor.retry_attempts} sincronizando desde remoto...")
                 
-                self.db_local_temp = self.gestor.descargar_db_remota()
+                self._adoptar_copia(self.gestor.descargar_db_remota())
                 
                 if not self.db_local_temp:
                     raise Exception("No se pudo obtener base de datos remota")
@@ -1301,6 +2596,8 @@ class SistemaBaseDatosCompleto:
                 if not os.path.exists(self.db_local_temp):
                     raise Exception(f"Archivo de base de datos no existe: {self.db_local_temp}")
                 
+                self.diario.reiniciar()
+                
                 try:
                     conn = sqlite3.connect(self.db_local_temp)
                     cursor = conn.cursor()
@@ -1310,13 +2607,23 @@ class SistemaBaseDatosCompleto:
                     
                     logger.info(f"✅ Base de datos verificada: {len(tablas)} tablas")
                     
-                    if len(tablas) == 0:
-                        logger.warning("⚠️ Base de datos vacía, inicializando estructura completa...")
-                        self._inicializar_estructura_db_completa()
                 except Exception as e:
                     logger.error(f"❌ Base de datos corrupta: {e}")
                     raise Exception(f"Base de datos corrupta: {e}")
                 
+                # Los cambios de esquema no pasan por el diario: se aplican en el
+                # servidor, porque subir la copia completa pisaría otras sesiones
+                if len(tablas) == 0:
+                    logger.warning("⚠️ Base de datos vacía, inicializando estructura completa...")
+                    self._inicializar_estructura_db_completa()
+                    creada = self.gestor.inicializar_db_remota(self.db_local_temp)
+                    if creada is None:
+                        raise Exception("No se pudo crear la estructura en el servidor")
+                    if not creada:
+                        raise Exception("La base remota cambió durante la inicialización, se vuelve a descargar")
+                elif self._aplicar_migraciones_esquema() and self.gestor.aplicar_migraciones_remotas() is None:
+                    raise Exception("No se pudieron aplicar las migraciones en el servidor")
+                
                 self.ultima_sincronizacion = datetime.now()
                 tiempo_total = time.time() - inicio_tiempo
                 
@@ -1337,6 +2644,22 @@ class SistemaBaseDatosCompleto:
                     logger.error(f"❌ Sincronización fallida después de {tiempo_total:.1f}s")
                     return False
     
+    def verificar_registro_pendiente(self, nombre):
+        """Resultado de un registro que quedó pendiente en la cola remota"""
+        return self.gestor.consultar_registro(nombre)
+    
+    def _aplicar_migraciones_esquema(self):
+        """Aplicar en la copia local las migraciones pendientes.
+        
+        Regresa el reporte: si no está vacío, la base remota también tiene
+        migraciones pendientes y hay que aplicarlas allá.
+        """
+        conn = sqlite3.connect(self.db_local_temp)
+        try:
+            return MigradorEsquema.para_conexion(conn, 'aspirantes').aplicar()
+        finally:
+            conn.close()
+    
     def _inicializar_estructura_db_completa(self):
         try:
             if not self.db_local_temp:
@@ -1349,9 +2672,77 @@ class SistemaBaseDatosCompleto:
             logger.error(f"❌ Error inicializando estructura: {e}", exc_info=True)
             raise
     
+    def _sincronizar_changeset(self):
+        """Enviar solo los cambios del diario.
+        
+        True/False, PENDIENTE si el registro quedó en la cola remota sin
+        confirmar, o None si hay que subir la base completa: solo cuando el
+        diario no pudo registrar los cambios y la cola de registros está apagada.
+        """
+        if self.diario.requiere_subida_completa:
+            if self.gestor.cola_registros:
+                # Con la cola otras sesiones escriben en el servidor: la base completa las pisaría
+                logger.error("❌ Los cambios no quedaron en el diario y no se pueden enviar sin reemplazar la base")
+                return False
+            return None
+        
+        if not self.diario.cambios:
+            logger.info("✅ Sin cambios locales que sincronizar")
+            return True
+        
+        # Con la cola los envíos concurrentes se aplican en orden sin pisarse
+        if self.gestor.cola_registros:
+            resultado = self.gestor.encolar_cambios(self.diario)
+            if resultado is None:
+                logger.error("❌ Cola de registros no disponible: los cambios no se enviaron")
+                return False
+        else:
+            resultado = self.gestor.aplicar_cambios_remotos(self.diario)
+            if resultado is None:
+                logger.error("❌ El servidor no aplicó los cambios: se conservan para reintentar")
+                return False
+        
+        if resultado.get('desconocido'):
+            # El COMMIT remoto pudo ocurrir: reenviar podría duplicar los cambios,
+            # así que la copia local se reemplaza por el estado real del servidor
+            logger.error("❌ No se confirmó si el servidor aplicó los cambios: se vuelve a descargar la base")
+            self.sincronizar_desde_remoto()
+            return False
+        
+        if resultado.get('pendiente'):
+            # El registro ya es durable en la cola: aplicarlo por otra vía lo duplicaría.
+            # La siguiente fusión lo aplica o lo rechaza; hasta entonces no está confirmado
+            self.registro_pendiente = resultado.get('registro')
+            self.diario.reiniciar()
+            return self.PENDIENTE
+        
+        if not resultado.get('ok'):
+            # Subir la base completa pisaría lo que cambió en el servidor
+            for conflicto in resultado.get('conflictos', []):
+                logger.error(
+                    f"❌ Conflicto en {conflicto['tabla']} ({conflicto['operacion']} fila {conflicto['fila']}): "
+                    f"{conflicto['motivo']}"
+                )
+            return False
+        
+        self.diario.reiniciar()
+        return True
+    
     def sincronizar_hacia_remoto(self):
         inicio_tiempo = time.time()
         
+        enviado = self._sincronizar_changeset()
+        if enviado is not None:
+            if enviado == self.PENDIENTE:
+                logger.warning(f"⏳ Registro {self.registro_pendiente} en la cola del servidor, sin confirmar")
+            elif enviado:
+                self.ultima_sincronizacion = datetime.now()
+                logger.info(f"✅ Cambios aplicados en el servidor en {time.time() - inicio_tiempo:.1f}s")
+                estado_sistema.marcar_sincronizacion()
+            else:
+                logger.error("❌ El changeset no se aplicó: recargue los datos y repita la operación")
+            return enviado
+        
         for attempt in range(self.gestor.retry_attempts):
             try:
                 logger.info(f"📤 Intento {attempt + 1}/{self.gestor.retry_attempts} sincronizando hacia remoto...")
@@ -1362,6 +2753,7 @@ class SistemaBaseDatosCompleto:
                 exito = self.gestor.subir_db_remota(self.db_local_temp)
                 
                 if exito:
+                    self.diario.reiniciar()
                     self.ultima_sincronizacion = datetime.now()
                     tiempo_total = time.time() - inicio_tiempo
                     
@@ -1396,11 +2788,14 @@ class SistemaBaseDatosCompleto:
             conn.row_factory = sqlite3.Row
             
             conn.execute("PRAGMA busy_timeout = 5000")
+            self.diario.instalar(conn)
             
             yield conn
             
             if conn:
+                cambios = self.diario.recoger(conn)
                 conn.commit()
+                self.diario.confirmar(cambios)
                 
         except Exception as e:
             if conn:
@@ -1560,7 +2955,9 @@ class SistemaBaseDatosCompleto:
                         archivo_info['nombre_archivo'],
                         archivo_info['ruta_archivo'],  # Esta ya es la ruta remota
                         archivo_info['tamano_bytes'],
-                        archivo_info['tipo_archivo']
+                        archivo_info['tipo_archivo'],
+                        archivo_info.get('tamano_original_bytes'),
+                        archivo_info.get('sha256')
                     )
             
             if inscrito_id:
@@ -1598,13 +2995,14 @@ class SistemaBaseDatosCompleto:
             logger.error(f"❌ Error agregando inscrito completo: {e}")
             raise
     
-    def guardar_documento_subido(self, inscrito_id, nombre_documento, nombre_archivo, ruta_archivo, tamano_bytes, tipo_archivo):
+    def guardar_documento_subido(self, inscrito_id, nombre_documento, nombre_archivo, ruta_archivo, tamano_bytes, tipo_archivo,
+                                 tamano_original_bytes=None, sha256=None):
         try:
             query = '''
                 INSERT INTO documentos_subidos (
                     inscrito_id, nombre_documento, nombre_archivo, ruta_archivo,
-                    tamano_bytes, tipo_archivo
-                ) VALUES (?, ?, ?, ?, ?, ?)
+                    tamano_bytes, tipo_archivo, tamano_original_bytes, sha256
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             '''
             
             self.ejecutar_query(query, (
@@ -1613,7 +3011,9 @@ class SistemaBaseDatosCompleto:
                 nombre_archivo,
                 ruta_archivo,
                 tamano_bytes,
-                tipo_archivo
+                tipo_archivo,
+                tamano_original_bytes or tamano_bytes,
+                sha256
             ))
             
             logger.info(f"✅ Documento subido registrado: {nombre_archivo} para inscrito {inscrito_id}")
@@ -1800,6 +3200,32 @@ class SistemaBackupAutomatico:
                 os.makedirs(self.backup_dir)
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            metadata = {
+                'fecha_backup': datetime.now().isoformat(),
+                'tipo_operacion': tipo_operacion,
+                'detalles': detalles,
+                'usuario': 'sistema'
+            }
+            
+            # La instantánea se guarda en el repositorio del servidor: la base no se descarga
+            instantanea = self.gestor_ssh.crear_respaldo_remoto(tipo_operacion)
+            if instantanea:
+                metadata.update({
+                    'ubicacion': 'repositorio_remoto',
+                    'instantanea': instantanea['id'],
+                    'tamano': instantanea['tamano'],
+                    'bytes_nuevos': instantanea['bytes_nuevos'],
+                    'sha256': instantanea['sha256']
+                })
+                metadata_path = os.path.join(self.backup_dir, f"backup_{tipo_operacion}_{timestamp}.json")
+                with open(metadata_path, 'w') as f:
+                    json.dump(metadata, f, indent=2, default=str)
+                
+                poda = instantanea.get('poda')
+                self._limpiar_backups_antiguos(poda['conservadas'] if poda else None)
+                return metadata_path
+            
+            logger.warning("⚠️ Repositorio de respaldos no disponible, respaldando con descarga completa")
             backup_filename = f"backup_{tipo_operacion}_{timestamp}.zip"
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
@@ -1810,13 +3236,6 @@ class SistemaBackupAutomatico:
                         with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                             zipf.write(temp_db, 'database.db')
                             
-                            metadata = {
-                                'fecha_backup': datetime.now().isoformat(),
-                                'tipo_operacion': tipo_operacion,
-                                'detalles': detalles,
-                                'usuario': 'sistema'
-                            }
-                            
                             metadata_str = json.dumps(metadata, indent=2, default=str)
                             zipf.writestr('metadata.json', metadata_str)
                         
@@ -1833,7 +3252,8 @@ class SistemaBackupAutomatico:
             logger.error(f"❌ Error creando backup: {e}")
             return None
     
-    def _limpiar_backups_antiguos(self):
+    def _limpiar_backups_antiguos(self, conservadas=None):
+        """Los zip locales se limitan por cantidad; las instantáneas siguen la retención del repositorio"""
         try:
             if not os.path.exists(self.backup_dir):
                 return
@@ -1852,6 +3272,26 @@ class SistemaBackupAutomatico:
                     logger.info(f"🗑️ Backup antiguo eliminado: {backup[0]}")
                 except Exception as e:
                     logger.warning(f"⚠️ No se pudo eliminar backup antiguo: {e}")
+            
+            if conservadas is None:
+                return
+            
+            # Metadatos de instantáneas que la retención ya eliminó del servidor
+            for file in os.listdir(self.backup_dir):
+                if not (file.startswith('backup_') and file.endswith('.json')):
+                    continue
+                filepath = os.path.join(self.backup_dir, file)
+                try:
+                    with open(filepath, 'r') as f:
+                        instantanea = json.load(f).get('instantanea')
+                    if instantanea and instantanea not in conservadas:
+                        os.remove(filepath)
+                        copia_local = os.path.join(self.backup_dir, f"{instantanea}.db")
+                        if os.path.exists(copia_local):
+                            os.remove(copia_local)
+                        logger.info(f"🗑️ Instantánea fuera de retención: {instantanea}")
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo depurar metadato {file}: {e}")
                     
         except Exception as e:
             logger.error(f"Error limpiando backups antiguos: {e}")
@@ -1869,15 +3309,46 @@ class SistemaBackupAutomatico:
                         'nombre': file,
                         'ruta': filepath,
                         'tamaño': os.path.getsize(filepath),
-                        'fecha': datetime.fromtimestamp(os.path.getmtime(filepath))
+                        'fecha': datetime.fromtimestamp(os.path.getmtime(filepath)),
+                        'ubicacion': 'local'
                     }
                     backups.append(file_info)
+                elif file.startswith('backup_') and file.endswith('.json'):
+                    filepath = os.path.join(self.backup_dir, file)
+                    try:
+                        with open(filepath, 'r') as f:
+                            metadata = json.load(f)
+                        backups.append({
+                            'nombre': f"{metadata['instantanea']}.db",
+                            'ruta': filepath,
+                            'instantanea': metadata['instantanea'],
+                            'tamaño': metadata.get('tamano', 0),
+                            'fecha': datetime.fromisoformat(metadata['fecha_backup']),
+                            'ubicacion': 'repositorio_remoto'
+                        })
+                    except Exception as e:
+                        logger.warning(f"⚠️ Error leyendo metadato {file}: {e}")
             
             return sorted(backups, key=lambda x: x['fecha'], reverse=True)
             
         except Exception as e:
             logger.error(f"Error listando backups: {e}")
             return []
+    
+    def obtener_archivo_backup(self, backup, descargar=False):
+        """Ruta local del archivo del backup; las instantáneas se restauran y traen si descargar=True"""
+        if backup.get('ubicacion') != 'repositorio_remoto':
+            return backup['ruta']
+        
+        ruta_local = os.path.join(self.backup_dir, backup['nombre'])
+        if not os.path.exists(ruta_local):
+            if not descargar or not self.gestor_ssh.restaurar_respaldo_remoto(backup['instantanea'], ruta_local):
+                return None
+        return ruta_local
+    
+    def verificar_backups(self):
+        """Verificar bloque por bloque las instantáneas del repositorio remoto"""
+        return self.gestor_ssh.verificar_respaldos_remotos()
 
 class SistemaCorreosCompleto:
     """Sistema de envío de correos completo"""
@@ -2584,7 +4055,9 @@ class SistemaInscritosCompleto:
         if 'formulario_enviado' not in st.session_state:
             st.session_state.formulario_enviado = False
         
-        if not st.session_state.formulario_enviado:
+        if st.session_state.get('registro_pendiente'):
+            self._mostrar_registro_pendiente()
+        elif not st.session_state.formulario_enviado:
             # Sección 1: Selección de programa
             self._mostrar_seleccion_programa()
             
@@ -2810,6 +4283,18 @@ class SistemaInscritosCompleto:
             "matricula_unam": matricula_unam
         }
     
+    def _mostrar_estado_preparacion(self, archivo):
+        """Avance de la optimización y pre-subida de un documento elegido"""
+        estado = self.gestor_archivos.preparar(archivo)
+        if estado['estado'] == 'optimizando':
+            st.caption("🗜️ Optimizando imagen...")
+        elif estado['tamano'] is not None and estado['tamano'] < estado['tamano_original']:
+            st.caption(f"🗜️ Optimizado: {estado['tamano_original'] / 1024:,.0f} KB → {estado['tamano'] / 1024:,.0f} KB")
+        if estado['estado'] == 'listo':
+            st.caption("☁️ Ya está en el servidor")
+        elif estado['estado'] == 'subiendo':
+            st.caption(f"⏫ Subiendo al servidor en segundo plano ({estado['avance']:.0%})")
+    
     def _mostrar_paso_documentacion_completa_corregida(self, tipo_programa, matricula):
         """VERSIÓN CORREGIDA - Contador de documentos funcional"""
         st.markdown("### 📄 **SUBA SUS DOCUMENTOS (DIRECTO AL SERVIDOR REMOTO)**")
@@ -2858,6 +4343,9 @@ class SistemaInscritosCompleto:
                     if not file_already_added:
                         st.success(f"✅ **{archivo.name}** ({archivo.size:,} bytes)")
                         
+                        # Se optimiza y sube en segundo plano mientras se llena el resto del formulario
+                        self._mostrar_estado_preparacion(archivo)
+                        
                         archivos_subidos_info.append({
                             'nombre_documento': doc,
                             'archivo': archivo,
@@ -2889,6 +4377,9 @@ class SistemaInscritosCompleto:
                     if not file_already_added:
                         st.success(f"✅ **{archivo.name}** ({archivo.size:,} bytes)")
                         
+                        # Se optimiza y sube en segundo plano mientras se llena el resto del formulario
+                        self._mostrar_estado_preparacion(archivo)
+                        
                         archivos_subidos_info.append({
                             'nombre_documento': doc,
                             'archivo': archivo,
@@ -2899,6 +4390,7 @@ class SistemaInscritosCompleto:
         
         # ACTUALIZAR EL ESTADO GLOBAL - CORRECCIÓN CLAVE
         st.session_state.archivos_subidos_info = archivos_subidos_info
+        self.gestor_archivos.olvidar_preparados([a['archivo'] for a in archivos_subidos_info])
         
         # Mostrar resumen claro
         documentos_count = len(archivos_subidos_info)
@@ -3142,20 +4634,29 @@ class SistemaInscritosCompleto:
                 if backup_path:
                     logger.info(f"✅ Backup creado antes de operación: {os.path.basename(backup_path)}")
                 
-                # Subir archivos directamente al servidor remoto
-                archivos_subidos = []
-                documentos_subidos_nombres = []
+                # Subir archivos directamente al servidor remoto, en paralelo y en un solo lote
+                barra_documentos = st.progress(0.0, text="📤 Subiendo documentos...")
+                terminados = []
                 
-                # Usar SOLO documentos válidos
-                for archivo_info in documentos_validos:
-                    archivo_subido = self.gestor_archivos.subir_documento_remoto(
-                        archivo_info['archivo'],
-                        archivo_info['nombre_documento'],
-                        datos['matricula_generada']
+                def mostrar_progreso(nombre_documento, resultado):
+                    terminados.append(nombre_documento)
+                    estado = "✅" if resultado['ok'] else "❌"
+                    barra_documentos.progress(
+                        len(terminados) / len(documentos_validos),
+                        text=f"{estado} {nombre_documento} ({len(terminados)}/{len(documentos_validos)})"
                     )
-                    if archivo_subido:
-                        archivos_subidos.append(archivo_subido)
-                        documentos_subidos_nombres.append(archivo_info['nombre_documento'])
+                
+                # Usar SOLO documentos válidos
+                archivos_subidos, documentos_fallidos = self.gestor_archivos.subir_documentos_remotos(
+                    [(archivo_info['archivo'], archivo_info['nombre_documento']) for archivo_info in documentos_validos],
+                    datos['matricula_generada'],
+                    mostrar_progreso
+                )
+                documentos_subidos_nombres = [archivo['nombre_documento'] for archivo in archivos_subidos]
+                barra_documentos.empty()
+                
+                for nombre_documento, error in documentos_fallidos:
+                    st.warning(f"⚠️ No se pudo subir {nombre_documento}: {error}")
                 
                 datos_completos = {
                     'matricula': datos['matricula_generada'],
@@ -3185,56 +4686,35 @@ class SistemaInscritosCompleto:
                 inscrito_id, folio_unico = self.base_datos.agregar_inscrito_completo(datos_completos)
                 
                 if inscrito_id:
-                    if self.base_datos.sincronizar_hacia_remoto():
-                        st.session_state.formulario_enviado = True
-                        st.session_state.datos_exitosos = {
-                            'folio': folio_unico,
-                            'matricula': datos_completos['matricula'],
-                            'nombre': datos['nombre'],
-                            'email': datos['email'],
-                            'email_gmail': datos['email_gmail'],
-                            'programa': programa['programa'],
-                            'tipo_programa': programa['tipo_programa'],
-                            'categoria': programa['categoria'],
-                            'duracion': programa.get('duracion', ''),
-                            'modalidad': programa.get('modalidad', ''),
-                            'documentos': len(archivos_subidos),
-                            'documentos_requeridos': documentos_requeridos,
-                            'estudio_socioeconomico': 'Sí' if any(estudio.values()) else 'No',
-                            'examen_psicometrico': 'Sí' if examen else 'No',
-                            'archivos_subidos': len(archivos_subidos),
-                            'carpeta_documentos': f"{gestor_remoto.uploads_inscritos_remoto}/{datos['matricula_generada']}/"
-                        }
-                        
-                        correo_enviado = False
-                        mensaje_correo = "Sistema de correos no configurado"
-                        
-                        if self.sistema_correos.correos_habilitados:
-                            correo_enviado, mensaje_correo = self.sistema_correos.enviar_correo_confirmacion_completo(
-                                datos['email_gmail'],
-                                datos['nombre'],
-                                datos_completos['matricula'],
-                                folio_unico,
-                                programa['programa'],
-                                programa['tipo_programa']
-                            )
-                        
-                        st.session_state.datos_exitosos['correo_enviado'] = correo_enviado
-                        st.session_state.datos_exitosos['mensaje_correo'] = mensaje_correo
-                        
-                        # Limpiar estado de archivos
-                        st.session_state.archivos_subidos_info = []
-                        
-                        # Limpiar estado del formulario
-                        st.session_state.formulario_estado = {
-                            'programa_seleccionado': None,
-                            'programa_info': None,
-                            'matricula_generada': None,
-                            'documentos_subidos': [],
-                            'contador_documentos': 0
+                    datos_exitosos = {
+                        'folio': folio_unico,
+                        'matricula': datos_completos['matricula'],
+                        'nombre': datos['nombre'],
+                        'email': datos['email'],
+                        'email_gmail': datos['email_gmail'],
+                        'programa': programa['programa'],
+                        'tipo_programa': programa['tipo_programa'],
+                        'categoria': programa['categoria'],
+                        'duracion': programa.get('duracion', ''),
+                        'modalidad': programa.get('modalidad', ''),
+                        'documentos': len(archivos_subidos),
+                        'documentos_requeridos': documentos_requeridos,
+                        'estudio_socioeconomico': 'Sí' if any(estudio.values()) else 'No',
+                        'examen_psicometrico': 'Sí' if examen else 'No',
+                        'archivos_subidos': len(archivos_subidos),
+                        'carpeta_documentos': f"{gestor_remoto.uploads_inscritos_remoto}/{datos['matricula_generada']}/"
+                    }
+                    
+                    envio = self.base_datos.sincronizar_hacia_remoto()
+                    if envio == SistemaBaseDatosCompleto.PENDIENTE:
+                        # En la cola del servidor pero sin aplicar: no se confirma ni se envía correo
+                        st.session_state.registro_pendiente = {
+                            'registro': self.base_datos.registro_pendiente,
+                            'datos_exitosos': datos_exitosos
                         }
-                        
                         st.rerun()
+                    elif envio:
+                        self._confirmar_registro(datos_exitosos)
                     else:
                         st.error("❌ Error al sincronizar con el servidor remoto")
                 else:
@@ -3246,6 +4726,63 @@ class SistemaInscritosCompleto:
                 st.error(f"❌ Error en el registro: {str(e)}")
                 logger.error(f"Error registrando inscripción completa: {e}", exc_info=True)
     
+    def _confirmar_registro(self, datos):
+        """Registro aplicado en el servidor: correo de confirmación y pantalla de éxito"""
+        correo_enviado = False
+        mensaje_correo = "Sistema de correos no configurado"
+        
+        if self.sistema_correos.correos_habilitados:
+            correo_enviado, mensaje_correo = self.sistema_correos.enviar_correo_confirmacion_completo(
+                datos['email_gmail'],
+                datos['nombre'],
+                datos['matricula'],
+                datos['folio'],
+                datos['programa'],
+                datos['tipo_programa']
+            )
+        
+        datos['correo_enviado'] = correo_enviado
+        datos['mensaje_correo'] = mensaje_correo
+        
+        # Limpiar estado de archivos
+        st.session_state.archivos_subidos_info = []
+        st.session_state.documentos_preparados = {}
+        
+        # Limpiar estado del formulario
+        st.session_state.formulario_estado = {
+            'programa_seleccionado': None,
+            'programa_info': None,
+            'matricula_generada': None,
+            'documentos_subidos': [],
+            'contador_documentos': 0
+        }
+        st.session_state.datos_exitosos = datos
+        st.session_state.formulario_enviado = True
+        st.rerun()
+    
+    def _mostrar_registro_pendiente(self):
+        """Registro que llegó a la cola del servidor pero aún no se confirma"""
+        pendiente = st.session_state.registro_pendiente
+        datos = pendiente['datos_exitosos']
+        
+        st.warning(
+            "⏳ **Tu solicitud llegó al servidor pero todavía no está confirmada.**\n\n"
+            f"No la envíes de nuevo. Guarda tu folio **{datos['folio']}** y verifica el estado en unos momentos."
+        )
+        
+        if st.button("🔄 Verificar estado de mi registro", type="primary", use_container_width=True):
+            resultado = self.base_datos.verificar_registro_pendiente(pendiente['registro'])
+            if resultado.get('ok'):
+                st.session_state.registro_pendiente = None
+                self._confirmar_registro(datos)
+            elif resultado.get('pendiente'):
+                st.info("⏳ Tu registro sigue en espera de confirmación. Intenta de nuevo en unos momentos.")
+            else:
+                st.session_state.registro_pendiente = None
+                for conflicto in resultado.get('conflictos', []):
+                    logger.error(f"❌ Registro {pendiente['registro']} rechazado: {conflicto['motivo']}")
+                st.error("❌ El servidor no pudo aplicar tu registro. Revisa tus datos y envía la solicitud de nuevo.")
+    
     def _mostrar_resultado_exitoso(self):
         datos = st.session_state.datos_exitosos
         
@@ -3304,6 +4841,7 @@ class SistemaInscritosCompleto:
                 'contador_documentos': 0
             }
             st.session_state.archivos_subidos_info = []
+            st.session_state.documentos_preparados = {}
             st.rerun()
 
 # ============================================================================
@@ -3525,7 +5063,7 @@ class PaginaConfiguracion:
             
             if st.button("🔄 Crear/Verificar Directorios Remotos", use_container_width=True):
                 with st.spinner("Creando/verificando estructura de directorios..."):
-                    if gestor_remoto.crear_estructura_directorios_remota():
+                    if gestor_remoto.crear_estructura_directorios_remota(forzar=True):
                         st.success("✅ Estructura de directorios remota verificada/creada")
                         st.rerun()
                     else:
@@ -3631,16 +5169,37 @@ class PaginaReportes:
                     
                     if backup_seleccionado:
                         backup_info = next((b for b in backups if b['nombre'] == backup_seleccionado), None)
-                        if backup_info:
-                            with open(backup_info['ruta'], 'rb') as f:
+                        ruta_backup = backup_system.obtener_archivo_backup(backup_info) if backup_info else None
+                        if backup_info and not ruta_backup:
+                            # Las instantáneas viven en el repositorio del servidor hasta que se piden
+                            if st.button("♻️ Restaurar desde el repositorio", use_container_width=True):
+                                with st.spinner("Reconstruyendo instantánea..."):
+                                    if backup_system.obtener_archivo_backup(backup_info, descargar=True):
+                                        st.rerun()
+                                    else:
+                                        st.error("❌ No se pudo restaurar la instantánea")
+                        elif ruta_backup:
+                            with open(ruta_backup, 'rb') as f:
                                 backup_bytes = f.read()
                             
                             st.download_button(
                                 label="📥 Descargar Backup Seleccionado",
                                 data=backup_bytes,
-                                file_name=backup_info['nombre'],
-                                mime="application/zip"
+                                file_name=os.path.basename(ruta_backup),
+                                mime="application/x-sqlite3" if ruta_backup.endswith('.db') else "application/zip"
                             )
+            
+            if st.button("🔍 Verificar repositorio de respaldos", use_container_width=True):
+                with st.spinner("Verificando bloques..."):
+                    verificacion = backup_system.verificar_backups()
+                if verificacion is None:
+                    st.error("❌ No se pudo consultar el repositorio de respaldos")
+                elif verificacion['ok']:
+                    st.success(f"✅ {len(verificacion['instantaneas'])} instantáneas íntegras "
+                               f"({verificacion['objetos_verificados']} bloques verificados)")
+                else:
+                    danadas = [i for i, r in verificacion['instantaneas'].items() if not r['ok']]
+                    st.error(f"❌ Instantáneas con bloques faltantes o dañados: {', '.join(danadas)}")
         else:
             st.info("ℹ️ No hay backups disponibles. Crea el primer backup.")
             
@@ -3763,6 +5322,13 @@ def main():
         # Ejecutar controlador principal
         controlador.ejecutar()
         
+        duracion = time.time() - INICIO_EJECUCION
+        if not st.session_state.get('primer_render_medido'):
+            st.session_state.primer_render_medido = True
+            logger.info(f"⏱️ Primer render de la sesión en {duracion:.2f}s (SSH: {estado_sistema.estado.get('ssh_conectado')})")
+        else:
+            logger.debug(f"Rerun en {duracion:.2f}s")
+        
     except Exception as e:
         st.error(f"❌ Error crítico en la aplicación: {e}")
         logger.critical(f"Error crítico en sistema: {e}", exc_info=True)
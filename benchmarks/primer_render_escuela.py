@@ -0,0 +1,236 @@
+"""
+primer_render_escuela.py - Tiempo de render de escuela35 con y sin servidor SSH
+
+Mide con streamlit.testing (AppTest) cuánto tarda el primer render de la
+página de login y los reruns siguientes en dos escenarios:
+
+- servidor: un servidor SSH local (paramiko) que ejecuta los comandos con
+  sh -c sobre una base SQLite temporal, como lo haría el servidor real.
+- agujero: un host que acepta la conexión TCP y nunca manda el banner SSH,
+  el caso de un servidor caído o detrás de un firewall que descarta paquetes.
+
+Cada escenario se corre con el escuela35.py del árbol de trabajo y con el de
+una referencia de git, para comparar antes y después de un cambio:
+
+    python benchmarks/primer_render_escuela.py --referencia HEAD~1
+
+Requiere las dependencias de requirements.txt. El timeout SSH de las
+aplicaciones medidas es --timeout-ssh (5 s por defecto), así que en el
+escenario agujero un render que espera al servidor tarda al menos eso.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+
+import paramiko
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Corre en un proceso aparte por aplicación: AppTest ejecuta el script en el directorio actual
+CODIGO_MEDICION = r'''
+import json, logging, sys, time
+logging.disable(logging.CRITICAL)
+from streamlit.testing.v1 import AppTest
+
+reruns, espera = int(sys.argv[1]), float(sys.argv[2])
+at = AppTest.from_file('escuela35.py', default_timeout=600)
+tiempos = []
+for _ in range(reruns):
+    inicio = time.time()
+    at.run()
+    tiempos.append(round(time.time() - inicio, 2))
+time.sleep(espera)
+inicio = time.time()
+at.run()
+tiempos.append(round(time.time() - inicio, 2))
+
+barra = [e.value for e in list(at.sidebar.success) + list(at.sidebar.error) + list(at.sidebar.info)]
+print(json.dumps({'tiempos': tiempos, 'barra': barra[:3], 'excepciones': len(at.exception)}))
+'''
+
+# =============================================================================
+# SERVIDORES DE PRUEBA
+# =============================================================================
+
+class _InterfazServidor(paramiko.ServerInterface):
+    """Acepta cualquier contraseña y ejecuta cada exec con sh -c"""
+    
+    def check_auth_password(self, usuario, password):
+        return paramiko.AUTH_SUCCESSFUL
+    
+    def get_allowed_auths(self, usuario):
+        return 'password'
+    
+    def check_channel_request(self, tipo, canal_id):
+        return paramiko.OPEN_SUCCEEDED
+    
+    def check_channel_exec_request(self, canal, comando):
+        threading.Thread(target=_ejecutar, args=(canal, comando.decode('utf-8')), daemon=True).start()
+        return True
+
+def _bombear(origen, enviar):
+    for datos in iter(lambda: origen.read1(65536), b''):
+        enviar(datos)
+
+def _ejecutar(canal, comando):
+    proceso = subprocess.Popen(
+        ['sh', '-c', comando], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    
+    def entrada():
+        try:
+            for datos in iter(lambda: canal.recv(65536), b''):
+                proceso.stdin.write(datos)
+                proceso.stdin.flush()
+        except Exception:
+            pass
+        finally:
+            try:
+                proceso.stdin.close()
+            except OSError:
+                pass
+    
+    threading.Thread(target=entrada, daemon=True).start()
+    errores = threading.Thread(target=_bombear, args=(proceso.stderr, canal.sendall_stderr), daemon=True)
+    errores.start()
+    _bombear(proceso.stdout, canal.sendall)
+    errores.join()
+    canal.send_exit_status(proceso.wait())
+    canal.close()
+
+def _escuchar():
+    servidor = socket.socket()
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    servidor.bind(('127.0.0.1', 0))
+    servidor.listen(64)
+    return servidor
+
+def iniciar_servidor_ssh():
+    """Servidor SSH local en un puerto libre; regresa el puerto"""
+    servidor, clave = _escuchar(), paramiko.RSAKey.generate(2048)
+    
+    def atender(cliente):
+        transporte = paramiko.Transport(cliente)
+        transporte.add_server_key(clave)
+        transporte.start_server(server=_InterfazServidor())
+        # paramiko cierra el canal cuando se recolecta: hay que conservarlos
+        canales = []
+        while transporte.is_active():
+            canal = transporte.accept(1)
+            if canal is not None:
+                canales.append(canal)
+    
+    def aceptar():
+        while True:
+            cliente, _ = servidor.accept()
+            threading.Thread(target=atender, args=(cliente,), daemon=True).start()
+    
+    threading.Thread(target=aceptar, daemon=True).start()
+    return servidor.getsockname()[1]
+
+def iniciar_agujero():
+    """Host que acepta TCP y nunca responde; regresa el puerto"""
+    servidor, abiertas = _escuchar(), []
+    
+    def aceptar():
+        while True:
+            abiertas.append(servidor.accept()[0])
+    
+    threading.Thread(target=aceptar, daemon=True).start()
+    return servidor.getsockname()[1]
+
+SERVIDORES = {'servidor': iniciar_servidor_ssh, 'agujero': iniciar_agujero}
+
+def lanzar_servidor(tipo):
+    """Servidor de prueba en un proceso propio; regresa (proceso, puerto).
+    
+    En el mismo proceso que la aplicación medida, el GIL del servidor
+    alteraría los tiempos.
+    """
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--servir', tipo], stdout=subprocess.PIPE, text=True
+    )
+    return proceso, int(proceso.stdout.readline())
+
+# =============================================================================
+# MEDICIÓN
+# =============================================================================
+
+def preparar_directorio(destino, codigo_app, puerto, timeout_ssh):
+    """Aplicación, compartido.py, base vacía y secrets.toml apuntando al puerto"""
+    os.makedirs(os.path.join(destino, '.streamlit'))
+    with open(os.path.join(destino, 'escuela35.py'), 'w', encoding='utf-8') as archivo:
+        archivo.write(codigo_app)
+    shutil.copy(os.path.join(RAIZ, 'compartido.py'), destino)
+    
+    ruta_db = os.path.join(destino, 'escuela.db')
+    conn = sqlite3.connect(ruta_db)
+    conn.execute(
+        "CREATE TABLE usuarios (id INTEGER PRIMARY KEY, usuario TEXT UNIQUE, password_hash TEXT, salt TEXT, "
+        "rol TEXT, nombre_completo TEXT, email TEXT, matricula TEXT, activo INTEGER DEFAULT 1, "
+        "fecha_creacion TEXT, fecha_actualiza TEXT, categoria TEXT, nombre TEXT)"
+    )
+    conn.commit()
+    conn.close()
+    
+    with open(os.path.join(destino, '.streamlit', 'secrets.toml'), 'w', encoding='utf-8') as archivo:
+        archivo.write(
+            f'[ssh]\nhost = "127.0.0.1"\nport = {puerto}\nusername = "prueba"\npassword = "prueba"\n'
+            f'timeout = {timeout_ssh}\n\n[paths]\ndb_principal = "{ruta_db}"\n'
+        )
+
+def medir(destino, reruns, espera):
+    resultado = subprocess.run(
+        [sys.executable, '-c', CODIGO_MEDICION, str(reruns), str(espera)],
+        cwd=destino, capture_output=True, text=True, timeout=1800
+    )
+    lineas = resultado.stdout.strip().splitlines()
+    if resultado.returncode != 0 or not lineas:
+        return {'error': resultado.stderr.strip()[-600:]}
+    return json.loads(lineas[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--referencia', default='HEAD', help="ref de git con la versión 'antes' (HEAD por defecto)")
+    parser.add_argument('--reruns', type=int, default=4, help="renders seguidos al inicio (4 por defecto)")
+    parser.add_argument('--espera', type=float, default=20, help="segundos antes del último rerun (20 por defecto)")
+    parser.add_argument('--timeout-ssh', type=int, default=5, help="timeout SSH de la aplicación medida")
+    parser.add_argument('--servir', choices=sorted(SERVIDORES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.servir:
+        print(SERVIDORES[args.servir](), flush=True)
+        threading.Event().wait()
+    
+    variantes = {
+        'antes': subprocess.run(
+            ['git', '-C', RAIZ, 'show', f'{args.referencia}:escuela35.py'],
+            capture_output=True, text=True, check=True
+        ).stdout,
+        'despues': open(os.path.join(RAIZ, 'escuela35.py'), encoding='utf-8').read(),
+    }
+    servidores = {tipo: lanzar_servidor(tipo) for tipo in SERVIDORES}
+    
+    trabajo = tempfile.mkdtemp(prefix='primer_render_')
+    try:
+        for variante, codigo_app in variantes.items():
+            for host, (_, puerto) in servidores.items():
+                destino = os.path.join(trabajo, f'{variante}_{host}')
+                preparar_directorio(destino, codigo_app, puerto, args.timeout_ssh)
+                print(f"{variante:8} {host:9} {json.dumps(medir(destino, args.reruns, args.espera), ensure_ascii=False)}")
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+        for proceso, _ in servidores.values():
+            proceso.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -29,12 +29,17 @@ import sqlite3
 import tempfile
 import shutil
 from contextlib import contextmanager
+from collections import OrderedDict
 import logging
 import bcrypt
 import subprocess
 import sys
 import socket
+import threading
 import re
+import shlex
+import struct
+import zlib
 import glob
 import atexit
 import math
@@ -43,8 +48,15 @@ from typing import Optional, Dict, Any, List, Tuple
 import calendar
 import random
 import string
+from compartido import (
+    IndiceBusquedaTexto, MigradorEsquema, PoolConexionesSSH, RepositorioRespaldos,
+    usar_logger
+)
 warnings.filterwarnings('ignore')
 
+# Inicio de esta ejecución del script (Streamlit lo vuelve a ejecutar en cada rerun)
+INICIO_EJECUCION = time.time()
+
 # Intentar importar tomllib (Python 3.11+) o tomli (Python < 3.11)
 try:
     import tomllib  # Python 3.11+
@@ -111,6 +123,7 @@ class EnhancedLogger:
         self.logger.critical(message, exc_info=exc_info, extra=extra)
 
 logger = EnhancedLogger()
+usar_logger(logger)
 
 # =============================================================================
 # 1.2 CONFIGURACIÓN DE PÁGINA
@@ -399,6 +412,7 @@ class EstadoPersistente:
     
     def __init__(self, archivo_estado="estado_sistema.json"):
         self.archivo_estado = archivo_estado
+        self._candado = threading.Lock()
         self.estado = self._cargar_estado()
     
     def _cargar_estado(self):
@@ -448,7 +462,8 @@ class EstadoPersistente:
     def guardar_estado(self):
         """Guardar estado a archivo JSON"""
         try:
-            with open(self.archivo_estado, 'w') as f:
+            # La instancia es compartida por las sesiones (hilos) del proceso
+            with self._candado, open(self.archivo_estado, 'w') as f:
                 json.dump(self.estado, f, indent=2, default=str)
             logger.debug(f"Estado guardado en {self.archivo_estado}")
         except Exception as e:
@@ -497,17 +512,68 @@ class EstadoPersistente:
         """Verificar si la BD está inicializada"""
         return self.estado.get('db_inicializada', False)
 
+# =============================================================================
+# 1.8 POOL DE CONEXIONES SSH PERSISTENTES
+# =============================================================================
+
+class PoolConexionesSQL(PoolConexionesSSH):
+    """Pool SSH que además mantiene un trabajador SQL persistente por conexión"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trabajadores = {}     # id(ssh) -> TrabajadorSQLRemoto
+    
+    def _al_cerrar(self, ssh):
+        trabajador = self._trabajadores.pop(id(ssh), None)
+        if trabajador:
+            trabajador.cerrar()
+    
+    def obtener_trabajador_sql(self, ssh, db_path, timeout=30):
+        """Obtener (o arrancar) el trabajador SQL persistente de una conexión del pool"""
+        trabajador = self._trabajadores.get(id(ssh))
+        if trabajador is None or not trabajador.vivo:
+            trabajador = TrabajadorSQLRemoto.iniciar(ssh, db_path, timeout)
+            self._trabajadores[id(ssh)] = trabajador
+        return trabajador
+
+@st.cache_resource(show_spinner=False)
+def obtener_pool_conexiones(host, port, username, password, timeout=30,
+                            max_conexiones=4, keepalive=30, max_inactividad=300):
+    """Pool único por proceso y servidor: sobrevive a reruns y sesiones de Streamlit"""
+    pool = PoolConexionesSQL(host, port, username, password, timeout,
+                             max_conexiones, keepalive, max_inactividad)
+    atexit.register(pool.cerrar_todo)
+    return pool
+
 # =============================================================================
 # 2. GESTOR DE CONEXIÓN REMOTA VIA SSH
 # =============================================================================
 
 class GestorConexionRemota:
-    """Gestor de conexión SSH al servidor remoto - Base de datos única"""
+    """Gestor de conexión SSH al servidor remoto - Base de datos única.
+    
+    Hay una sola instancia por proceso (ver obtener_gestor_remoto), así que
+    la conexión en uso (ssh/sftp) se guarda por hilo: cada sesión de
+    Streamlit corre en su propio hilo y recibe su propia conexión del pool.
+    """
+    
+    # Segundos que vale el último resultado de verificar_existencia_db
+    INTERVALO_EXISTENCIA_DB = 60
     
     def __init__(self):
+        self._hilo = threading.local()
         self.ssh = None
         self.sftp = None
         self.config = None
+        self.db_path_remoto = None
+        self.pool = None
+        self.cache = None
+        self.trabajador_local = None
+        self.replica = None
+        self.retencion_respaldos = {'horas': 24, 'dias': 30, 'meses': 12}
+        # Último resultado de verificar_existencia_db, compartido por las sesiones
+        self._existencia_db = {'existe': None, 'momento': 0, 'hilo': None}
+        self._candado_existencia = threading.Lock()
         
         logger.info("📋 Cargando configuración desde secrets.toml...")
         self.config_completa = cargar_configuracion_completa()
@@ -532,9 +598,55 @@ class GestorConexionRemota:
         logger.info(f"🔗 Configuración SSH cargada para servidor remoto")
         logger.info(f"📁 Usando base de datos única: {self.db_path_remoto}")
         
-        # Probar conexión inicial
-        self.probar_conexion_inicial()
+        # Pool de conexiones compartido por el proceso
+        self.pool = obtener_pool_conexiones(
+            self.config['ssh_host'],
+            self.config['ssh_port'],
+            self.config['ssh_username'],
+            self.config['ssh_password'],
+            self.config['ssh_timeout'],
+            self.config['ssh_pool_max'],
+            self.config['ssh_keepalive'],
+            self.config['ssh_pool_idle']
+        )
+        
+        # Caché de lecturas compartida por el proceso
+        self.cache = obtener_cache_consultas(
+            self.config['cache_ttl'],
+            self.config['cache_max_entradas']
+        )
+        
+        # Réplica local opcional para lecturas
+        if self.config.get('replica_local'):
+            self.replica = obtener_replica_local(
+                self.pool,
+                self.db_path_remoto,
+                self.config['replica_ruta'],
+                self.config['replica_intervalo'],
+                self.config['replica_max_antiguedad'],
+                self.config['ssh_timeout']
+            )
+            # Lo cacheado pudo leerse de una copia anterior de la réplica
+            self.replica.al_cambiar = self.cache.limpiar
+        
+        # La conexión se prueba al inicializar el sistema (una vez por proceso), no aquí
+    
+    @property
+    def ssh(self):
+        return getattr(self._hilo, 'ssh', None)
     
+    @ssh.setter
+    def ssh(self, valor):
+        self._hilo.ssh = valor
+    
+    @property
+    def sftp(self):
+        return getattr(self._hilo, 'sftp', None)
+    
+    @sftp.setter
+    def sftp(self, valor):
+        self._hilo.sftp = valor
+
     def _cargar_configuracion(self):
         """Cargar configuración desde secrets.toml"""
         config = {}
@@ -548,7 +660,10 @@ class GestorConexionRemota:
                 'ssh_username': ssh_config.get('username', self.config_completa.get('remote_user', '')),
                 'ssh_password': ssh_config.get('password', self.config_completa.get('remote_password', '')),
                 'ssh_enabled': bool(ssh_config.get('enabled', True)),
-                'ssh_timeout': int(ssh_config.get('timeout', 30))
+                'ssh_timeout': int(ssh_config.get('timeout', 30)),
+                'ssh_keepalive': int(ssh_config.get('keepalive', 30)),
+                'ssh_pool_max': int(ssh_config.get('pool_max', 4)),
+                'ssh_pool_idle': int(ssh_config.get('pool_idle', 300))
             })
             
             # Configuración de rutas
@@ -576,7 +691,18 @@ class GestorConexionRemota:
                 'auto_connect': system_config.get('auto_connect', True),
                 'retry_attempts': system_config.get('retry_attempts', 3),
                 'retry_delay': system_config.get('retry_delay', 5),
-                'max_login_attempts': system_config.get('max_login_attempts', 5)
+                'max_login_attempts': system_config.get('max_login_attempts', 5),
+                'sql_worker': bool(system_config.get('sql_worker', True)),
+                'sql_compresion': bool(system_config.get('sql_compresion', True)),
+                'sql_filas_por_bloque': int(system_config.get('sql_filas_por_bloque', 1000)),
+                'cache_ttl': int(system_config.get('cache_ttl', 60)),
+                'cache_max_entradas': int(system_config.get('cache_max_entradas', 256)),
+                'replica_local': bool(system_config.get('replica_local', False)),
+                'replica_ruta': system_config.get('replica_ruta', '') or os.path.join(
+                    tempfile.gettempdir(), 'escuela_replica.db'
+                ),
+                'replica_intervalo': int(system_config.get('replica_intervalo', 30)),
+                'replica_max_antiguedad': int(system_config.get('replica_max_antiguedad', 0)) or None
             })
             
             logger.info("✅ Configuración cargada correctamente")
@@ -594,28 +720,13 @@ class GestorConexionRemota:
                 
             logger.info(f"🔍 Probando conexión SSH...")
             
-            ssh_test = paramiko.SSHClient()
-            ssh_test.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            ssh_test.connect(
-                hostname=self.config['ssh_host'],
-                port=self.config['ssh_port'],
-                username=self.config['ssh_username'],
-                password=self.config['ssh_password'],
-                timeout=self.config['ssh_timeout'],
-                banner_timeout=self.config['ssh_timeout'],
-                allow_agent=False,
-                look_for_keys=False
-            )
-            
-            # Verificar que la base de datos existe
-            stdin, stdout, stderr = ssh_test.exec_command(
-                f"test -f '{self.db_path_remoto}' && echo 'EXISTS' || echo 'NOT_FOUND'",
-                timeout=self.config['ssh_timeout']
-            )
-            output = stdout.read().decode().strip()
-            
-            ssh_test.close()
+            # Verificar que la base de datos existe (reutiliza la conexión del pool)
+            with self.pool.conexion() as ssh:
+                stdin, stdout, stderr = ssh.exec_command(
+                    f"test -f {shlex.quote(self.db_path_remoto)} && echo 'EXISTS' || echo 'NOT_FOUND'",
+                    timeout=self.config['ssh_timeout']
+                )
+                output = stdout.read().decode().strip()
             
             if output == 'EXISTS':
                 logger.info(f"✅ Conexión SSH exitosa y DB encontrada")
@@ -646,25 +757,12 @@ class GestorConexionRemota:
                 logger.error("No hay configuración SSH disponible")
                 return False
                 
-            logger.info(f"🔗 Conectando SSH...")
-            
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            self.ssh.connect(
-                hostname=self.config['ssh_host'],
-                port=self.config['ssh_port'],
-                username=self.config['ssh_username'],
-                password=self.config['ssh_password'],
-                timeout=self.config['ssh_timeout'],
-                banner_timeout=self.config['ssh_timeout'],
-                allow_agent=False,
-                look_for_keys=False
-            )
+            logger.debug(f"🔗 Obteniendo conexión SSH del pool...")
             
-            self.sftp = self.ssh.open_sftp()
+            self.ssh = self.pool.obtener()
+            self.sftp = self.pool.obtener_sftp(self.ssh)
             
-            logger.info(f"✅ Conexión SSH establecida")
+            logger.debug(f"✅ Conexión SSH establecida")
             from __main__ import estado_sistema
             if 'estado_sistema' in globals():
                 estado_sistema.set_ssh_conectado(True, None)
@@ -679,43 +777,183 @@ class GestorConexionRemota:
             return False
     
     def desconectar_ssh(self):
-        """Cerrar conexión SSH"""
+        """Devolver la conexión SSH al pool (no cierra el transporte)"""
         try:
-            if self.sftp:
-                self.sftp.close()
-            if self.ssh:
-                self.ssh.close()
-            logger.debug("🔌 Conexión SSH cerrada")
+            if self.ssh and self.pool:
+                if self.pool.liberar(self.ssh) == 0:
+                    self.ssh = None
+                    self.sftp = None
+            logger.debug("🔌 Conexión SSH devuelta al pool")
         except Exception as e:
-            logger.warning(f"⚠️ Error cerrando conexión SSH: {e}")
+            logger.warning(f"⚠️ Error liberando conexión SSH: {e}")
     
     def ejecutar_comando_remoto(self, comando, timeout=None):
         """Ejecutar comando en servidor remoto"""
         try:
-            if not self.ssh:
-                if not self.conectar_ssh():
-                    return None, None
+            if not self.pool:
+                return None, None
             
             if timeout is None:
                 timeout = self.config['ssh_timeout']
             
-            stdin, stdout, stderr = self.ssh.exec_command(comando, timeout=timeout)
-            
-            salida = stdout.read().decode('utf-8', errors='ignore').strip()
-            error = stderr.read().decode('utf-8', errors='ignore').strip()
-            
-            return salida, error
+            # Un reintento si el transporte del pool había caído
+            for intento in range(2):
+                try:
+                    with self.pool.conexion() as ssh:
+                        stdin, stdout, stderr = ssh.exec_command(comando, timeout=timeout)
+                        
+                        salida = stdout.read().decode('utf-8', errors='ignore').strip()
+                        error = stderr.read().decode('utf-8', errors='ignore').strip()
+                    
+                    return salida, error
+                except (paramiko.SSHException, EOFError, ConnectionError):
+                    if intento == 1:
+                        raise
+                    logger.warning("⚠️ Conexión SSH perdida, reconectando...")
             
         except Exception as e:
             logger.error(f"❌ Error ejecutando comando remoto: {e}")
             return None, str(e)
     
-    def ejecutar_sql_remoto(self, consulta_sql):
-        """Ejecutar SQL directamente en servidor remoto"""
+    def usar_trabajador_local(self, db_path):
+        """Sustituir el trabajador remoto por un subproceso local (pruebas sin servidor)"""
+        if self.trabajador_local:
+            self.trabajador_local.cerrar()
+        self.trabajador_local = TrabajadorSQLLocal(db_path)
+        logger.info(f"🧪 Usando trabajador SQL local sobre: {db_path}")
+    
+    def _en_trabajador(self, operacion, repetible=True):
+        """Ejecutar operacion(trabajador) en el trabajador SQL persistente.
+        
+        Un reintento en otro trabajador si el primero estaba caído. Si la
+        petición ya se envió (RespuestaPerdida) solo se repite cuando es
+        repetible, es decir, de lectura: una escritura pudo haberse aplicado.
+        TrabajadorNoIniciado no se reintenta: el servidor no puede correrlo.
+        """
+        if self.trabajador_local:
+            return operacion(self.trabajador_local)
+        
+        for intento in range(2):
+            try:
+                with self.pool.conexion() as ssh:
+                    trabajador = self.pool.obtener_trabajador_sql(
+                        ssh, self.db_path_remoto, self.config['ssh_timeout']
+                    )
+                    return operacion(trabajador)
+            except RespuestaPerdida:
+                if intento == 1 or not repetible:
+                    raise
+                logger.warning("⚠️ Respuesta del trabajador SQL perdida, repitiendo lectura...")
+            except (EOFError, paramiko.SSHException, ConnectionError, socket.timeout):
+                if intento == 1:
+                    raise
+                logger.warning("⚠️ Trabajador SQL no disponible, reiniciando...")
+    
+    @staticmethod
+    def _literal_sql(valor):
+        """Convertir un valor Python a literal SQL"""
+        if valor is None:
+            return 'NULL'
+        if isinstance(valor, bool):
+            return '1' if valor else '0'
+        if isinstance(valor, (int, float)):
+            return repr(valor)
+        return "'" + str(valor).replace("'", "''") + "'"
+    
+    @classmethod
+    def _sql_con_literales(cls, consulta_sql, params):
+        """Sustituir los '?' por literales (solo en modo CLI, que no admite parámetros enlazados)"""
+        if not params:
+            return consulta_sql
+        valores = iter(params)
+        # Las posiciones impares son literales de texto: sus '?' no se tocan
+        partes = re.split(r"('(?:[^']|'')*')", consulta_sql)
+        for i in range(0, len(partes), 2):
+            partes[i] = re.sub(r"\?", lambda _: cls._literal_sql(next(valores)), partes[i])
+        return ''.join(partes)
+    
+    def _ejecutar_sql_cli(self, consulta_sql, formato_json=True, params=None):
+        """Ejecutar SQL con un proceso sqlite3 por sentencia (modo de compatibilidad)"""
+        # Todo argumento va entre comillas simples (shlex.quote): el shell remoto no
+        # expande $(), comillas invertidas ni barras en los valores del usuario
+        consulta_sql = self._sql_con_literales(consulta_sql, params)
+        directorio = shlex.quote(os.path.dirname(self.db_path_remoto))
+        archivo = shlex.quote(os.path.basename(self.db_path_remoto))
+        opcion_json = "-json " if formato_json else ""
+        comando = f'cd {directorio} && sqlite3 {opcion_json}{archivo} {shlex.quote(consulta_sql)}'
+        return self.ejecutar_comando_remoto(comando)
+    
+    def _trabajador_disponible(self):
+        """Indica si se debe usar el trabajador persistente en lugar del CLI"""
+        return self.trabajador_local is not None or (
+            self.pool is not None and self.config.get('sql_worker', True)
+        )
+    
+    def _desactivar_trabajador(self, error):
+        """Volver al modo CLI si el servidor no puede arrancar el trabajador.
+        
+        Solo para TrabajadorNoIniciado: la configuración es compartida por todas
+        las sesiones del proceso y un timeout aislado no debe apagarlo para todas.
+        """
+        logger.warning(f"⚠️ Trabajador SQL persistente deshabilitado, usando sqlite3 CLI: {error}")
+        self.config['sql_worker'] = False
+    
+    def _replica_para(self, consulta_sql):
+        """Réplica local si puede responder esta lectura; None para ir al primario"""
+        if self.replica is None or self.trabajador_local is not None:
+            return None
+        if not CacheConsultas.es_lectura(consulta_sql) or not self.replica.lista():
+            return None
+        return self.replica
+    
+    def registrar_escritura(self, consulta_sql):
+        """Invalidar lo que una escritura ya aplicada en el primario deja obsoleto"""
+        if self.cache:
+            self.cache.invalidar_escritura(consulta_sql)
+        if self.replica:
+            self.replica.marcar_escritura()
+    
+    def ejecutar_sql_remoto(self, consulta_sql, params=None, primario=False):
+        """Ejecutar SQL directamente en servidor remoto.
+        
+        params: valores para los marcadores '?' de la consulta. Viajan por la
+        trama del trabajador sin escaparse en la línea de comandos. Con
+        primario la lectura no se sirve desde la réplica local.
+        """
         try:
-            comando = f"cd \"$(dirname \\\"{self.db_path_remoto}\\\")\" && sqlite3 -json \"{os.path.basename(self.db_path_remoto)}\" \"{consulta_sql.replace('\"', '\\\"')}\""
+            replica = None if primario else self._replica_para(consulta_sql)
+            if replica:
+                try:
+                    return replica.consultar(consulta_sql, params), None
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Réplica local no pudo responder, usando primario: {e}")
             
-            salida, error = self.ejecutar_comando_remoto(comando)
+            if self._trabajador_disponible():
+                repetible = CacheConsultas.es_lectura(consulta_sql)
+                try:
+                    filas, error = self._en_trabajador(
+                        lambda trabajador: trabajador.ejecutar(consulta_sql, params), repetible
+                    )
+                    if error:
+                        logger.error(f"❌ Error SQL remoto: {error}")
+                        return None, error
+                    return filas, None
+                except TrabajadorNoIniciado as e:
+                    if self.trabajador_local:
+                        raise
+                    self._desactivar_trabajador(e)
+                except RespuestaPerdida as e:
+                    if not repetible:
+                        logger.error(f"❌ Sentencia sin confirmar, no se repite: {e}")
+                        return None, str(e)
+                    logger.warning(f"⚠️ Lectura sin respuesta del trabajador, usando sqlite3 CLI: {e}")
+                except (EOFError, paramiko.SSHException, ConnectionError, socket.timeout) as e:
+                    # La petición no llegó a enviarse: el CLI la ejecuta una sola vez
+                    if self.trabajador_local:
+                        raise
+                    logger.warning(f"⚠️ Trabajador SQL no disponible, usando sqlite3 CLI: {e}")
+            
+            salida, error = self._ejecutar_sql_cli(consulta_sql, formato_json=True, params=params)
             
             if error and "Error:" in error:
                 logger.error(f"❌ Error SQL remoto: {error}")
@@ -735,12 +973,145 @@ class GestorConexionRemota:
             logger.error(f"❌ Error ejecutando SQL remoto: {e}", exc_info=True)
             return None, str(e)
     
-    def ejecutar_sql_modificacion(self, consulta_sql):
-        """Ejecutar SQL de modificación (INSERT, UPDATE, DELETE)"""
+    def consultar_dataframe(self, consulta_sql, params=None):
+        """Ejecutar una consulta y recibir el resultado como DataFrame por bloques columnares.
+        
+        Regresa (df, error). Sin trabajador persistente usa la salida JSON del CLI.
+        """
         try:
-            comando = f"cd \"$(dirname \\\"{self.db_path_remoto}\\\")\" && sqlite3 \"{os.path.basename(self.db_path_remoto)}\" \"{consulta_sql.replace('\"', '\\\"')}\""
+            replica = self._replica_para(consulta_sql)
+            if replica:
+                try:
+                    return replica.consultar_dataframe(consulta_sql, params), None
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Réplica local no pudo responder, usando primario: {e}")
+            
+            if self._trabajador_disponible():
+                opciones = {
+                    'filas_por_bloque': self.config.get('sql_filas_por_bloque', 1000),
+                    'comprimir': self.config.get('sql_compresion', True)
+                }
+                try:
+                    return self._en_trabajador(
+                        lambda trabajador: trabajador.consultar_columnar(consulta_sql, params, **opciones)
+                    )
+                except TrabajadorNoIniciado as e:
+                    if self.trabajador_local:
+                        raise
+                    self._desactivar_trabajador(e)
+                except (RespuestaPerdida, EOFError, paramiko.SSHException, ConnectionError, socket.timeout) as e:
+                    if self.trabajador_local:
+                        raise
+                    logger.warning(f"⚠️ Trabajador SQL no disponible, usando sqlite3 CLI: {e}")
+            
+            resultado, error = self.ejecutar_sql_remoto(consulta_sql, params)
+            if error:
+                return None, error
+            return pd.DataFrame(resultado if isinstance(resultado, list) else []), None
             
-            salida, error = self.ejecutar_comando_remoto(comando)
+        except Exception as e:
+            logger.error(f"❌ Error leyendo resultado columnar: {e}", exc_info=True)
+            return None, str(e)
+    
+    def ejecutar_lote_sql(self, consultas):
+        """Ejecutar N consultas con nombre en un solo viaje al servidor.
+        
+        consultas: dict nombre -> sql o nombre -> (sql, params).
+        Regresa (resultados, errores), ambos dict indexados por nombre.
+        """
+        try:
+            normalizadas = {
+                nombre: consulta if isinstance(consulta, tuple) else (consulta, None)
+                for nombre, consulta in consultas.items()
+            }
+            
+            if normalizadas and all(self._replica_para(sql) for sql, _ in normalizadas.values()):
+                resultados, errores = {}, {}
+                for nombre, (sql, params) in normalizadas.items():
+                    try:
+                        resultados[nombre] = self.replica.consultar(sql, params)
+                    except sqlite3.Error as e:
+                        errores[nombre] = f"Error: {e}"
+                return resultados, errores
+            
+            if self._trabajador_disponible():
+                repetible = all(CacheConsultas.es_lectura(sql) for sql, _ in normalizadas.values())
+                try:
+                    return self._en_trabajador(
+                        lambda trabajador: trabajador.ejecutar_lote(normalizadas), repetible
+                    )
+                except TrabajadorNoIniciado as e:
+                    if self.trabajador_local:
+                        raise
+                    self._desactivar_trabajador(e)
+                except RespuestaPerdida as e:
+                    if not repetible:
+                        logger.error(f"❌ Lote sin confirmar, no se repite: {e}")
+                        return {}, {nombre: str(e) for nombre in normalizadas}
+                    logger.warning(f"⚠️ Lote sin respuesta del trabajador, usando sqlite3 CLI: {e}")
+                except (EOFError, paramiko.SSHException, ConnectionError, socket.timeout) as e:
+                    if self.trabajador_local:
+                        raise
+                    logger.warning(f"⚠️ Trabajador SQL no disponible, usando sqlite3 CLI: {e}")
+            
+            return self._ejecutar_lote_cli(normalizadas)
+            
+        except Exception as e:
+            logger.error(f"❌ Error ejecutando lote SQL remoto: {e}", exc_info=True)
+            return {}, {nombre: str(e) for nombre in consultas}
+    
+    def _ejecutar_lote_cli(self, consultas):
+        """Lote en modo CLI: un solo comando remoto con un sqlite3 por consulta separado por marcas"""
+        archivo = shlex.quote(os.path.basename(self.db_path_remoto))
+        partes = [f'cd {shlex.quote(os.path.dirname(self.db_path_remoto))}']
+        for nombre, (sql, params) in consultas.items():
+            consulta = shlex.quote(self._sql_con_literales(sql, params))
+            partes.append(f"echo {shlex.quote('@@LOTE:' + nombre)}")
+            partes.append(f'sqlite3 -json {archivo} {consulta} 2>&1')
+        salida, error = self.ejecutar_comando_remoto("; ".join(partes))
+        
+        resultados, errores = {}, {}
+        bloques = re.split(r'^@@LOTE:(.*)$', salida or '', flags=re.MULTILINE)
+        for nombre, contenido in zip(bloques[1::2], bloques[2::2]):
+            contenido = contenido.strip()
+            if contenido.startswith(('Error', 'Parse error', 'Runtime error')):
+                errores[nombre] = contenido
+                continue
+            try:
+                resultados[nombre] = json.loads(contenido) if contenido else []
+            except json.JSONDecodeError:
+                errores[nombre] = contenido
+        for nombre in consultas:
+            if nombre not in resultados and nombre not in errores:
+                errores[nombre] = error or "Sin respuesta del servidor"
+        return resultados, errores
+    
+    def ejecutar_sql_modificacion(self, consulta_sql, params=None):
+        """Ejecutar SQL de modificación (INSERT, UPDATE, DELETE)"""
+        try:
+            if self._trabajador_disponible():
+                try:
+                    filas, error = self._en_trabajador(
+                        lambda trabajador: trabajador.ejecutar(consulta_sql, params), repetible=False
+                    )
+                    if error:
+                        logger.error(f"❌ Error en modificación SQL: {error}")
+                        return False, error
+                    return True, ""
+                except TrabajadorNoIniciado as e:
+                    if self.trabajador_local:
+                        raise
+                    self._desactivar_trabajador(e)
+                except RespuestaPerdida as e:
+                    # Pudo aplicarse: repetirla en otro trabajador o en el CLI la duplicaría
+                    logger.error(f"❌ Modificación SQL sin confirmar, no se repite: {e}")
+                    return False, str(e)
+                except (EOFError, paramiko.SSHException, ConnectionError, socket.timeout) as e:
+                    if self.trabajador_local:
+                        raise
+                    logger.warning(f"⚠️ Trabajador SQL no disponible, usando sqlite3 CLI: {e}")
+            
+            salida, error = self._ejecutar_sql_cli(consulta_sql, formato_json=False, params=params)
             
             if error:
                 logger.error(f"❌ Error en modificación SQL: {error}")
@@ -755,11 +1126,27 @@ class GestorConexionRemota:
     def verificar_existencia_db(self):
         """Verificar si la base de datos existe en servidor remoto"""
         try:
-            comando = f"test -f '{self.db_path_remoto}' && echo 'EXISTS' || echo 'NOT_FOUND'"
+            # Si el sondeo de fondo ya está preguntando, se usa su respuesta en vez de repetir la consulta
+            sondeo = self._existencia_db['hilo']
+            if sondeo is not None and sondeo is not threading.current_thread():
+                sondeo.join()
+            if self._existencia_db['existe'] and time.time() - self._existencia_db['momento'] < self.INTERVALO_EXISTENCIA_DB:
+                return True
+            
+            clave = ('existe_db', self.db_path_remoto, ())
+            if self.cache and self.cache.obtener(clave):
+                return True
+            
+            comando = f"test -f {shlex.quote(self.db_path_remoto)} && echo 'EXISTS' || echo 'NOT_FOUND'"
             salida, error = self.ejecutar_comando_remoto(comando)
             
-            if salida == 'EXISTS':
+            existe = salida == 'EXISTS'
+            with self._candado_existencia:
+                self._existencia_db.update(existe=existe, momento=time.time())
+            if existe:
                 logger.info(f"✅ Base de datos encontrada en servidor")
+                if self.cache:
+                    self.cache.guardar(clave, True, frozenset(), ())
                 return True
             else:
                 logger.warning(f"⚠️ Base de datos NO encontrada en servidor")
@@ -769,46 +1156,101 @@ class GestorConexionRemota:
             logger.error(f"❌ Error verificando existencia DB: {e}")
             return False
     
-    def crear_backup_remoto(self):
-        """Crear backup de la base de datos en servidor remoto"""
+    def estado_existencia_db(self):
+        """Último resultado de verificar_existencia_db sin esperar al servidor.
+        
+        Regresa True/False, o None mientras no hay resultado. Si el último
+        tiene más de INTERVALO_EXISTENCIA_DB segundos se vuelve a verificar en
+        un hilo aparte (como la prueba de conexión de aspirantes35): el render
+        actual muestra lo último conocido y el siguiente ya ve la respuesta.
+        """
+        with self._candado_existencia:
+            estado = self._existencia_db
+            if estado['hilo'] is None and time.time() - estado['momento'] >= self.INTERVALO_EXISTENCIA_DB:
+                estado['hilo'] = threading.Thread(target=self._sondear_existencia_db, name='sondeo_db', daemon=True)
+                estado['hilo'].start()
+            return estado['existe']
+    
+    def _sondear_existencia_db(self):
+        existe = False
         try:
-            backup_dir = self.config.get('backup_path', '/tmp')
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = f"{backup_dir}/escuela_backup_{timestamp}.db"
-            
-            comando = f"cp '{self.db_path_remoto}' '{backup_path}' && echo 'BACKUP_CREADO:{backup_path}' || echo 'ERROR_BACKUP'"
-            salida, error = self.ejecutar_comando_remoto(comando)
+            existe = self.verificar_existencia_db()
+        finally:
+            with self._candado_existencia:
+                # Un servidor que no responde cuenta como base no encontrada hasta el próximo sondeo
+                self._existencia_db.update(existe=existe, momento=time.time(), hilo=None)
+    
+    def _ruta_respaldos(self):
+        """Repositorio remoto de respaldos (por defecto junto a la base)"""
+        return self.config.get('backup_path') or f"{os.path.dirname(self.db_path_remoto)}/backups"
+    
+    def crear_backup_remoto(self, etiqueta='MANUAL'):
+        """Guardar una instantánea deduplicada de la base en el repositorio remoto.
+        
+        Regresa el resumen de la instantánea (id, tamaños, sha256 y el
+        resultado de la poda en 'poda') o None.
+        """
+        try:
+            with self.pool.conexion() as ssh:
+                repositorio = RepositorioRespaldos(ssh, self._ruta_respaldos())
+                info = repositorio.guardar(self.db_path_remoto, etiqueta)
+                logger.info(
+                    f"✅ Backup remoto {info['id']}: {info['bloques_nuevos']}/{info['total_bloques']} bloques nuevos, "
+                    f"{info['bytes_nuevos'] / 1024:.1f} KB escritos de {info['tamano'] / 1024:.1f} KB"
+                )
+                try:
+                    info['poda'] = repositorio.podar(**self.retencion_respaldos)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo aplicar la retención de backups: {e}")
             
-            if 'BACKUP_CREADO' in salida:
-                logger.info(f"✅ Backup remoto creado")
-                from __main__ import estado_sistema
-                if 'estado_sistema' in globals():
-                    estado_sistema.registrar_backup()
-                return True
-            else:
-                logger.error(f"❌ Error creando backup remoto: {error}")
-                return False
+            if 'estado_sistema' in globals():
+                estado_sistema.registrar_backup()
+            return info
             
         except Exception as e:
             logger.error(f"❌ Error en backup remoto: {e}")
-            return False
+            return None
+    
+    def restaurar_backup_remoto(self, instantanea):
+        """Reconstruir una instantánea en el servidor; regresa la ruta remota de la copia o None"""
+        try:
+            with self.pool.conexion() as ssh:
+                info = RepositorioRespaldos(ssh, self._ruta_respaldos()).restaurar(
+                    instantanea, f"{self._ruta_respaldos()}/restauraciones/{instantanea}.db"
+                )
+            logger.info(f"♻️ Instantánea {instantanea} reconstruida en {info['ruta']} ({info['segundos']:.1f}s)")
+            return info['ruta']
+        except Exception as e:
+            logger.error(f"❌ Error restaurando la instantánea {instantanea}: {e}")
+            return None
+    
+    def verificar_backups_remotos(self):
+        """Verificar bloque por bloque el repositorio de respaldos (None si no responde)"""
+        try:
+            with self.pool.conexion() as ssh:
+                return RepositorioRespaldos(ssh, self._ruta_respaldos()).verificar()
+        except Exception as e:
+            logger.error(f"❌ Error verificando el repositorio de backups: {e}")
+            return None
     
     def subir_archivo_remoto(self, archivo_local, ruta_remota):
         """Subir archivo directamente al servidor remoto"""
         try:
-            if not self.sftp:
-                if not self.conectar_ssh():
-                    return False
+            if not self.conectar_ssh():
+                return False
             
-            # Crear directorio remoto si no existe
-            remote_dir = os.path.dirname(ruta_remota)
             try:
-                self.sftp.stat(remote_dir)
-            except:
-                self._crear_directorio_remoto_recursivo(remote_dir)
-            
-            # Subir archivo
-            self.sftp.put(archivo_local, ruta_remota)
+                # Crear directorio remoto si no existe
+                remote_dir = os.path.dirname(ruta_remota)
+                try:
+                    self.sftp.stat(remote_dir)
+                except:
+                    self._crear_directorio_remoto_recursivo(remote_dir)
+                
+                # Subir archivo
+                self.sftp.put(archivo_local, ruta_remota)
+            finally:
+                self.desconectar_ssh()
             
             logger.info(f"✅ Archivo subido a servidor: {ruta_remota}")
             return True
@@ -837,6 +1279,664 @@ class GestorConexionRemota:
         """Verificar estado de conexión SSH"""
         return self.probar_conexion_inicial()
 
+# =============================================================================
+# 2.1 TRABAJADOR SQL PERSISTENTE (PROTOCOLO POR TRAMAS)
+# =============================================================================
+
+# Script que corre como proceso de larga duración junto a la base de datos.
+# Cada petición y respuesta es una trama: 4 bytes big-endian con la longitud
+# seguidos de un documento JSON. La conexión SQLite queda abierta entre
+# peticiones, así que el esquema se analiza una sola vez por proceso, y los
+# valores viajan como parámetros enlazados: la caché de sentencias
+# preparadas de sqlite3 (indexada por el texto SQL) reutiliza las sentencias
+# compiladas de las consultas repetidas de paginación y búsqueda. Los BLOB
+# viajan en ambos sentidos como {"__b64__": "..."} para no pasar por str().
+SCRIPT_TRABAJADOR_SQL = r'''
+import sys, json, struct, sqlite3, zlib, base64, unicodedata
+db = sqlite3.connect(sys.argv[1], isolation_level=None, check_same_thread=False, cached_statements=256)
+db.execute("PRAGMA busy_timeout = 5000")
+def normalizar_busqueda(texto):
+    # Misma regla que IndiceBusquedaTexto.normalizar: NFKD sin marcas combinantes, minúsculas
+    texto = unicodedata.normalize("NFKD", "" if texto is None else str(texto))
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+db.create_function("normalizar_busqueda", 1, normalizar_busqueda)
+entrada, salida = sys.stdin.buffer, sys.stdout.buffer
+def leer(n):
+    datos = b""
+    while len(datos) < n:
+        bloque = entrada.read(n - len(datos))
+        if not bloque:
+            return None
+        datos += bloque
+    return datos
+def codificar(valor):
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return {"__b64__": base64.b64encode(bytes(valor)).decode("ascii")}
+    return str(valor)
+def decodificar(objeto):
+    if len(objeto) == 1 and "__b64__" in objeto:
+        return base64.b64decode(objeto["__b64__"])
+    return objeto
+def ejecutar(sql, params):
+    try:
+        try:
+            cur = db.execute(sql, params)
+        except (sqlite3.Warning, sqlite3.ProgrammingError):
+            if params:
+                raise
+            cur = db.executescript(sql)
+    except Exception:
+        # Un script que falla a la mitad deja su BEGIN abierto en la conexión
+        if db.in_transaction:
+            db.rollback()
+        raise
+    if cur.description:
+        columnas = [d[0] for d in cur.description]
+        return [dict(zip(columnas, f)) for f in cur.fetchall()]
+    return []
+def enviar(datos):
+    salida.write(struct.pack(">I", len(datos)) + datos)
+    salida.flush()
+def tipo_de(valores):
+    # Tipo de una columna dentro de un bloque; SQLite admite tipos mezclados por fila
+    clases = set(type(v) for v in valores if v is not None)
+    if not clases:
+        return "null"
+    if clases == {int}:
+        return "integer"
+    if clases <= {int, float}:
+        return "real"
+    if bytes in clases:
+        return "blob"
+    return "text"
+def enviar_columnar(peticion):
+    # Cabecera con las columnas, luego bloques (opcionalmente comprimidos) con
+    # sus propios tipos y una trama vacía como fin de flujo
+    try:
+        cur = db.execute(peticion["sql"], peticion.get("params") or ())
+        columnas = [d[0] for d in cur.description] if cur.description else []
+        tamano = int(peticion.get("filas_por_bloque") or 1000)
+        bloque = cur.fetchmany(tamano) if columnas else []
+    except Exception as e:
+        enviar(json.dumps({"ok": False, "error": "Error: " + str(e)}).encode("utf-8"))
+        return
+    comprimir = bool(peticion.get("comprimir"))
+    enviar(json.dumps({"ok": True, "columnas": columnas, "comprimido": comprimir}).encode("utf-8"))
+    try:
+        while bloque:
+            valores = [list(c) for c in zip(*bloque)]
+            datos = json.dumps({"tipos": [tipo_de(c) for c in valores], "valores": valores},
+                               default=codificar).encode("utf-8")
+            enviar(zlib.compress(datos, 6) if comprimir else datos)
+            bloque = cur.fetchmany(tamano)
+    except Exception as e:
+        datos = json.dumps({"error": "Error: " + str(e)}).encode("utf-8")
+        enviar(zlib.compress(datos, 6) if comprimir else datos)
+    enviar(b"")
+# Trama de arranque: el cliente distingue un trabajador que no pudo iniciar
+# (sin python3, script roto) de un canal que se cayó después
+enviar(json.dumps({"ok": True, "listo": True}).encode("utf-8"))
+while True:
+    cabecera = leer(4)
+    if cabecera is None:
+        break
+    peticion = json.loads(leer(struct.unpack(">I", cabecera)[0]).decode("utf-8"), object_hook=decodificar)
+    if peticion.get("formato") == "columnar":
+        enviar_columnar(peticion)
+        continue
+    if "lote" in peticion:
+        resultados, errores = {}, {}
+        for consulta in peticion["lote"]:
+            try:
+                resultados[consulta["nombre"]] = ejecutar(consulta["sql"], consulta.get("params") or ())
+            except Exception as e:
+                errores[consulta["nombre"]] = "Error: " + str(e)
+        respuesta = {"ok": True, "resultados": resultados, "errores": errores}
+    else:
+        try:
+            respuesta = {"ok": True, "filas": ejecutar(peticion["sql"], peticion.get("params") or ())}
+        except Exception as e:
+            respuesta = {"ok": False, "error": "Error: " + str(e)}
+    datos = json.dumps(respuesta, default=codificar).encode("utf-8")
+    salida.write(struct.pack(">I", len(datos)) + datos)
+    salida.flush()
+'''
+
+class TrabajadorNoIniciado(Exception):
+    """El trabajador SQL no pudo arrancar en el servidor (no es un fallo transitorio)"""
+
+class RespuestaPerdida(Exception):
+    """La petición ya se envió pero la respuesta no llegó: no se sabe si se ejecutó"""
+
+class TrabajadorSQL:
+    """Cliente del protocolo por tramas del trabajador SQL persistente.
+    
+    Trabaja sobre cualquier par de flujos binarios (canal SSH o pipes de un
+    subproceso local), de modo que el mismo código sirve en producción y en
+    pruebas sin servidor.
+    """
+    
+    def __init__(self, escritor, lector, al_cerrar=None):
+        self.escritor = escritor
+        self.lector = lector
+        self.al_cerrar = al_cerrar
+        self.vivo = True
+        self.peticiones = 0
+    
+    def _leer_exacto(self, n):
+        datos = b""
+        while len(datos) < n:
+            bloque = self.lector.read(n - len(datos))
+            if not bloque:
+                raise EOFError("El trabajador SQL cerró el canal")
+            datos += bloque
+        return datos
+    
+    @staticmethod
+    def _codificar(valor):
+        if isinstance(valor, (bytes, bytearray, memoryview)):
+            return {'__b64__': base64.b64encode(bytes(valor)).decode('ascii')}
+        raise TypeError(f"Tipo no admitido como parámetro SQL: {type(valor).__name__}")
+    
+    @staticmethod
+    def _decodificar(objeto):
+        if len(objeto) == 1 and '__b64__' in objeto:
+            return base64.b64decode(objeto['__b64__'])
+        return objeto
+    
+    def _cargar(self, trama):
+        return json.loads(trama.decode('utf-8'), object_hook=self._decodificar)
+    
+    def _enviar_trama(self, peticion):
+        datos = json.dumps(peticion, default=self._codificar).encode('utf-8')
+        self.escritor.write(struct.pack('>I', len(datos)) + datos)
+        self.escritor.flush()
+    
+    def _leer_trama(self):
+        longitud = struct.unpack('>I', self._leer_exacto(4))[0]
+        return self._leer_exacto(longitud) if longitud else b""
+    
+    def esperar_listo(self):
+        """Leer la trama con la que el trabajador anuncia que arrancó"""
+        try:
+            self._leer_trama()
+        except Exception:
+            self.cerrar()
+            raise
+    
+    def _intercambiar(self, peticion):
+        """Enviar una trama de petición y leer la trama de respuesta.
+        
+        Si falla el envío la petición no llegó y se puede repetir; si falla la
+        lectura se lanza RespuestaPerdida, porque la sentencia pudo ejecutarse.
+        """
+        try:
+            self._enviar_trama(peticion)
+        except Exception:
+            # Cualquier fallo de transporte deja el protocolo desincronizado
+            self.cerrar()
+            raise
+        try:
+            respuesta = self._cargar(self._leer_trama())
+            self.peticiones += 1
+            return respuesta
+        except Exception as e:
+            self.cerrar()
+            raise RespuestaPerdida(f"Sin respuesta del trabajador SQL: {e}") from e
+    
+    # Tipos SQLite reportados por el trabajador -> dtype de pandas. Los enteros
+    # se dejan a la inferencia de pandas (int64, o float64 si hay nulos), igual
+    # que al construir el DataFrame desde una lista de diccionarios.
+    TIPOS_PANDAS = {'real': 'float64', 'text': object, 'blob': object}
+    
+    def consultar_columnar(self, sql, params=None, filas_por_bloque=1000, comprimir=True):
+        """Leer un resultado por bloques columnares y decodificarlo directo a DataFrame.
+        
+        Solo se mantiene en memoria un bloque crudo a la vez. Regresa (df, error).
+        """
+        try:
+            self._enviar_trama({
+                'sql': sql,
+                'params': list(params or ()),
+                'formato': 'columnar',
+                'filas_por_bloque': filas_por_bloque,
+                'comprimir': comprimir
+            })
+            
+            cabecera = json.loads(self._leer_trama().decode('utf-8'))
+            self.peticiones += 1
+            if not cabecera.get('ok'):
+                return None, cabecera.get('error', 'Error desconocido')
+            
+            columnas = cabecera.get('columnas', [])
+            partes = {columna: [] for columna in columnas}
+            error = None
+            
+            while True:
+                trama = self._leer_trama()
+                if not trama:
+                    break
+                if cabecera.get('comprimido'):
+                    trama = zlib.decompress(trama)
+                bloque = self._cargar(trama)
+                if 'error' in bloque:
+                    error = bloque['error'] or 'Error desconocido'
+                    continue
+                # Los tipos vienen con cada bloque: una columna puede no tener valores en el primero
+                for columna, tipo, valores in zip(columnas, bloque['tipos'], bloque['valores']):
+                    if tipo == 'null':
+                        # Se resuelve al final con el dtype que tenga el resto de la columna
+                        partes[columna].append(len(valores))
+                        continue
+                    try:
+                        serie = pd.Series(valores, dtype=self.TIPOS_PANDAS.get(tipo))
+                    except (ValueError, TypeError):
+                        serie = pd.Series(valores, dtype=object)
+                    partes[columna].append(serie)
+            
+            if error:
+                return None, error
+            
+            df = pd.DataFrame({
+                columna: self._unir_bloques(series) for columna, series in partes.items()
+            }, columns=columnas)
+            return df, None
+            
+        except Exception:
+            self.cerrar()
+            raise
+    
+    @staticmethod
+    def _unir_bloques(series):
+        """Concatenar los bloques de una columna; los bloques solo con NULL toman su dtype"""
+        dtype = next((serie.dtype for serie in series if not isinstance(serie, int)), object)
+        if dtype != object and dtype.kind in 'iu':
+            dtype = 'float64'
+        series = [
+            pd.Series([None] * serie, dtype=dtype) if isinstance(serie, int) else serie
+            for serie in series
+        ]
+        return pd.concat(series, ignore_index=True) if series else pd.Series(dtype=object)
+    
+    def ejecutar(self, sql, params=None):
+        """Enviar una sentencia y esperar su respuesta. Regresa (filas, error)"""
+        respuesta = self._intercambiar({'sql': sql, 'params': list(params or ())})
+        if not respuesta.get('ok'):
+            return None, respuesta.get('error', 'Error desconocido')
+        return respuesta.get('filas', []), None
+    
+    def ejecutar_lote(self, consultas):
+        """Ejecutar varias consultas con nombre en una sola trama. Regresa (resultados, errores)"""
+        lote = [
+            {'nombre': nombre, 'sql': sql, 'params': list(params or ())}
+            for nombre, (sql, params) in consultas.items()
+        ]
+        respuesta = self._intercambiar({'lote': lote})
+        return respuesta.get('resultados', {}), respuesta.get('errores', {})
+    
+    def cerrar(self):
+        """Cerrar el trabajador y liberar el canal o proceso"""
+        if not self.vivo:
+            return
+        self.vivo = False
+        try:
+            self.escritor.close()
+            if self.al_cerrar:
+                self.al_cerrar()
+        except Exception as e:
+            logger.debug(f"Error cerrando trabajador SQL: {e}")
+
+class TrabajadorSQLRemoto(TrabajadorSQL):
+    """Trabajador SQL que corre en el servidor sobre un canal de la conexión del pool"""
+    
+    @classmethod
+    def iniciar(cls, ssh, db_path, timeout=30):
+        comando = f"python3 -c {shlex.quote(SCRIPT_TRABAJADOR_SQL)} {shlex.quote(db_path)}"
+        stdin, stdout, stderr = ssh.exec_command(comando)
+        stdout.channel.settimeout(timeout)
+        trabajador = cls(stdin, stdout, al_cerrar=stdout.channel.close)
+        try:
+            trabajador.esperar_listo()
+        except EOFError:
+            # Con el transporte vivo, un EOF antes de la trama de arranque es que el proceso terminó
+            transporte = ssh.get_transport()
+            if transporte is not None and transporte.is_active():
+                error = stderr.read().decode('utf-8', errors='ignore').strip()
+                raise TrabajadorNoIniciado(error or "El trabajador SQL terminó al arrancar")
+            raise
+        logger.info("🧵 Trabajador SQL remoto iniciado")
+        return trabajador
+
+class TrabajadorSQLLocal(TrabajadorSQL):
+    """Sustituto local del trabajador remoto: mismo protocolo sobre un subproceso"""
+    
+    def __init__(self, db_path):
+        self.proceso = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT_TRABAJADOR_SQL, db_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        super().__init__(self.proceso.stdin, self.proceso.stdout, al_cerrar=self.proceso.wait)
+        try:
+            self.esperar_listo()
+        except EOFError:
+            raise TrabajadorNoIniciado("El trabajador SQL local terminó al arrancar")
+
+# =============================================================================
+# 2.2 CACHÉ COMPARTIDA DE CONSULTAS
+# =============================================================================
+
+class CacheConsultas:
+    """Caché de resultados de lectura compartida por todas las sesiones del proceso.
+    
+    Las entradas se indexan por SQL normalizado y parámetros, expiran por TTL y
+    se desalojan por LRU. Cada escritura incrementa la versión de las tablas
+    que toca y descarta los resultados que dependían de ellas; un resultado
+    leído mientras cambiaba la versión de sus tablas no se guarda.
+    """
+    
+    PATRON_LECTURA = re.compile(r'\b(?:FROM|JOIN)\s+["`\[]?(\w+)', re.IGNORECASE)
+    PATRON_ESCRITURA = re.compile(
+        r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM'
+        r'|ALTER\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|CREATE\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?)'
+        r'\s+["`\[]?(\w+)',
+        re.IGNORECASE
+    )
+    
+    def __init__(self, ttl=60, max_entradas=256):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()   # clave -> (valor, expira, tablas)
+        self._versiones = {}             # tabla -> versión
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+    
+    @staticmethod
+    def es_lectura(consulta_sql):
+        """Solo se cachean sentencias SELECT/WITH"""
+        return consulta_sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+    
+    def clave(self, tipo, consulta_sql, params=None):
+        return (tipo, ' '.join(consulta_sql.split()), tuple(params or ()))
+    
+    def tablas_leidas(self, consulta_sql):
+        return frozenset(t.lower() for t in self.PATRON_LECTURA.findall(consulta_sql))
+    
+    def tablas_escritas(self, consulta_sql):
+        return frozenset(t.lower() for t in self.PATRON_ESCRITURA.findall(consulta_sql))
+    
+    def version(self, tablas):
+        """Instantánea de versiones de las tablas antes de consultar"""
+        with self._lock:
+            return tuple(self._versiones.get(tabla, 0) for tabla in sorted(tablas))
+    
+    @staticmethod
+    def _copiar(valor):
+        # Los resultados se comparten entre sesiones: nunca entregar el objeto guardado
+        if isinstance(valor, pd.DataFrame):
+            return valor.copy()
+        if isinstance(valor, list):
+            return [dict(fila) if isinstance(fila, dict) else fila for fila in valor]
+        return valor
+    
+    def obtener(self, clave):
+        """Regresa una copia del valor cacheado o None si no hay entrada vigente"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[1] < time.time():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            valor = entrada[0]
+        return self._copiar(valor)
+    
+    def guardar(self, clave, valor, tablas, version):
+        """Guardar un resultado si sus tablas no cambiaron durante la consulta"""
+        if valor is None:
+            return
+        valor = self._copiar(valor)
+        with self._lock:
+            if tuple(self._versiones.get(tabla, 0) for tabla in sorted(tablas)) != version:
+                return
+            self._entradas[clave] = (valor, time.time() + self.ttl, tablas)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+    
+    def invalidar_escritura(self, consulta_sql):
+        """Invalidar los resultados que dependen de las tablas modificadas"""
+        tablas = self.tablas_escritas(consulta_sql)
+        with self._lock:
+            self.invalidaciones += 1
+            if not tablas:
+                # No se pudo determinar la tabla: invalidar todo por seguridad
+                for tabla in list(self._versiones):
+                    self._versiones[tabla] += 1
+                self._entradas.clear()
+                return
+            for tabla in tablas:
+                self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
+            obsoletas = [c for c, (_, _, dependencias) in self._entradas.items() if dependencias & tablas]
+            for clave in obsoletas:
+                del self._entradas[clave]
+        logger.debug(f"🧹 Caché invalidada para: {', '.join(sorted(tablas))}")
+    
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+    
+    def obtener_estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': (self.aciertos / total * 100) if total else 0.0
+            }
+
+@st.cache_resource(show_spinner=False)
+def obtener_cache_consultas(ttl=60, max_entradas=256):
+    """Caché única por proceso, compartida entre reruns y sesiones de Streamlit"""
+    return CacheConsultas(ttl, max_entradas)
+
+# =============================================================================
+# 2.3 RÉPLICA LOCAL DE LECTURA
+# =============================================================================
+
+class ReplicaLocal:
+    """Copia local de la base remota para servir lecturas sin viaje por SSH.
+    
+    Un hilo en segundo plano compara cada `intervalo` segundos la firma de la
+    base remota (tamaño y mtime en ns de la base y del WAL, más el contador
+    de cambios del encabezado) y, si cambió, toma una instantánea consistente
+    con la API de backup de SQLite en el servidor y la reemplaza atómicamente
+    en local. Las escrituras siguen yendo al primario; después de una escritura
+    propia las lecturas vuelven al primario hasta la siguiente verificación,
+    así que la sesión siempre lee lo que acaba de escribir.
+    """
+    
+    SCRIPT_FIRMA = r'''
+import os, sys
+ruta = sys.argv[1]
+partes = []
+for archivo in (ruta, ruta + '-wal'):
+    try:
+        info = os.stat(archivo)
+        partes.append('%d:%d' % (info.st_size, info.st_mtime_ns))
+    except OSError:
+        partes.append('-')
+with open(ruta, 'rb') as base:
+    base.seek(24)
+    partes.append(base.read(4).hex())
+print(' '.join(partes))
+'''
+    
+    SCRIPT_INSTANTANEA = r'''
+import os, sys, sqlite3, tempfile
+descriptor, destino = tempfile.mkstemp(prefix='escuela_replica_', suffix='.db')
+os.close(descriptor)
+origen = sqlite3.connect(sys.argv[1])
+copia = sqlite3.connect(destino)
+origen.backup(copia)
+copia.close()
+origen.close()
+print(destino)
+'''
+    
+    def __init__(self, pool, db_path_remoto, ruta_local, intervalo=30, max_antiguedad=None, timeout=30):
+        self.pool = pool
+        self.db_path_remoto = db_path_remoto
+        self.ruta_local = ruta_local
+        self.intervalo = intervalo
+        self.max_antiguedad = max_antiguedad or intervalo * 4
+        self.timeout = timeout
+        
+        self._bloqueo = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        
+        self.firma = None
+        self.ultima_copia = None
+        self.ultima_verificacion = None
+        self._ultima_escritura = 0.0
+        self.ultimo_error = None
+        self.al_cambiar = None
+        self.estadisticas = {'verificaciones': 0, 'copias': 0, 'lecturas': 0, 'errores': 0}
+    
+    def iniciar(self):
+        """Arrancar el hilo de refresco (idempotente)"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ciclo, name="replica-local", daemon=True)
+        self._hilo.start()
+        logger.info(f"📦 Réplica local activa en {self.ruta_local} (cada {self.intervalo}s)")
+    
+    def detener(self):
+        self._detener.set()
+    
+    def _ciclo(self):
+        while not self._detener.is_set():
+            self.refrescar()
+            self._detener.wait(self.intervalo)
+    
+    def _ejecutar_python(self, ssh, script, *argumentos):
+        comando = " ".join(["python3", "-c", shlex.quote(script)] + [shlex.quote(a) for a in argumentos])
+        stdin, stdout, stderr = ssh.exec_command(comando, timeout=self.timeout)
+        salida = stdout.read().decode('utf-8', errors='ignore').strip()
+        error = stderr.read().decode('utf-8', errors='ignore').strip()
+        if stdout.channel.recv_exit_status() != 0:
+            raise Exception(error or "Error ejecutando script remoto")
+        return salida
+    
+    def _copiar(self, ssh):
+        """Instantánea remota consistente -> archivo local reemplazado atómicamente"""
+        remoto_temp = self._ejecutar_python(ssh, self.SCRIPT_INSTANTANEA, self.db_path_remoto)
+        local_temp = f"{self.ruta_local}.descarga"
+        try:
+            self.pool.obtener_sftp(ssh).get(remoto_temp, local_temp)
+            os.replace(local_temp, self.ruta_local)
+        finally:
+            ssh.exec_command(f"rm -f {shlex.quote(remoto_temp)}", timeout=self.timeout)
+            if os.path.exists(local_temp):
+                os.remove(local_temp)
+    
+    def refrescar(self):
+        """Verificar la firma remota y copiar la base si cambió"""
+        with self._bloqueo:
+            try:
+                inicio = time.time()
+                with self.pool.conexion() as ssh:
+                    firma = self._ejecutar_python(ssh, self.SCRIPT_FIRMA, self.db_path_remoto)
+                    self.estadisticas['verificaciones'] += 1
+                    
+                    cambio = firma != self.firma or not os.path.exists(self.ruta_local)
+                    if cambio:
+                        self._copiar(ssh)
+                        self.firma = firma
+                        self.ultima_copia = time.time()
+                        self.estadisticas['copias'] += 1
+                        logger.debug(f"📦 Réplica local actualizada ({os.path.getsize(self.ruta_local)} bytes)")
+                
+                # La copia refleja al primario al menos hasta el momento en que se leyó la firma
+                self.ultima_verificacion = inicio
+                self.ultimo_error = None
+                if cambio and self.al_cambiar:
+                    self.al_cambiar()
+                return True
+            except Exception as e:
+                self.estadisticas['errores'] += 1
+                self.ultimo_error = str(e)
+                logger.warning(f"⚠️ No se pudo refrescar la réplica local: {e}")
+                return False
+    
+    def marcar_escritura(self):
+        """Una escritura al primario deja la réplica atrasada hasta la siguiente verificación"""
+        self._ultima_escritura = time.time()
+    
+    def antiguedad(self):
+        """Cota superior, en segundos, del atraso de la réplica respecto al primario"""
+        if self.ultima_verificacion is None:
+            return None
+        return time.time() - self.ultima_verificacion
+    
+    def lista(self):
+        """La réplica puede servir lecturas: existe, es reciente y no hay escrituras propias pendientes"""
+        antiguedad = self.antiguedad()
+        return (
+            antiguedad is not None
+            and antiguedad <= self.max_antiguedad
+            and self._ultima_escritura < self.ultima_verificacion
+            and os.path.exists(self.ruta_local)
+        )
+    
+    def _conectar(self):
+        conn = sqlite3.connect(f"file:{self.ruta_local}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def consultar(self, consulta_sql, params=None):
+        """Filas como lista de dict, igual que el trabajador remoto"""
+        conn = self._conectar()
+        try:
+            self.estadisticas['lecturas'] += 1
+            return [dict(fila) for fila in conn.execute(consulta_sql, params or [])]
+        finally:
+            conn.close()
+    
+    def consultar_dataframe(self, consulta_sql, params=None):
+        conn = self._conectar()
+        try:
+            self.estadisticas['lecturas'] += 1
+            return pd.read_sql_query(consulta_sql, conn, params=params or None)
+        finally:
+            conn.close()
+    
+    def obtener_estado(self):
+        return {
+            'lista': self.lista(),
+            'antiguedad': self.antiguedad(),
+            'max_antiguedad': self.max_antiguedad,
+            'ultima_copia': self.ultima_copia,
+            'ultimo_error': self.ultimo_error,
+            **self.estadisticas
+        }
+
+@st.cache_resource(show_spinner=False)
+def obtener_replica_local(_pool, db_path_remoto, ruta_local, intervalo=30, max_antiguedad=None, timeout=30):
+    """Réplica única por proceso; el hilo de refresco sobrevive a reruns y sesiones"""
+    replica = ReplicaLocal(_pool, db_path_remoto, ruta_local, intervalo, max_antiguedad, timeout)
+    replica.iniciar()
+    atexit.register(replica.detener)
+    return replica
+
 # =============================================================================
 # 3. SISTEMA DE BASE DE DATOS SQLITE - BASE DE DATOS ÚNICA (COMPLETO CON TODOS LOS MÉTODOS)
 # =============================================================================
@@ -844,18 +1944,77 @@ class GestorConexionRemota:
 class SistemaBaseDatos:
     """Sistema de base de datos SQLite con base de datos única - COMPLETO CON TODOS LOS MÉTODOS"""
     
+    # Entidad -> (columnas, campos de búsqueda, columna de orden)
+    ENTIDADES_PAGINADAS = {
+        'inscritos': ('*', ['matricula', 'nombre_completo', 'email', 'folio_unico'], 'fecha_registro'),
+        'estudiantes': ('*', ['matricula', 'nombre_completo', 'email'], 'fecha_ingreso'),
+        'egresados': ('*', ['matricula', 'nombre_completo', 'email'], 'fecha_graduacion'),
+        'contratados': ('*', ['matricula', 'nombre_completo', 'email'], 'fecha_contratacion'),
+        'usuarios': (
+            """id, usuario, rol, nombre_completo, email, matricula, activo, 
+                       fecha_creacion, fecha_actualiza, categoria, nombre""",
+            ['usuario', 'nombre_completo', 'email', 'matricula'],
+            'fecha_creacion'
+        ),
+    }
+    
+    _esquema_migrado = False
+    _indices_busqueda_verificados = False
+    _tablas_fts = set()
+    # Cada cuánto revisa el hilo de indexación las colas que llenan las otras aplicaciones
+    INTERVALO_SINCRONIZACION_FTS = 30
+    # Tablas que se cuentan en el mismo lote que el listado (se actualiza con cada listado)
+    _tablas_conocidas = set(ENTIDADES_PAGINADAS)
+    
     def __init__(self, gestor_remoto):
         self.gestor = gestor_remoto
         self.page_size = 20
+        # Hilo que vacía las colas del índice de búsqueda fuera de las lecturas
+        self._aviso_indices = threading.Event()
+        self._detener_indices = threading.Event()
+        self._hilo_indices = None
+    
+    def _leer_con_cache(self, tipo, consulta_sql, params, consultar):
+        """Resolver una lectura desde la caché compartida o ejecutarla y guardarla"""
+        cache = self.gestor.cache
+        if cache is None or not CacheConsultas.es_lectura(consulta_sql):
+            return consultar()
+        
+        clave = cache.clave(tipo, consulta_sql, params)
+        valor = cache.obtener(clave)
+        if valor is not None:
+            return valor
+        
+        tablas = cache.tablas_leidas(consulta_sql)
+        version = cache.version(tablas)
+        valor = consultar()
+        cache.guardar(clave, valor, tablas, version)
+        return valor
     
-    def ejecutar_consulta_remota(self, consulta_sql):
-        """Ejecutar consulta SQL en servidor remoto - MÉTODO CORREGIDO"""
+    def ejecutar_consulta_remota(self, consulta_sql, params=None, usar_cache=True):
+        """Ejecutar consulta SQL en servidor remoto - MÉTODO CORREGIDO
+        
+        Con usar_cache=False la lectura va al primario sin pasar por la caché
+        compartida ni por la réplica, y su resultado no se guarda: es lo que
+        usan la autenticación y las demás lecturas de credenciales, que no
+        pueden ver un hash o un estado `activo` de hasta un minuto atrás.
+        """
         try:
-            resultado, error = self.gestor.ejecutar_sql_remoto(consulta_sql)
+            def consultar():
+                resultado, error = self.gestor.ejecutar_sql_remoto(consulta_sql, params, primario=not usar_cache)
+                if error:
+                    logger.error(f"❌ Error en consulta remota: {error}")
+                    return None
+                return resultado
             
-            if error:
-                logger.error(f"❌ Error en consulta remota: {error}")
-                return None
+            if usar_cache:
+                resultado = self._leer_con_cache('filas', consulta_sql, params, consultar)
+            else:
+                resultado = consultar()
+            
+            if not CacheConsultas.es_lectura(consulta_sql):
+                self.gestor.registrar_escritura(consulta_sql)
+                self._aviso_indices.set()
             
             return resultado
             
@@ -863,10 +2022,124 @@ class SistemaBaseDatos:
             logger.error(f"❌ Error ejecutando consulta remota: {e}")
             return None
     
-    def ejecutar_modificacion_remota(self, consulta_sql):
+    def consultar_dataframe_remoto(self, consulta_sql, params=None):
+        """Ejecutar consulta remota y regresar un DataFrame tipado (None si falla)"""
+        try:
+            def consultar():
+                df, error = self.gestor.consultar_dataframe(consulta_sql, params)
+                if error:
+                    logger.error(f"❌ Error en consulta remota: {error}")
+                    return None
+                return df
+            
+            return self._leer_con_cache('dataframe', consulta_sql, params, consultar)
+            
+        except Exception as e:
+            logger.error(f"❌ Error ejecutando consulta remota: {e}")
+            return None
+    
+    def obtener_tabla_completa(self, tabla, orden=None):
+        """Leer una tabla completa (p. ej. inscritos o bitacora) en bloques con memoria acotada"""
+        try:
+            nombres_validos = self.ejecutar_consulta_remota(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name = ?", [tabla]
+            )
+            if not nombres_validos:
+                logger.warning(f"⚠️ Tabla no encontrada: {tabla}")
+                return pd.DataFrame()
+            
+            consulta = f'SELECT * FROM "{tabla}"'
+            if orden:
+                consulta += f' ORDER BY "{orden}"'
+            
+            df = self.consultar_dataframe_remoto(consulta)
+            return df if df is not None else pd.DataFrame()
+            
+        except Exception as e:
+            logger.error(f"❌ Error leyendo tabla completa {tabla}: {e}")
+            return pd.DataFrame()
+    
+    def ejecutar_lote_remoto(self, consultas):
+        """Ejecutar varias consultas con nombre en un solo viaje. Regresa dict nombre -> filas (None si falló)"""
+        try:
+            cache = self.gestor.cache
+            finales = {}
+            pendientes = {}
+            claves = {}
+            
+            # Resolver desde la caché y enviar al servidor solo lo que falte
+            for nombre, consulta in consultas.items():
+                sql, params = consulta if isinstance(consulta, tuple) else (consulta, None)
+                if cache and CacheConsultas.es_lectura(sql):
+                    clave = cache.clave('filas', sql, params)
+                    valor = cache.obtener(clave)
+                    if valor is not None:
+                        finales[nombre] = valor
+                        continue
+                    tablas = cache.tablas_leidas(sql)
+                    claves[nombre] = (clave, tablas, cache.version(tablas))
+                pendientes[nombre] = consulta
+            
+            if pendientes:
+                resultados, errores = self.gestor.ejecutar_lote_sql(pendientes)
+                
+                for nombre, error in errores.items():
+                    logger.error(f"❌ Error en consulta '{nombre}' del lote: {error}")
+                
+                for nombre in pendientes:
+                    finales[nombre] = resultados.get(nombre)
+                    if nombre in claves and finales[nombre] is not None:
+                        cache.guardar(claves[nombre][0], finales[nombre], *claves[nombre][1:])
+            
+            return {nombre: finales.get(nombre) for nombre in consultas}
+            
+        except Exception as e:
+            logger.error(f"❌ Error ejecutando lote remoto: {e}")
+            return {nombre: None for nombre in consultas}
+    
+    def contar_registros_tablas(self):
+        """Contar registros de todas las tablas en un solo viaje.
+        
+        El listado de tablas va en el mismo lote que los conteos de las tablas
+        ya conocidas; solo si aparece una tabla nueva se cuenta en un segundo
+        viaje, y desde ahí queda en el lote.
+        """
+        try:
+            listado = '__tablas__'
+            conocidas = sorted(SistemaBaseDatos._tablas_conocidas)
+            lote = {listado: "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"}
+            lote.update({nombre: f'SELECT COUNT(*) as total FROM "{nombre}"' for nombre in conocidas})
+            conteos = self.ejecutar_lote_remoto(lote)
+            
+            tablas = conteos.pop(listado, None)
+            if not tablas:
+                return []
+            
+            nombres = [tabla.get('name', '') for tabla in tablas if tabla.get('name')]
+            SistemaBaseDatos._tablas_conocidas = set(nombres)
+            nuevas = [nombre for nombre in nombres if nombre not in conocidas]
+            if nuevas:
+                conteos.update(self.ejecutar_lote_remoto({
+                    nombre: f'SELECT COUNT(*) as total FROM "{nombre}"' for nombre in nuevas
+                }))
+            
+            return [
+                (nombre, conteos[nombre][0].get('total', 0) if conteos.get(nombre) else 0)
+                for nombre in nombres
+            ]
+            
+        except Exception as e:
+            logger.error(f"❌ Error contando registros por tabla: {e}")
+            return []
+    
+    def ejecutar_modificacion_remota(self, consulta_sql, params=None):
         """Ejecutar modificación SQL en servidor remoto - MÉTODO CORREGIDO"""
         try:
-            exito, resultado = self.gestor.ejecutar_sql_modificacion(consulta_sql)
+            exito, resultado = self.gestor.ejecutar_sql_modificacion(consulta_sql, params)
+            
+            # Invalidar siempre: una escritura fallida pudo aplicarse parcialmente
+            self.gestor.registrar_escritura(consulta_sql)
+            self._aviso_indices.set()
             
             if not exito:
                 logger.error(f"❌ Error en modificación remota: {resultado}")
@@ -882,14 +2155,14 @@ class SistemaBaseDatos:
         """VERIFICACIÓN DE USUARIO CORREGIDA - Usa la estructura REAL de la tabla"""
         try:
             # Consulta usando la estructura REAL de la tabla
-            query = f"""
+            query = """
             SELECT id, usuario, password_hash, salt, rol, nombre_completo, email, activo 
             FROM usuarios 
-            WHERE usuario = '{usuario}' AND activo = 1
+            WHERE usuario = ? AND activo = 1
             LIMIT 1
             """
             
-            resultados = self.ejecutar_consulta_remota(query)
+            resultados = self.ejecutar_consulta_remota(query, [usuario], usar_cache=False)
             
             if not resultados or len(resultados) == 0:
                 logger.warning(f"Usuario no encontrado o no activo: {usuario}")
@@ -963,15 +2236,15 @@ class SistemaBaseDatos:
                 new_salt = hashed_password_str
             
             # Actualizar en la base de datos usando la estructura REAL
-            consulta = f"""
+            consulta = """
             UPDATE usuarios 
-            SET password_hash = '{hashed_password_str}',
-                salt = '{new_salt}',
+            SET password_hash = ?,
+                salt = ?,
                 fecha_actualiza = CURRENT_TIMESTAMP
-            WHERE usuario = '{usuario}'
+            WHERE usuario = ?
             """
             
-            exito = self.ejecutar_modificacion_remota(consulta)
+            exito = self.ejecutar_modificacion_remota(consulta, [hashed_password_str, new_salt, usuario])
             
             if exito:
                 logger.info(f"✅ Password actualizado a bcrypt para usuario: {usuario}")
@@ -991,7 +2264,7 @@ class SistemaBaseDatos:
             
             # Consulta usando la estructura REAL
             consulta = "SELECT COUNT(*) as count FROM usuarios WHERE usuario = 'admin'"
-            resultado = self.ejecutar_consulta_remota(consulta)
+            resultado = self.ejecutar_consulta_remota(consulta, usar_cache=False)
             
             if resultado and len(resultado) > 0:
                 count = resultado[0].get('count', 0)
@@ -1005,15 +2278,15 @@ class SistemaBaseDatos:
                     hashed_password_str = hashed_password.decode('utf-8')
                     
                     # Construir consulta INSERT basada en la estructura REAL
-                    consulta_insert = f"""
+                    consulta_insert = """
                     INSERT INTO usuarios (
                         usuario, password_hash, salt, rol, nombre_completo, 
                         email, matricula, activo, fecha_creacion, fecha_actualiza,
                         categoria, nombre
                     ) VALUES (
                         'admin',
-                        '{hashed_password_str}',
-                        '{hashed_password_str}',
+                        ?,
+                        ?,
                         'administrador',
                         'Administrador del Sistema',
                         'admin@escuela.edu.mx',
@@ -1028,7 +2301,9 @@ class SistemaBaseDatos:
                     
                     logger.debug(f"Consulta INSERT para usuario admin: {consulta_insert}")
                     
-                    exito = self.ejecutar_modificacion_remota(consulta_insert)
+                    exito = self.ejecutar_modificacion_remota(
+                        consulta_insert, [hashed_password_str, hashed_password_str]
+                    )
                     
                     if exito:
                         logger.info("✅ Usuario 'admin' creado exitosamente")
@@ -1049,7 +2324,7 @@ class SistemaBaseDatos:
                     FROM usuarios 
                     WHERE usuario = 'admin'
                     """
-                    resultado_hash = self.ejecutar_consulta_remota(consulta_hash)
+                    resultado_hash = self.ejecutar_consulta_remota(consulta_hash, usar_cache=False)
                     
                     if resultado_hash and len(resultado_hash) > 0:
                         password_hash = resultado_hash[0].get('password_hash', '')
@@ -1081,25 +2356,25 @@ class SistemaBaseDatos:
             folio_unico = f"FOL{timestamp}"
             
             # Construir consulta INSERT para inscrito
-            consulta = f"""
+            consulta = """
             INSERT INTO inscritos (
                 matricula, nombre_completo, email, telefono, programa_interes,
                 fecha_nacimiento, documentos_subidos, estatus, fecha_registro, folio_unico
-            ) VALUES (
-                '{matricula}',
-                '{inscrito_data.get('nombre_completo', '').replace("'", "''")}',
-                '{inscrito_data.get('email', '').replace("'", "''")}',
-                '{inscrito_data.get('telefono', '').replace("'", "''")}',
-                '{inscrito_data.get('programa_interes', '').replace("'", "''")}',
-                '{inscrito_data.get('fecha_nacimiento', '')}',
-                {inscrito_data.get('documentos_subidos', 0)},
-                '{inscrito_data.get('estatus', 'Pre-inscrito').replace("'", "''")}',
-                CURRENT_TIMESTAMP,
-                '{folio_unico}'
-            )
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
             """
-            
-            exito = self.ejecutar_modificacion_remota(consulta)
+            params = [
+                matricula,
+                inscrito_data.get('nombre_completo', ''),
+                inscrito_data.get('email', ''),
+                inscrito_data.get('telefono', ''),
+                inscrito_data.get('programa_interes', ''),
+                str(inscrito_data.get('fecha_nacimiento', '')),
+                inscrito_data.get('documentos_subidos', 0),
+                inscrito_data.get('estatus', 'Pre-inscrito'),
+                folio_unico
+            ]
+            
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Inscrito agregado: {inscrito_data.get('nombre_completo', '')}")
@@ -1115,18 +2390,13 @@ class SistemaBaseDatos:
     def registrar_bitacora(self, usuario, tipo_accion, descripcion):
         """Registrar en bitácora"""
         try:
-            consulta = f"""
+            consulta = """
             INSERT INTO bitacora (
                 usuario, tipo_accion, descripcion, fecha_accion
-            ) VALUES (
-                '{usuario.replace("'", "''")}',
-                '{tipo_accion.replace("'", "''")}',
-                '{descripcion.replace("'", "''")}',
-                CURRENT_TIMESTAMP
-            )
+            ) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             """
             
-            exito = self.ejecutar_modificacion_remota(consulta)
+            exito = self.ejecutar_modificacion_remota(consulta, [usuario, tipo_accion, descripcion])
             
             if exito:
                 logger.debug(f"Bitácora registrada: {usuario} - {tipo_accion}")
@@ -1149,24 +2419,25 @@ class SistemaBaseDatos:
             else:
                 matricula = estudiante_data.get('matricula')
             
-            consulta = f"""
+            consulta = """
             INSERT INTO estudiantes (
                 matricula, nombre_completo, email, telefono, programa,
                 semestre, promedio, fecha_ingreso, estatus
-            ) VALUES (
-                '{matricula}',
-                '{estudiante_data.get('nombre_completo', '').replace("'", "''")}',
-                '{estudiante_data.get('email', '').replace("'", "''")}',
-                '{estudiante_data.get('telefono', '').replace("'", "''")}',
-                '{estudiante_data.get('programa', '').replace("'", "''")}',
-                {estudiante_data.get('semestre', 1)},
-                {estudiante_data.get('promedio', 0.0)},
-                '{estudiante_data.get('fecha_ingreso', datetime.now().strftime('%Y-%m-%d'))}',
-                '{estudiante_data.get('estatus', 'Activo').replace("'", "''")}'
-            )
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            
-            exito = self.ejecutar_modificacion_remota(consulta)
+            params = [
+                matricula,
+                estudiante_data.get('nombre_completo', ''),
+                estudiante_data.get('email', ''),
+                estudiante_data.get('telefono', ''),
+                estudiante_data.get('programa', ''),
+                estudiante_data.get('semestre', 1),
+                estudiante_data.get('promedio', 0.0),
+                str(estudiante_data.get('fecha_ingreso', datetime.now().strftime('%Y-%m-%d'))),
+                estudiante_data.get('estatus', 'Activo')
+            ]
+            
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Estudiante agregado: {estudiante_data.get('nombre_completo', '')}")
@@ -1182,24 +2453,25 @@ class SistemaBaseDatos:
     def agregar_egresado(self, egresado_data):
         """Agregar nuevo egresado"""
         try:
-            consulta = f"""
+            consulta = """
             INSERT INTO egresados (
                 matricula, nombre_completo, email, programa, fecha_graduacion,
                 promedio_final, titulo_obtenido, cedula_profesional, estatus_laboral
-            ) VALUES (
-                '{egresado_data.get('matricula', '').replace("'", "''")}',
-                '{egresado_data.get('nombre_completo', '').replace("'", "''")}',
-                '{egresado_data.get('email', '').replace("'", "''")}',
-                '{egresado_data.get('programa', '').replace("'", "''")}',
-                '{egresado_data.get('fecha_graduacion', datetime.now().strftime('%Y-%m-%d'))}',
-                {egresado_data.get('promedio_final', 0.0)},
-                '{egresado_data.get('titulo_obtenido', '').replace("'", "''")}',
-                '{egresado_data.get('cedula_profesional', '').replace("'", "''")}',
-                '{egresado_data.get('estatus_laboral', 'Desempleado').replace("'", "''")}'
-            )
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            
-            exito = self.ejecutar_modificacion_remota(consulta)
+            params = [
+                egresado_data.get('matricula', ''),
+                egresado_data.get('nombre_completo', ''),
+                egresado_data.get('email', ''),
+                egresado_data.get('programa', ''),
+                str(egresado_data.get('fecha_graduacion', datetime.now().strftime('%Y-%m-%d'))),
+                egresado_data.get('promedio_final', 0.0),
+                egresado_data.get('titulo_obtenido', ''),
+                egresado_data.get('cedula_profesional', ''),
+                egresado_data.get('estatus_laboral', 'Desempleado')
+            ]
+            
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Egresado agregado: {egresado_data.get('nombre_completo', '')}")
@@ -1215,24 +2487,25 @@ class SistemaBaseDatos:
     def agregar_contratado(self, contratado_data):
         """Agregar nuevo contratado"""
         try:
-            consulta = f"""
+            consulta = """
             INSERT INTO contratados (
                 matricula, nombre_completo, email, empresa, puesto,
                 fecha_contratacion, salario, tipo_contrato, estatus
-            ) VALUES (
-                '{contratado_data.get('matricula', '').replace("'", "''")}',
-                '{contratado_data.get('nombre_completo', '').replace("'", "''")}',
-                '{contratado_data.get('email', '').replace("'", "''")}',
-                '{contratado_data.get('empresa', '').replace("'", "''")}',
-                '{contratado_data.get('puesto', '').replace("'", "''")}',
-                '{contratado_data.get('fecha_contratacion', datetime.now().strftime('%Y-%m-%d'))}',
-                {contratado_data.get('salario', 0.0)},
-                '{contratado_data.get('tipo_contrato', 'Indeterminado').replace("'", "''")}',
-                '{contratado_data.get('estatus', 'Activo').replace("'", "''")}'
-            )
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            
-            exito = self.ejecutar_modificacion_remota(consulta)
+            params = [
+                contratado_data.get('matricula', ''),
+                contratado_data.get('nombre_completo', ''),
+                contratado_data.get('email', ''),
+                contratado_data.get('empresa', ''),
+                contratado_data.get('puesto', ''),
+                str(contratado_data.get('fecha_contratacion', datetime.now().strftime('%Y-%m-%d'))),
+                contratado_data.get('salario', 0.0),
+                contratado_data.get('tipo_contrato', 'Indeterminado'),
+                contratado_data.get('estatus', 'Activo')
+            ]
+            
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Contratado agregado: {contratado_data.get('nombre_completo', '')}")
@@ -1254,28 +2527,27 @@ class SistemaBaseDatos:
             hashed_password_str = hashed_password.decode('utf-8')
             
             # Construir consulta INSERT basada en la estructura REAL
-            consulta = f"""
+            consulta = """
             INSERT INTO usuarios (
                 usuario, password_hash, salt, rol, nombre_completo, 
                 email, matricula, activo, fecha_creacion, fecha_actualiza,
                 categoria, nombre
-            ) VALUES (
-                '{usuario_data.get('usuario', '').replace("'", "''")}',
-                '{hashed_password_str}',
-                '{hashed_password_str}',
-                '{usuario_data.get('rol', 'administrador').replace("'", "''")}',
-                '{usuario_data.get('nombre_completo', usuario_data.get('usuario', '')).replace("'", "''")}',
-                '{usuario_data.get('email', '').replace("'", "''")}',
-                '{usuario_data.get('matricula', '').replace("'", "''")}',
-                {1 if usuario_data.get('activo', True) else 0},
-                CURRENT_TIMESTAMP,
-                CURRENT_TIMESTAMP,
-                '{usuario_data.get('categoria', usuario_data.get('rol', 'administrador')).replace("'", "''")}',
-                '{usuario_data.get('nombre_completo', usuario_data.get('usuario', '')).replace("'", "''")}'
-            )
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?)
             """
-            
-            exito = self.ejecutar_modificacion_remota(consulta)
+            params = [
+                usuario_data.get('usuario', ''),
+                hashed_password_str,
+                hashed_password_str,
+                usuario_data.get('rol', 'administrador'),
+                usuario_data.get('nombre_completo', usuario_data.get('usuario', '')),
+                usuario_data.get('email', ''),
+                usuario_data.get('matricula', ''),
+                1 if usuario_data.get('activo', True) else 0,
+                usuario_data.get('categoria', usuario_data.get('rol', 'administrador')),
+                usuario_data.get('nombre_completo', usuario_data.get('usuario', ''))
+            ]
+            
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Usuario agregado: {usuario_data.get('usuario', '')}")
@@ -1290,18 +2562,26 @@ class SistemaBaseDatos:
     def actualizar_usuario(self, usuario_id, usuario_data):
         """Actualizar usuario existente"""
         try:
-            consulta = f"""
+            consulta = """
             UPDATE usuarios 
-            SET rol = '{usuario_data.get('rol', '').replace("'", "''")}',
-                nombre_completo = '{usuario_data.get('nombre_completo', '').replace("'", "''")}',
-                email = '{usuario_data.get('email', '').replace("'", "''")}',
-                matricula = '{usuario_data.get('matricula', '').replace("'", "''")}',
-                activo = {1 if usuario_data.get('activo', True) else 0},
+            SET rol = ?,
+                nombre_completo = ?,
+                email = ?,
+                matricula = ?,
+                activo = ?,
                 fecha_actualiza = CURRENT_TIMESTAMP
-            WHERE id = {usuario_id}
+            WHERE id = ?
             """
+            params = [
+                usuario_data.get('rol', ''),
+                usuario_data.get('nombre_completo', ''),
+                usuario_data.get('email', ''),
+                usuario_data.get('matricula', ''),
+                1 if usuario_data.get('activo', True) else 0,
+                int(usuario_id)
+            ]
             
-            exito = self.ejecutar_modificacion_remota(consulta)
+            exito = self.ejecutar_modificacion_remota(consulta, params)
             
             if exito:
                 logger.info(f"Usuario actualizado: ID {usuario_id}")
@@ -1317,9 +2597,9 @@ class SistemaBaseDatos:
     def eliminar_usuario(self, usuario_id):
         """Eliminar usuario"""
         try:
-            consulta = f"DELETE FROM usuarios WHERE id = {usuario_id}"
+            consulta = "DELETE FROM usuarios WHERE id = ?"
             
-            exito = self.ejecutar_modificacion_remota(consulta)
+            exito = self.ejecutar_modificacion_remota(consulta, [int(usuario_id)])
             
             if exito:
                 logger.info(f"Usuario eliminado: ID {usuario_id}")
@@ -1337,35 +2617,16 @@ class SistemaBaseDatos:
         try:
             estadisticas = {}
             
-            # Obtener conteo de inscritos
-            consulta_inscritos = "SELECT COUNT(*) as total FROM inscritos"
-            resultado_inscritos = self.ejecutar_consulta_remota(consulta_inscritos)
-            if resultado_inscritos and len(resultado_inscritos) > 0:
-                estadisticas['total_inscritos'] = resultado_inscritos[0].get('total', 0)
-            
-            # Obtener conteo de estudiantes
-            consulta_estudiantes = "SELECT COUNT(*) as total FROM estudiantes"
-            resultado_estudiantes = self.ejecutar_consulta_remota(consulta_estudiantes)
-            if resultado_estudiantes and len(resultado_estudiantes) > 0:
-                estadisticas['total_estudiantes'] = resultado_estudiantes[0].get('total', 0)
-            
-            # Obtener conteo de egresados
-            consulta_egresados = "SELECT COUNT(*) as total FROM egresados"
-            resultado_egresados = self.ejecutar_consulta_remota(consulta_egresados)
-            if resultado_egresados and len(resultado_egresados) > 0:
-                estadisticas['total_egresados'] = resultado_egresados[0].get('total', 0)
-            
-            # Obtener conteo de contratados
-            consulta_contratados = "SELECT COUNT(*) as total FROM contratados"
-            resultado_contratados = self.ejecutar_consulta_remota(consulta_contratados)
-            if resultado_contratados and len(resultado_contratados) > 0:
-                estadisticas['total_contratados'] = resultado_contratados[0].get('total', 0)
-            
-            # Obtener conteo de usuarios
-            consulta_usuarios = "SELECT COUNT(*) as total FROM usuarios"
-            resultado_usuarios = self.ejecutar_consulta_remota(consulta_usuarios)
-            if resultado_usuarios and len(resultado_usuarios) > 0:
-                estadisticas['total_usuarios'] = resultado_usuarios[0].get('total', 0)
+            # Todos los conteos en un solo viaje al servidor
+            tablas = ['inscritos', 'estudiantes', 'egresados', 'contratados', 'usuarios']
+            resultados = self.ejecutar_lote_remoto({
+                tabla: f"SELECT COUNT(*) as total FROM {tabla}" for tabla in tablas
+            })
+            
+            for tabla in tablas:
+                resultado = resultados.get(tabla)
+                if resultado and len(resultado) > 0:
+                    estadisticas[f'total_{tabla}'] = resultado[0].get('total', 0)
             
             logger.debug(f"Estadísticas obtenidas: {estadisticas}")
             return estadisticas
@@ -1374,112 +2635,464 @@ class SistemaBaseDatos:
             logger.error(f"Error obteniendo estadísticas: {e}")
             return {}
     
-    def obtener_inscritos(self, page=1, search_term=""):
-        """Obtener inscritos con paginación y búsqueda"""
+    # Paginación por cursor: cada página se delimita por la llave (orden, id)
+    # de su primera/última fila, así que la página N cuesta lo mismo que la 1.
+    
+    @staticmethod
+    def _codificar_token(direccion, valor_orden, id_registro):
+        """Serializar la llave de corte de una página como token opaco"""
+        crudo = json.dumps({'d': direccion, 'k': [valor_orden, id_registro]}, default=str)
+        return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decodificar_token(token):
+        """Recuperar (dirección, valor_orden, id) de un token; None si es inválido"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            if search_term:
-                consulta = f"""
-                SELECT * FROM inscritos 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%' 
-                   OR folio_unico LIKE '%{search_term}%'
-                ORDER BY fecha_registro DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
+            datos = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            valor_orden, id_registro = datos['k']
+            if datos['d'] not in ('sig', 'ant'):
+                return None
+            return datos['d'], valor_orden, id_registro
+        except Exception:
+            return None
+    
+    @staticmethod
+    def _expresion_orden(orden):
+        """Expresión de orden del cursor: los NULL se ordenan como '' (igual que en el índice)"""
+        return f"COALESCE({orden}, '')"
+    
+    @classmethod
+    def _condicion_cursor(cls, orden, direccion, valor_orden, id_registro):
+        """Filas después ('sig', DESC) o antes ('ant') de la llave (orden, id).
+        
+        Se compara la misma expresión COALESCE que ordena y que indexa la
+        migración 5: una fila con fecha NULL queda en el orden como '' y el
+        corte la alcanza. La comparación va expandida en lugar de por valor de
+        fila, que SQLite no usa para buscar en un índice de expresión.
+        """
+        expresion = cls._expresion_orden(orden)
+        valor_orden = '' if valor_orden is None else valor_orden
+        comparador = '<' if direccion == 'sig' else '>'
+        return (
+            f"({expresion} {comparador}= ? AND ({expresion} {comparador} ? OR id {comparador} ?))",
+            [valor_orden, valor_orden, id_registro]
+        )
+    
+    @staticmethod
+    def _llave_fila(df, posicion, orden):
+        """Llave (orden, id) de una fila del DataFrame como tipos nativos JSON"""
+        fila = df.iloc[posicion]
+        llave = []
+        for campo in (orden, 'id'):
+            valor = fila[campo]
+            if hasattr(valor, 'item'):
+                valor = valor.item()
+            if isinstance(valor, pd.Timestamp):
+                valor = str(valor)
+            if campo == orden and pd.isna(valor):
+                valor = ''
+            llave.append(valor)
+        return llave
+    
+    def _marcadores_paginacion(self, tabla, search_term):
+        """Tokens conocidos por número de página para la sesión actual"""
+        try:
+            marcadores = st.session_state.setdefault('marcadores_paginacion', {})
+        except Exception:
+            marcadores = self.__dict__.setdefault('_marcadores_paginacion', {})
+        return marcadores.setdefault((tabla, search_term, self.page_size), {})
+    
+    def _sincronizar_indice_busqueda(self, tabla):
+        """Vaciar la cola de pendientes de una tabla en su índice.
+        
+        Solo el trabajador SQL registra normalizar_busqueda; por la CLI el
+        script falla y la cola espera, sin afectar el resultado de las
+        búsquedas (las filas pendientes se resuelven con LIKE).
+        """
+        _, campos_busqueda, _ = self.ENTIDADES_PAGINADAS[tabla]
+        script = IndiceBusquedaTexto.script_sincronizacion(tabla, campos_busqueda)
+        try:
+            exito, resultado = self.gestor.ejecutar_sql_modificacion(script)
+            if exito:
+                self.gestor.registrar_escritura(script)
             else:
-                consulta = f"""
-                SELECT * FROM inscritos 
-                ORDER BY fecha_registro DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            
-            resultado = self.ejecutar_consulta_remota(consulta)
-            
-            if resultado is None:
-                return pd.DataFrame(), 0, 0
-            
-            df = pd.DataFrame(resultado)
-            
-            # Obtener total de registros
-            if search_term:
-                count_consulta = f"""
-                SELECT COUNT(*) as total FROM inscritos 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%' 
-                   OR folio_unico LIKE '%{search_term}%'
-                """
+                logger.debug(f"Cola del índice de búsqueda de {tabla} sin vaciar: {resultado}")
+            return exito
+        except Exception as e:
+            logger.debug(f"Cola del índice de búsqueda de {tabla} sin vaciar: {e}")
+            return False
+    
+    def _tablas_con_pendientes(self):
+        """Tablas indexadas cuya cola tiene filas, en una sola lectura sin bloqueo de escritura"""
+        tablas = sorted(SistemaBaseDatos._tablas_fts)
+        if not tablas:
+            return []
+        consulta = " UNION ALL ".join(
+            f"SELECT '{tabla}' AS tabla WHERE EXISTS (SELECT 1 FROM {IndiceBusquedaTexto.tabla_pendientes(tabla)})"
+            for tabla in tablas
+        )
+        filas, error = self.gestor.ejecutar_sql_remoto(consulta, primario=True)
+        if error:
+            logger.debug(f"No se pudieron revisar las colas del índice de búsqueda: {error}")
+            return []
+        return [fila.get('tabla') for fila in filas or []]
+    
+    def vaciar_colas_busqueda(self):
+        """Pasar al índice las colas que tengan filas; las vacías no abren transacción"""
+        return {tabla: self._sincronizar_indice_busqueda(tabla) for tabla in self._tablas_con_pendientes()}
+    
+    def iniciar_indexacion(self):
+        """Arrancar el hilo que vacía las colas del índice (idempotente).
+        
+        Corre al arranque, después de cada escritura de esta aplicación y cada
+        INTERVALO_SINCRONIZACION_FTS segundos para las filas que encolan las
+        otras aplicaciones; las búsquedas nunca esperan ni escriben.
+        """
+        if self._hilo_indices and self._hilo_indices.is_alive():
+            return
+        self._detener_indices.clear()
+        self._hilo_indices = threading.Thread(target=self._ciclo_indexacion, name="indice-busqueda", daemon=True)
+        self._hilo_indices.start()
+    
+    def detener_indexacion(self):
+        self._detener_indices.set()
+        self._aviso_indices.set()
+    
+    def _ciclo_indexacion(self):
+        while not self._detener_indices.is_set():
+            self._aviso_indices.clear()
+            try:
+                self.vaciar_colas_busqueda()
+            except Exception as e:
+                logger.debug(f"Colas del índice de búsqueda sin vaciar: {e}")
+            self._aviso_indices.wait(self.INTERVALO_SINCRONIZACION_FTS)
+    
+    def _filtro_busqueda(self, tabla, campos_busqueda, search_term):
+        """Condición de búsqueda y sus parámetros.
+        
+        Con índice FTS disponible y término de al menos tres caracteres la
+        búsqueda resuelve los ids en el índice de trigramas; las filas que
+        siguen en la cola de pendientes (su entrada del índice falta o es
+        vieja) se evalúan con LIKE. Sin índice o con término corto cae al
+        LIKE sobre cada campo.
+        """
+        if not search_term:
+            return None, []
+        
+        condicion = "(" + " OR ".join(f"{campo} LIKE ?" for campo in campos_busqueda) + ")"
+        params = [f"%{search_term}%"] * len(campos_busqueda)
+        
+        if tabla in SistemaBaseDatos._tablas_fts:
+            consulta_match = IndiceBusquedaTexto.consulta_match(search_term)
+            if consulta_match:
+                fts = IndiceBusquedaTexto.tabla_fts(tabla)
+                pendientes = IndiceBusquedaTexto.tabla_pendientes(tabla)
+                return (
+                    f"((id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?) "
+                    f"AND id NOT IN (SELECT id FROM {pendientes})) "
+                    f"OR (id IN (SELECT id FROM {pendientes}) AND {condicion}))"
+                ), [consulta_match] + params
+        
+        return condicion, params
+    
+    def _consultar_keyset(self, tabla, columnas, campos_busqueda, orden, token=None, search_term=""):
+        """Página por cursor sobre (orden, id) DESC.
+        
+        Sin token regresa la primera página; un token 'sig' avanza después de
+        la llave que contiene y uno 'ant' retrocede antes de ella. Regresa
+        (df, token_siguiente, token_anterior, total); los tokens son None en
+        los extremos. Se pide una fila extra para saber si hay más allá del
+        corte. El total viaja en la misma sentencia como subconsulta escalar
+        sobre la búsqueda sin cursor: COUNT(*) OVER() contaría solo las filas
+        posteriores al corte.
+        """
+        condicion, params = self._filtro_busqueda(tabla, campos_busqueda, search_term)
+        condiciones = [condicion] if condicion else []
+        
+        where_busqueda = ("WHERE " + condiciones[0]) if condiciones else ""
+        params = params + params
+        
+        direccion = None
+        if token:
+            decodificado = self._decodificar_token(token)
+            if decodificado is None:
+                logger.warning(f"⚠️ Token de paginación inválido para {tabla}, regresando a la primera página")
             else:
-                count_consulta = "SELECT COUNT(*) as total FROM inscritos"
-            
-            count_result = self.ejecutar_consulta_remota(count_consulta)
+                direccion, valor_orden, id_registro = decodificado
+                condicion_cursor, params_cursor = self._condicion_cursor(orden, direccion, valor_orden, id_registro)
+                condiciones.append(condicion_cursor)
+                params.extend(params_cursor)
+        
+        sentido = 'ASC' if direccion == 'ant' else 'DESC'
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        consulta = f"""
+        SELECT {columnas}, (SELECT COUNT(*) FROM {tabla} {where_busqueda}) AS _total_registros 
+        FROM {tabla} 
+        {where}
+        ORDER BY {self._expresion_orden(orden)} {sentido}, id {sentido} 
+        LIMIT ?
+        """
+        
+        df = self.consultar_dataframe_remoto(consulta, params + [self.page_size + 1])
+        if df is None:
+            return None, None, None, 0
+        
+        df, total_records = self._separar_total(df)
+        if total_records is None:
+            # Página vacía: sin filas no llega el total; solo hay que
+            # contarlo aparte si el corte dejó fuera registros.
+            total_records = self._contar_registros(tabla, campos_busqueda, search_term) if direccion else 0
+        
+        hay_mas = len(df) > self.page_size
+        df = df.iloc[:self.page_size]
+        if direccion == 'ant':
+            df = df.iloc[::-1]
+        df = df.reset_index(drop=True)
+        
+        if df.empty:
+            return df, None, None, total_records
+        
+        # Hacia atrás siempre existe la página de la que venimos; hacia
+        # adelante solo existe la anterior si llegamos con un token.
+        existe_siguiente = hay_mas if direccion != 'ant' else True
+        existe_anterior = direccion == 'sig' or (direccion == 'ant' and hay_mas)
+        
+        token_siguiente = self._codificar_token('sig', *self._llave_fila(df, -1, orden)) if existe_siguiente else None
+        token_anterior = self._codificar_token('ant', *self._llave_fila(df, 0, orden)) if existe_anterior else None
+        return df, token_siguiente, token_anterior, total_records
+    
+    def aplicar_migraciones_esquema(self):
+        """Aplicar en la base remota las migraciones de esquema pendientes.
+        
+        Se ejecuta una vez por proceso; entre otros, crea los índices (orden, id)
+        sin los cuales el cursor evita el OFFSET pero SQLite seguiría ordenando
+        la tabla completa en cada página.
+        """
+        if SistemaBaseDatos._esquema_migrado:
+            return True
+        try:
+            def consultar(sql, params=()):
+                resultado, error = self.gestor.ejecutar_sql_remoto(sql, list(params))
+                if error:
+                    raise Exception(error)
+                return resultado or []
             
-            if count_result and len(count_result) > 0:
-                total_records = count_result[0].get('total', 0)
-            else:
-                total_records = 0
+            def ejecutar(sql, params=()):
+                return self.ejecutar_modificacion_remota(sql, list(params))
             
-            total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
+            reporte = MigradorEsquema(consultar, ejecutar, 'escuela').aplicar()
+            if reporte is None:
+                return False
             
-            logger.debug(f"Obtenidos {len(df)} inscritos (página {page}/{total_pages})")
-            return df, total_pages, total_records
+            SistemaBaseDatos._esquema_migrado = True
+            return True
         except Exception as e:
-            logger.error(f"Error obteniendo inscritos: {e}", exc_info=True)
-            return pd.DataFrame(), 0, 0
+            logger.error(f"❌ Error aplicando migraciones de esquema: {e}")
+            return False
     
-    def obtener_estudiantes(self, page=1, search_term=""):
-        """Obtener estudiantes con paginación y búsqueda"""
+    def asegurar_indices_busqueda(self):
+        """Crear o reparar el índice FTS5 de cada entidad, una vez por proceso.
+        
+        Las sentencias son idempotentes y encolan las filas que falten en el
+        índice, así que también reparan un índice creado a medias. Un índice
+        de la versión con triggers que escribían en él se reconstruye, porque
+        su normalización no coincidía con la de `normalizar`. Una tabla cuyo
+        índice no pudo crearse (SQLite remoto sin trigram) sigue buscando
+        con LIKE.
+        """
+        if SistemaBaseDatos._indices_busqueda_verificados:
+            return True
         try:
-            offset = (page - 1) * self.page_size
+            anteriores = {
+                trigger
+                for tabla in self.ENTIDADES_PAGINADAS
+                for trigger in IndiceBusquedaTexto.triggers_anteriores(tabla)
+            }
+            marcadores = ", ".join("?" for _ in anteriores)
+            filas = self.gestor.ejecutar_sql_remoto(
+                f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({marcadores})",
+                sorted(anteriores)
+            )[0] or []
+            existentes = {fila.get('name') for fila in filas}
+            
+            for tabla, (_, campos_busqueda, _) in self.ENTIDADES_PAGINADAS.items():
+                reindexar = bool(existentes & set(IndiceBusquedaTexto.triggers_anteriores(tabla)))
+                sentencias = IndiceBusquedaTexto.sentencias_creacion(tabla, campos_busqueda, reindexar)
+                
+                if all(self.ejecutar_modificacion_remota(sentencia) for sentencia in sentencias):
+                    SistemaBaseDatos._tablas_fts.add(tabla)
+                    if reindexar:
+                        logger.info(f"🔄 Índice de búsqueda de {tabla} encolado para reconstrucción")
+                else:
+                    logger.warning(f"⚠️ Índice de búsqueda FTS5 no disponible para {tabla}, se usará LIKE")
             
-            if search_term:
+            SistemaBaseDatos._indices_busqueda_verificados = True
+            logger.info(f"✅ Índices de búsqueda verificados: {sorted(SistemaBaseDatos._tablas_fts)}")
+            self.iniciar_indexacion()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error creando índices de búsqueda: {e}")
+            return False
+    
+    def buscar_registros(self, entidad, termino, limite=50):
+        """Búsqueda ordenada por relevancia (bm25) sobre el índice de trigramas.
+        
+        Tolera acentos y mayúsculas. Sin índice o con menos de tres caracteres
+        regresa las coincidencias LIKE más recientes.
+        """
+        try:
+            columnas, campos_busqueda, orden = self.ENTIDADES_PAGINADAS[entidad]
+            consulta_match = IndiceBusquedaTexto.consulta_match(termino)
+            
+            if entidad in SistemaBaseDatos._tablas_fts and consulta_match:
+                fts = IndiceBusquedaTexto.tabla_fts(entidad)
+                pendientes = IndiceBusquedaTexto.tabla_pendientes(entidad)
+                condicion_like = " OR ".join(f"{campo} LIKE ?" for campo in campos_busqueda)
+                # Las filas aún en la cola no tienen rango: van después de las del índice
                 consulta = f"""
-                SELECT * FROM estudiantes 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
-                ORDER BY fecha_ingreso DESC 
-                LIMIT {self.page_size} OFFSET {offset}
+                SELECT {columnas} FROM {entidad} 
+                JOIN (SELECT rowid AS _id_fts, rank AS _rango FROM {fts} 
+                      WHERE {fts} MATCH ? AND rowid NOT IN (SELECT id FROM {pendientes}) 
+                      UNION ALL 
+                      SELECT id, 1e308 FROM {entidad} 
+                      WHERE id IN (SELECT id FROM {pendientes}) AND ({condicion_like}) 
+                      ORDER BY _rango LIMIT ?) coincidencias 
+                  ON {entidad}.id = coincidencias._id_fts 
+                ORDER BY coincidencias._rango
                 """
+                params = [consulta_match] + [f"%{termino}%"] * len(campos_busqueda) + [limite]
             else:
+                condicion, params = self._filtro_busqueda(entidad, campos_busqueda, termino)
                 consulta = f"""
-                SELECT * FROM estudiantes 
-                ORDER BY fecha_ingreso DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            
-            resultado = self.ejecutar_consulta_remota(consulta)
-            
-            if resultado is None:
-                return pd.DataFrame(), 0, 0
-            
-            df = pd.DataFrame(resultado)
-            
-            # Obtener total de registros
-            if search_term:
-                count_consulta = f"""
-                SELECT COUNT(*) as total FROM estudiantes 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
+                SELECT {columnas} FROM {entidad} 
+                WHERE {condicion or '1'} 
+                ORDER BY {self._expresion_orden(orden)} DESC, id DESC 
+                LIMIT ?
                 """
-            else:
-                count_consulta = "SELECT COUNT(*) as total FROM estudiantes"
-            
-            count_result = self.ejecutar_consulta_remota(count_consulta)
+                params = params + [limite]
             
-            if count_result and len(count_result) > 0:
-                total_records = count_result[0].get('total', 0)
-            else:
-                total_records = 0
-            
-            total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
-            
-            logger.debug(f"Obtenidos {len(df)} estudiantes (página {page}/{total_pages})")
-            return df, total_pages, total_records
+            df = self.consultar_dataframe_remoto(consulta, params)
+            if df is None:
+                return pd.DataFrame()
+            return df.drop(columns=['_id_fts', '_rango'], errors='ignore')
+        except Exception as e:
+            logger.error(f"Error buscando en {entidad}: {e}", exc_info=True)
+            return pd.DataFrame()
+    
+    @staticmethod
+    def _separar_total(df):
+        """Quitar la columna _total_registros y regresar (df, total o None)"""
+        if '_total_registros' not in df.columns:
+            return df, None
+        total_records = int(df['_total_registros'].iloc[0]) if not df.empty else None
+        return df.drop(columns=['_total_registros']), total_records
+    
+    def _contar_registros(self, tabla, campos_busqueda, search_term):
+        """Total de registros que cumplen la búsqueda (solo para páginas vacías)"""
+        condicion, params_where = self._filtro_busqueda(tabla, campos_busqueda, search_term)
+        where = f"WHERE {condicion}" if condicion else ""
+        
+        count_result = self.ejecutar_consulta_remota(f"SELECT COUNT(*) as total FROM {tabla} {where}", params_where)
+        if count_result and len(count_result) > 0:
+            return count_result[0].get('total', 0)
+        return 0
+    
+    def _consultar_pagina(self, tabla, columnas, campos_busqueda, orden, page, search_term):
+        """Consulta paginada por número de página sobre el cursor (orden, id).
+        
+        Las páginas visitadas dejan registrados los tokens de sus vecinas, de
+        modo que avanzar o retroceder una página usa el cursor. Solo un salto
+        a una página nunca visitada recurre a OFFSET, y aun así deja sus
+        tokens listos para la navegación siguiente. La página y el total
+        llegan juntos en un solo viaje.
+        """
+        page = max(1, int(page))
+        marcadores = self._marcadores_paginacion(tabla, search_term)
+        
+        if page == 1 or page in marcadores:
+            df, token_siguiente, token_anterior, total_records = self._consultar_keyset(
+                tabla, columnas, campos_busqueda, orden,
+                marcadores.get(page) if page > 1 else None, search_term
+            )
+        else:
+            df, token_siguiente, token_anterior, total_records = self._consultar_salto(
+                tabla, columnas, campos_busqueda, orden, page, search_term
+            )
+        
+        if df is None:
+            return pd.DataFrame(), 0, 0
+        
+        if token_siguiente:
+            marcadores[page + 1] = token_siguiente
+        if token_anterior and page > 1:
+            marcadores[page - 1] = token_anterior
+        
+        total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
+        
+        logger.debug(f"Obtenidos {len(df)} {tabla} (página {page}/{total_pages})")
+        return df, total_pages, total_records
+    
+    def _consultar_salto(self, tabla, columnas, campos_busqueda, orden, page, search_term):
+        """Salto directo a una página sin token: OFFSET con el mismo orden total.
+        
+        Aquí no hay corte por cursor, así que COUNT(*) OVER() cuenta la
+        búsqueda completa antes de aplicar LIMIT/OFFSET.
+        """
+        condicion, params = self._filtro_busqueda(tabla, campos_busqueda, search_term)
+        where = f"WHERE {condicion}" if condicion else ""
+        
+        consulta = f"""
+        SELECT {columnas}, COUNT(*) OVER() AS _total_registros FROM {tabla} 
+        {where}
+        ORDER BY {self._expresion_orden(orden)} DESC, id DESC 
+        LIMIT ? OFFSET ?
+        """
+        df = self.consultar_dataframe_remoto(consulta, params + [self.page_size + 1, (page - 1) * self.page_size])
+        if df is None:
+            return None, None, None, 0
+        
+        df, total_records = self._separar_total(df)
+        if total_records is None:
+            total_records = self._contar_registros(tabla, campos_busqueda, search_term)
+        
+        hay_mas = len(df) > self.page_size
+        df = df.iloc[:self.page_size].reset_index(drop=True)
+        if df.empty:
+            return df, None, None, total_records
+        
+        token_siguiente = self._codificar_token('sig', *self._llave_fila(df, -1, orden)) if hay_mas else None
+        token_anterior = self._codificar_token('ant', *self._llave_fila(df, 0, orden))
+        return df, token_siguiente, token_anterior, total_records
+    
+    def obtener_pagina_cursor(self, entidad, token=None, search_term=""):
+        """Navegación por tokens opacos para cualquier entidad paginada.
+        
+        Regresa (df, token_siguiente, token_anterior, total_registros).
+        """
+        try:
+            columnas, campos_busqueda, orden = self.ENTIDADES_PAGINADAS[entidad]
+            df, token_siguiente, token_anterior, total_records = self._consultar_keyset(
+                entidad, columnas, campos_busqueda, orden, token, search_term
+            )
+            if df is None:
+                return pd.DataFrame(), None, None, 0
+            return df, token_siguiente, token_anterior, total_records
+        except Exception as e:
+            logger.error(f"Error obteniendo página de {entidad}: {e}", exc_info=True)
+            return pd.DataFrame(), None, None, 0
+    
+    def obtener_inscritos(self, page=1, search_term=""):
+        """Obtener inscritos con paginación y búsqueda"""
+        try:
+            return self._consultar_pagina('inscritos', *self.ENTIDADES_PAGINADAS['inscritos'], page, search_term)
+        except Exception as e:
+            logger.error(f"Error obteniendo inscritos: {e}", exc_info=True)
+            return pd.DataFrame(), 0, 0
+    
+    def obtener_estudiantes(self, page=1, search_term=""):
+        """Obtener estudiantes con paginación y búsqueda"""
+        try:
+            return self._consultar_pagina('estudiantes', *self.ENTIDADES_PAGINADAS['estudiantes'], page, search_term)
         except Exception as e:
             logger.error(f"Error obteniendo estudiantes: {e}", exc_info=True)
             return pd.DataFrame(), 0, 0
@@ -1487,53 +3100,7 @@ class SistemaBaseDatos:
     def obtener_egresados(self, page=1, search_term=""):
         """Obtener egresados con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            if search_term:
-                consulta = f"""
-                SELECT * FROM egresados 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
-                ORDER BY fecha_graduacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            else:
-                consulta = f"""
-                SELECT * FROM egresados 
-                ORDER BY fecha_graduacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            
-            resultado = self.ejecutar_consulta_remota(consulta)
-            
-            if resultado is None:
-                return pd.DataFrame(), 0, 0
-            
-            df = pd.DataFrame(resultado)
-            
-            # Obtener total de registros
-            if search_term:
-                count_consulta = f"""
-                SELECT COUNT(*) as total FROM egresados 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
-                """
-            else:
-                count_consulta = "SELECT COUNT(*) as total FROM egresados"
-            
-            count_result = self.ejecutar_consulta_remota(count_consulta)
-            
-            if count_result and len(count_result) > 0:
-                total_records = count_result[0].get('total', 0)
-            else:
-                total_records = 0
-            
-            total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
-            
-            logger.debug(f"Obtenidos {len(df)} egresados (página {page}/{total_pages})")
-            return df, total_pages, total_records
+            return self._consultar_pagina('egresados', *self.ENTIDADES_PAGINADAS['egresados'], page, search_term)
         except Exception as e:
             logger.error(f"Error obteniendo egresados: {e}", exc_info=True)
             return pd.DataFrame(), 0, 0
@@ -1541,53 +3108,7 @@ class SistemaBaseDatos:
     def obtener_contratados(self, page=1, search_term=""):
         """Obtener contratados con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            if search_term:
-                consulta = f"""
-                SELECT * FROM contratados 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
-                ORDER BY fecha_contratacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            else:
-                consulta = f"""
-                SELECT * FROM contratados 
-                ORDER BY fecha_contratacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            
-            resultado = self.ejecutar_consulta_remota(consulta)
-            
-            if resultado is None:
-                return pd.DataFrame(), 0, 0
-            
-            df = pd.DataFrame(resultado)
-            
-            # Obtener total de registros
-            if search_term:
-                count_consulta = f"""
-                SELECT COUNT(*) as total FROM contratados 
-                WHERE matricula LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%'
-                """
-            else:
-                count_consulta = "SELECT COUNT(*) as total FROM contratados"
-            
-            count_result = self.ejecutar_consulta_remota(count_consulta)
-            
-            if count_result and len(count_result) > 0:
-                total_records = count_result[0].get('total', 0)
-            else:
-                total_records = 0
-            
-            total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
-            
-            logger.debug(f"Obtenidos {len(df)} contratados (página {page}/{total_pages})")
-            return df, total_pages, total_records
+            return self._consultar_pagina('contratados', *self.ENTIDADES_PAGINADAS['contratados'], page, search_term)
         except Exception as e:
             logger.error(f"Error obteniendo contratados: {e}", exc_info=True)
             return pd.DataFrame(), 0, 0
@@ -1595,59 +3116,7 @@ class SistemaBaseDatos:
     def obtener_usuarios(self, page=1, search_term=""):
         """Obtener usuarios con paginación y búsqueda - CORREGIDO para estructura REAL"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            if search_term:
-                consulta = f"""
-                SELECT id, usuario, rol, nombre_completo, email, matricula, activo, 
-                       fecha_creacion, fecha_actualiza, categoria, nombre
-                FROM usuarios 
-                WHERE usuario LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%' 
-                   OR matricula LIKE '%{search_term}%'
-                ORDER BY fecha_creacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            else:
-                consulta = f"""
-                SELECT id, usuario, rol, nombre_completo, email, matricula, activo, 
-                       fecha_creacion, fecha_actualiza, categoria, nombre
-                FROM usuarios 
-                ORDER BY fecha_creacion DESC 
-                LIMIT {self.page_size} OFFSET {offset}
-                """
-            
-            resultado = self.ejecutar_consulta_remota(consulta)
-            
-            if resultado is None:
-                return pd.DataFrame(), 0, 0
-            
-            df = pd.DataFrame(resultado)
-            
-            # Obtener total de registros
-            if search_term:
-                count_consulta = f"""
-                SELECT COUNT(*) as total FROM usuarios 
-                WHERE usuario LIKE '%{search_term}%' 
-                   OR nombre_completo LIKE '%{search_term}%' 
-                   OR email LIKE '%{search_term}%' 
-                   OR matricula LIKE '%{search_term}%'
-                """
-            else:
-                count_consulta = "SELECT COUNT(*) as total FROM usuarios"
-            
-            count_result = self.ejecutar_consulta_remota(count_consulta)
-            
-            if count_result and len(count_result) > 0:
-                total_records = count_result[0].get('total', 0)
-            else:
-                total_records = 0
-            
-            total_pages = math.ceil(total_records / self.page_size) if total_records > 0 else 0
-            
-            logger.debug(f"Obtenidos {len(df)} usuarios (página {page}/{total_pages})")
-            return df, total_pages, total_records
+            return self._consultar_pagina('usuarios', *self.ENTIDADES_PAGINADAS['usuarios'], page, search_term)
         except Exception as e:
             logger.error(f"Error obteniendo usuarios: {e}", exc_info=True)
             return pd.DataFrame(), 0, 0
@@ -1668,7 +3137,7 @@ class SistemaBaseDatos:
             ORDER BY id
             """
             
-            resultado = self.ejecutar_consulta_remota(consulta)
+            resultado = self.ejecutar_consulta_remota(consulta, usar_cache=False)
             
             if resultado:
                 logger.info("🔍 DEBUG - Usuarios en la base de datos (estructura REAL):")
@@ -1703,8 +3172,9 @@ class SistemaBackupAutomatico:
         try:
             logger.info(f"💾 Creando backup remoto: {tipo_operacion}")
             
-            # Crear backup directamente en servidor remoto
-            if self.gestor_ssh.crear_backup_remoto():
+            # Crear backup directamente en el repositorio del servidor remoto
+            instantanea = self.gestor_ssh.crear_backup_remoto(tipo_operacion)
+            if instantanea:
                 logger.info(f"✅ Backup remoto creado para operación: {tipo_operacion}")
                 
                 # Registrar localmente la operación
@@ -1716,14 +3186,19 @@ class SistemaBackupAutomatico:
                     'tipo_operacion': tipo_operacion,
                     'detalles': detalles,
                     'usuario': st.session_state.get('usuario_actual', {}).get('usuario', 'desconocido'),
-                    'ubicacion': 'servidor_remoto'
+                    'ubicacion': 'repositorio_remoto',
+                    'instantanea': instantanea['id'],
+                    'tamano': instantanea['tamano'],
+                    'bytes_nuevos': instantanea['bytes_nuevos'],
+                    'sha256': instantanea['sha256']
                 }
                 
                 metadata_file = os.path.join(self.backup_dir, f"backup_metadata_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
                 with open(metadata_file, 'w') as f:
                     json.dump(metadata, f, indent=2, default=str)
                 
-                self._limpiar_metadatos_antiguos()
+                poda = instantanea.get('poda')
+                self._limpiar_metadatos_antiguos(poda['conservadas'] if poda else None)
                 
                 return "backup_creado_en_servidor"
             else:
@@ -1734,8 +3209,8 @@ class SistemaBackupAutomatico:
             logger.error(f"❌ Error creando backup: {e}")
             return None
     
-    def _limpiar_metadatos_antiguos(self):
-        """Mantener solo los últimos N metadatos de backups"""
+    def _limpiar_metadatos_antiguos(self, conservadas=None):
+        """Quitar metadatos de instantáneas que la retención eliminó (o los más viejos que N)"""
         try:
             if not os.path.exists(self.backup_dir):
                 return
@@ -1748,7 +3223,20 @@ class SistemaBackupAutomatico:
             
             metadata_files.sort(key=lambda x: x[1], reverse=True)
             
-            for metadata_file in metadata_files[self.max_backups:]:
+            if conservadas is not None:
+                vencidos = []
+                for metadata_file in metadata_files:
+                    try:
+                        with open(metadata_file[0], 'r') as f:
+                            instantanea = json.load(f).get('instantanea')
+                    except Exception:
+                        continue
+                    if instantanea and instantanea not in conservadas:
+                        vencidos.append(metadata_file)
+            else:
+                vencidos = metadata_files[self.max_backups:]
+            
+            for metadata_file in vencidos:
                 try:
                     os.remove(metadata_file[0])
                     logger.debug(f"🗑️ Metadato antiguo eliminado: {metadata_file[0]}")
@@ -1777,7 +3265,8 @@ class SistemaBackupAutomatico:
                             'ruta': filepath,
                             'fecha': datetime.fromisoformat(metadata['fecha_backup']),
                             'tipo_operacion': metadata['tipo_operacion'],
-                            'ubicacion': metadata['ubicacion']
+                            'ubicacion': metadata['ubicacion'],
+                            'instantanea': metadata.get('instantanea')
                         }
                         backups.append(file_info)
                     except Exception as e:
@@ -2078,59 +3567,132 @@ class SistemaPrincipal:
 # 8. INTERFAZ STREAMLIT
 # =============================================================================
 
-# Instancias globales de los servicios (¡CORREGIDO!)
-estado_sistema = EstadoPersistente()
-gestor_remoto = None
+# Segundos durante los que se muestra el último error de arranque sin volver a probar el servidor
+REINTENTO_ARRANQUE = 15
+
+@st.cache_resource(show_spinner=False)
+def obtener_estado_sistema():
+    """Estado único por proceso: el JSON se lee una vez y no en cada rerun"""
+    return EstadoPersistente()
+
+@st.cache_resource(show_spinner=False)
+def obtener_gestor_remoto():
+    """Gestor único por proceso: configuración, pool, caché y réplica se crean una sola vez"""
+    return GestorConexionRemota()
+
+def crear_base_datos(gestor):
+    """Base de datos con las verificaciones de arranque ya hechas.
+    
+    Las verificaciones (SSH, existencia de la base, usuario admin,
+    migraciones e índices) corren una sola vez por proceso, en el hilo de
+    arranque. Si alguna falla se lanza la excepción y el siguiente rerun
+    pasado REINTENTO_ARRANQUE segundos vuelve a intentarlo.
+    """
+    db = SistemaBaseDatos(gestor)
+    
+    logger.info("🔍 Verificando conexión SSH...")
+    if not gestor.verificar_conexion_ssh():
+        raise Exception("No se pudo conectar al servidor SSH")
+    
+    logger.info("🔍 Verificando existencia de base de datos...")
+    if not gestor.verificar_existencia_db():
+        raise Exception("Base de datos no encontrada en el servidor")
+    
+    logger.info("🔍 Verificando usuario admin...")
+    if not estado_sistema.esta_inicializada():
+        if db.verificar_crear_usuario_admin():
+            estado_sistema.marcar_db_inicializada()
+            logger.info("✅ Sistema inicializado correctamente")
+    
+    db.aplicar_migraciones_esquema()
+    db.asegurar_indices_busqueda()
+    atexit.register(db.detener_indexacion)
+    return db
+
+@st.cache_resource(show_spinner=False)
+def obtener_arranque():
+    """Arranque único por proceso: la base lista, el hilo que la prepara y el último error.
+    
+    Como la prueba de conexión de aspirantes35 y migracion30, la conexión
+    y las verificaciones corren en segundo plano: el login se dibuja sin
+    esperar al servidor SSH y solo el envío del formulario espera al hilo.
+    """
+    return {'db': None, 'hilo': None, 'error': None, 'momento': 0, 'candado': threading.Lock()}
+
+def error_arranque_reciente():
+    """Mensaje del último error de arranque si ocurrió hace menos de REINTENTO_ARRANQUE segundos"""
+    arranque = obtener_arranque()
+    if arranque['error'] and time.time() - arranque['momento'] < REINTENTO_ARRANQUE:
+        return arranque['error']
+    return None
+
+def _preparar_base_datos(arranque):
+    try:
+        base = crear_base_datos(gestor_remoto)
+        with arranque['candado']:
+            arranque.update(db=base, error=None)
+    except Exception as e:
+        logger.error(f"❌ Error en el arranque del sistema: {e}", exc_info=True)
+        with arranque['candado']:
+            arranque.update(error=str(e), momento=time.time())
+    finally:
+        with arranque['candado']:
+            arranque['hilo'] = None
+
+def base_datos_lista(esperar=False):
+    """Base de datos si el arranque ya terminó, o None.
+    
+    Si no hay arranque en curso ni un error reciente lo lanza en un hilo
+    aparte. Sin `esperar` regresa de inmediato; con `esperar` aguarda a que
+    el hilo termine.
+    """
+    arranque = obtener_arranque()
+    with arranque['candado']:
+        if arranque['db'] is None and arranque['hilo'] is None and not error_arranque_reciente():
+            arranque['hilo'] = threading.Thread(
+                target=_preparar_base_datos, args=(arranque,), name='arranque_db', daemon=True
+            )
+            arranque['hilo'].start()
+        hilo = arranque['hilo']
+    if esperar and hilo is not None:
+        hilo.join()
+    return arranque['db']
+
+# Instancias globales de los servicios: los pesados son únicos por proceso
+estado_sistema = obtener_estado_sistema()
+gestor_remoto = obtener_gestor_remoto()
 db = None
 auth = SistemaAutenticacion()
 sistema_principal = None
 
-def inicializar_sistema():
-    """Inicializar sistema con orden correcto - FUNCIÓN CORREGIDA"""
-    global gestor_remoto, db, auth, sistema_principal
+def inicializar_sistema(esperar=False):
+    """Inicializar sistema con orden correcto; lo costoso corre una vez por proceso y en segundo plano.
+    
+    Regresa False mientras el arranque no termine; con `esperar` aguarda al
+    hilo de arranque en vez de regresar de inmediato.
+    """
+    global db, sistema_principal
     
     try:
-        # 1. Inicializar gestor SSH
-        logger.info("🔄 Inicializando gestor SSH...")
-        gestor_remoto = GestorConexionRemota()
-        
+        # 1. Gestor SSH (único por proceso); main() muestra el error de configuración
         if not gestor_remoto.config or not gestor_remoto.config.get('ssh_host'):
-            st.error("❌ No se pudo inicializar el gestor SSH")
             return False
         
-        # 2. Inicializar base de datos (DESPUÉS de gestor_remoto)
-        logger.info("🔄 Inicializando sistema de base de datos...")
-        db = SistemaBaseDatos(gestor_remoto)
+        # 2. Base de datos y verificaciones de arranque (DESPUÉS de gestor_remoto)
+        lista = base_datos_lista(esperar)
+        if lista is None:
+            return False
+        db = lista
         
         # 3. Configurar autenticación
         auth.set_db(db)
         
-        # 4. Verificar conexión SSH
-        logger.info("🔍 Verificando conexión SSH...")
-        if not gestor_remoto.verificar_conexion_ssh():
-            st.error("❌ No se pudo conectar al servidor SSH")
-            return False
-        
-        # 5. Verificar que la base de datos existe
-        logger.info("🔍 Verificando existencia de base de datos...")
-        if not gestor_remoto.verificar_existencia_db():
-            st.error("❌ Base de datos no encontrada en el servidor")
-            return False
-        
-        # 6. Verificar y crear usuario admin si es necesario
-        logger.info("🔍 Verificando usuario admin...")
-        if not estado_sistema.esta_inicializada():
-            with st.spinner("🔄 Inicializando base de datos..."):
-                if db.verificar_crear_usuario_admin():
-                    estado_sistema.marcar_db_inicializada()
-                    logger.info("✅ Sistema inicializado correctamente")
-        
-        # 7. Inicializar sistema principal
+        # 4. Inicializar sistema principal (estado de la página, barato)
         sistema_principal = SistemaPrincipal(gestor_remoto, db)
         
-        logger.info("✅ Sistema completamente inicializado")
+        logger.debug("Sistema inicializado")
         return True
-        
+    
     except Exception as e:
         logger.error(f"❌ Error en inicialización del sistema: {e}", exc_info=True)
         st.error(f"❌ Error crítico en inicialización: {str(e)}")
@@ -2145,8 +3707,11 @@ def mostrar_login():
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if gestor_remoto and gestor_remoto.verificar_existencia_db():
+        existe_db = gestor_remoto.estado_existencia_db() if gestor_remoto and gestor_remoto.db_path_remoto else False
+        if existe_db:
             st.success("✅ Base de datos encontrada")
+        elif existe_db is None:
+            st.info("⏳ Verificando base de datos...")
         else:
             st.error("❌ Base de datos NO encontrada")
     
@@ -2161,6 +3726,13 @@ def mostrar_login():
             db_name = os.path.basename(gestor_remoto.db_path_remoto)
             st.info(f"📁 DB: {db_name}")
     
+    if not db:
+        error = error_arranque_reciente()
+        if error:
+            st.warning(f"⚠️ {error} (se reintentará en unos segundos)")
+        else:
+            st.info("⏳ Conectando con el servidor en segundo plano: puede escribir sus credenciales")
+    
     st.markdown("---")
     
     col1, col2, col3 = st.columns([1,2,1])
@@ -2176,7 +3748,9 @@ def mostrar_login():
             if login_button:
                 if usuario and password:
                     with st.spinner("Verificando credenciales..."):
-                        if auth.verificar_login(usuario, password):
+                        if not db and not inicializar_sistema(esperar=True):
+                            st.error(f"❌ {error_arranque_reciente() or 'El servidor no está disponible'}")
+                        elif auth.verificar_login(usuario, password):
                             st.success("✅ Login exitoso")
                             st.rerun()
                         else:
@@ -2243,7 +3817,7 @@ def mostrar_login():
                         
                         # Verificar usuarios
                         consulta_users = "SELECT usuario, rol, activo, password_hash, salt FROM usuarios"
-                        users_result = db.ejecutar_consulta_remota(consulta_users)
+                        users_result = db.ejecutar_consulta_remota(consulta_users, usar_cache=False)
                         if users_result:
                             st.write("**👥 Usuarios registrados:**")
                             for user in users_result:
@@ -2377,16 +3951,11 @@ def mostrar_dashboard():
         st.subheader("📋 Tablas Disponibles")
         try:
             if db:
-                consulta = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-                resultado = db.ejecutar_consulta_remota(consulta)
+                conteos_tablas = db.contar_registros_tablas()
                 
-                if resultado:
-                    st.write(f"✅ {len(resultado)} tablas en base de datos:")
-                    for tabla in resultado:
-                        nombre_tabla = tabla.get('name', '')
-                        count_consulta = f"SELECT COUNT(*) as total FROM {nombre_tabla}"
-                        count_result = db.ejecutar_consulta_remota(count_consulta)
-                        count = count_result[0].get('total', 0) if count_result else 0
+                if conteos_tablas:
+                    st.write(f"✅ {len(conteos_tablas)} tablas en base de datos:")
+                    for nombre_tabla, count in conteos_tablas:
                         st.write(f"- **{nombre_tabla}**: {count} registros")
                 else:
                     st.info("ℹ️ No se pudieron obtener las tablas")
@@ -2758,6 +4327,26 @@ def mostrar_configuracion():
                         st.write(f"📊 Tablas: {total_tablas}")
             except:
                 pass
+            
+            if gestor_remoto.cache:
+                stats_cache = gestor_remoto.cache.obtener_estadisticas()
+                st.write(
+                    f"⚡ Caché de consultas: {stats_cache['aciertos']} aciertos / "
+                    f"{stats_cache['fallos']} fallos ({stats_cache['tasa_aciertos']:.0f}%), "
+                    f"{stats_cache['entradas']} entradas"
+                )
+            
+            if gestor_remoto.replica:
+                estado_replica = gestor_remoto.replica.obtener_estado()
+                atraso = estado_replica['antiguedad']
+                st.write(
+                    f"📦 Réplica local: {estado_replica['lecturas']} lecturas, "
+                    f"{estado_replica['copias']} copias, atraso "
+                    f"{'desconocido' if atraso is None else f'≤ {atraso:.0f}s'} "
+                    f"(máximo {estado_replica['max_antiguedad']}s)"
+                )
+                if estado_replica['ultimo_error']:
+                    st.warning(f"⚠️ Réplica: {estado_replica['ultimo_error']}")
     
     st.markdown("---")
     st.subheader("🛠️ Herramientas del Sistema")
@@ -2785,16 +4374,11 @@ def mostrar_configuracion():
         if st.button("📊 Ver Tablas DB", use_container_width=True):
             try:
                 if db:
-                    consulta = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-                    resultado = db.ejecutar_consulta_remota(consulta)
+                    conteos_tablas = db.contar_registros_tablas()
                     
-                    if resultado:
-                        st.success(f"✅ {len(resultado)} tablas en base de datos:")
-                        for tabla in resultado:
-                            nombre_tabla = tabla.get('name', '')
-                            count_consulta = f"SELECT COUNT(*) as total FROM {nombre_tabla}"
-                            count_result = db.ejecutar_consulta_remota(count_consulta)
-                            count = count_result[0].get('total', 0) if count_result else 0
+                    if conteos_tablas:
+                        st.success(f"✅ {len(conteos_tablas)} tablas en base de datos:")
+                        for nombre_tabla, count in conteos_tablas:
                             st.write(f"- **{nombre_tabla}**: {count} registros")
                     else:
                         st.error("❌ No hay tablas en la base de datos")
@@ -2811,6 +4395,34 @@ def mostrar_configuracion():
             for backup in backups[:5]:  # Mostrar solo los últimos 5
                 fecha_str = backup['fecha'].strftime('%Y-%m-%d %H:%M')
                 st.write(f"📅 {fecha_str} - {backup['tipo_operacion']}")
+            
+            restaurables = [b for b in backups if b.get('instantanea')]
+            if restaurables:
+                col_backup1, col_backup2 = st.columns(2)
+                with col_backup1:
+                    seleccion = st.selectbox(
+                        "Instantánea a restaurar:",
+                        restaurables,
+                        format_func=lambda b: f"{b['fecha'].strftime('%Y-%m-%d %H:%M')} - {b['tipo_operacion']}"
+                    )
+                    if st.button("♻️ Restaurar en servidor", use_container_width=True):
+                        with st.spinner("Reconstruyendo instantánea..."):
+                            ruta_restaurada = gestor_remoto.restaurar_backup_remoto(seleccion['instantanea'])
+                        if ruta_restaurada:
+                            st.success(f"✅ Copia reconstruida en el servidor: {ruta_restaurada}")
+                        else:
+                            st.error("❌ No se pudo restaurar la instantánea")
+                with col_backup2:
+                    if st.button("🔍 Verificar Backups", use_container_width=True):
+                        with st.spinner("Verificando repositorio de backups..."):
+                            verificacion = gestor_remoto.verificar_backups_remotos()
+                        if verificacion is None:
+                            st.error("❌ No se pudo consultar el repositorio de backups")
+                        elif verificacion['ok']:
+                            st.success(f"✅ {len(verificacion['instantaneas'])} instantáneas íntegras")
+                        else:
+                            danadas = [i for i, r in verificacion['instantaneas'].items() if not r['ok']]
+                            st.error(f"❌ Instantáneas dañadas: {', '.join(danadas)}")
         else:
             st.info("ℹ️ No hay backups registrados")
 
@@ -2827,8 +4439,12 @@ def main():
 
         st.subheader("🔗 Estado de Conexión")
 
-        if gestor_remoto and gestor_remoto.verificar_existencia_db():
+        # El sondeo corre en segundo plano: el render no espera al servidor SSH
+        existe_db = gestor_remoto.estado_existencia_db() if gestor_remoto.db_path_remoto else False
+        if existe_db:
             st.success("✅ Base de datos remota")
+        elif existe_db is None:
+            st.info("⏳ Verificando base de datos remota...")
         else:
             st.error("❌ Base de datos NO encontrada")
 
@@ -2837,6 +4453,15 @@ def main():
         else:
             st.error("❌ SSH Desconectado")
 
+        if gestor_remoto and gestor_remoto.replica:
+            estado_replica = gestor_remoto.replica.obtener_estado()
+            if estado_replica['lista']:
+                st.info(f"📦 Lecturas desde réplica local (atraso ≤ {estado_replica['antiguedad']:.0f}s)")
+            elif estado_replica['antiguedad'] is None:
+                st.warning("⏳ Réplica local en preparación: leyendo del servidor")
+            else:
+                st.warning("🔄 Réplica local desactualizada: leyendo del servidor")
+
         st.markdown("---")
 
         st.subheader("📈 Estadísticas")
@@ -2886,12 +4511,10 @@ def main():
             if key not in st.session_state:
                 st.session_state[key] = default_value
 
-        # Inicialización del sistema
-        if not gestor_remoto or not db:
-            with st.spinner("🔄 Inicializando sistema..."):
-                if not inicializar_sistema():
-                    st.error("❌ Error crítico en inicialización del sistema")
-                    return
+        # Inicialización del sistema: la conexión y las verificaciones de arranque
+        # corren en segundo plano, así que el login se dibuja sin esperar al servidor
+        if not db:
+            inicializar_sistema()
 
         if not gestor_remoto.config.get('ssh_host'):
             st.error("""
@@ -2916,8 +4539,20 @@ def main():
         if not st.session_state.login_exitoso:
             mostrar_login()
         else:
+            if not db:
+                with st.spinner("🔄 Inicializando sistema..."):
+                    if not inicializar_sistema(esperar=True):
+                        st.error("❌ Error crítico en inicialización del sistema")
+                        return
             mostrar_interfaz_principal()
 
+        duracion = time.time() - INICIO_EJECUCION
+        if not st.session_state.get('primer_render_medido'):
+            st.session_state.primer_render_medido = True
+            logger.info(f"⏱️ Primer render de la sesión en {duracion:.2f}s (SSH: {estado_sistema.estado.get('ssh_conectado')})")
+        else:
+            logger.debug(f"Rerun en {duracion:.2f}s")
+
     except Exception as e:
         logger.error(f"Error crítico en main(): {e}", exc_info=True)
         st.error(f"❌ Error crítico en la aplicación: {str(e)}")
@@ -21,6 +21,7 @@ from email.mime.multipart import MIMEMultipart
 import paramiko
 import time
 import hashlib
+import base64
 import warnings
 import sqlite3
 import tempfile
@@ -29,14 +30,24 @@ from contextlib import contextmanager
 import logging
 import bcrypt
 import socket
+import threading
 import re
 import glob
 import atexit
 import math
+import shlex
 import psutil
 import zipfile
+from compartido import (
+    DiarioCambios, IndiceBusquedaTexto, MigradorEsquema, PoolConexionesSSH,
+    RepositorioRespaldos, SentenciasRemotas, TransferenciaComprimida,
+    TransferenciaDeltaSQLite, usar_logger
+)
 warnings.filterwarnings('ignore')
 
+# Inicio de esta ejecución del script (Streamlit lo vuelve a ejecutar en cada rerun)
+INICIO_EJECUCION = time.time()
+
 # Intentar importar tomllib
 try:
     import tomllib
@@ -142,6 +153,8 @@ class Logger:
     def critical(self, message, exc_info=False):
         self.logger.critical(message, exc_info=exc_info)
 
+usar_logger(Logger())
+
 # -----------------------------------------------------------------------------
 # 1.3 ESTADO PERSISTENTE
 # -----------------------------------------------------------------------------
@@ -152,6 +165,7 @@ class EstadoPersistente:
     def __init__(self, archivo_estado="estado_migracion.json"):
         self.archivo_estado = archivo_estado
         self.logger = Logger()
+        self._candado = threading.Lock()
         self.estado = self._cargar_estado()
     
     def _cargar_estado(self):
@@ -200,7 +214,8 @@ class EstadoPersistente:
     def guardar_estado(self):
         """Guardar estado a archivo JSON"""
         try:
-            with open(self.archivo_estado, 'w') as f:
+            # La instancia es compartida por las sesiones (hilos) del proceso
+            with self._candado, open(self.archivo_estado, 'w') as f:
                 json.dump(self.estado, f, indent=2, default=str)
             self.logger.debug(f"Estado guardado en {self.archivo_estado}")
         except Exception as e:
@@ -342,6 +357,19 @@ class Utilidades:
             print(f"Error verificando password: {e}")
             return False
 
+# -----------------------------------------------------------------------------
+# 1.5 POOL DE CONEXIONES SSH PERSISTENTES
+# -----------------------------------------------------------------------------
+
+@st.cache_resource(show_spinner=False)
+def obtener_pool_conexiones(host, port, username, password, timeout=30,
+                            max_conexiones=4, keepalive=30, max_inactividad=300):
+    """Pool único por proceso y servidor: sobrevive a reruns y sesiones de Streamlit"""
+    pool = PoolConexionesSSH(host, port, username, password, timeout,
+                             max_conexiones, keepalive, max_inactividad)
+    atexit.register(pool.cerrar_todo)
+    return pool
+
 # =============================================================================
 # CAPA 2: DATOS
 # =============================================================================
@@ -351,41 +379,64 @@ class Utilidades:
 # -----------------------------------------------------------------------------
 
 class ConexionSSH:
-    """Gestiona la conexión SSH al servidor remoto"""
+    """Gestiona la conexión SSH al servidor remoto.
+    
+    Hay una sola instancia por proceso (ver obtener_conexion_ssh), así que la
+    conexión en uso (ssh/sftp) se guarda por hilo: cada sesión de Streamlit
+    corre en su propio hilo y recibe su propia conexión del pool.
+    """
     
     def __init__(self, config):
+        self._hilo = threading.local()
         self.config = config
         self.ssh = None
         self.sftp = None
+        self.pool = None
         self.logger = Logger()
         self.temp_files = []
         atexit.register(self._limpiar_archivos_temporales)
+        
+        if self.config.get('host'):
+            # Pool compartido por el proceso: evita un handshake por operación
+            self.pool = obtener_pool_conexiones(
+                self.config['host'],
+                int(self.config.get('port', 22)),
+                self.config['username'],
+                self.config['password'],
+                int(self.config.get('timeout', 30)),
+                int(self.config.get('pool_max', 4)),
+                int(self.config.get('keepalive', 30)),
+                int(self.config.get('pool_idle', 300))
+            )
+    
+    @property
+    def ssh(self):
+        return getattr(self._hilo, 'ssh', None)
+    
+    @ssh.setter
+    def ssh(self, valor):
+        self._hilo.ssh = valor
+    
+    @property
+    def sftp(self):
+        return getattr(self._hilo, 'sftp', None)
+    
+    @sftp.setter
+    def sftp(self, valor):
+        self._hilo.sftp = valor
     
     def conectar(self):
-        """Establecer conexión SSH con el servidor remoto"""
+        """Obtener una conexión SSH del pool para el hilo actual"""
         try:
-            if not self.config.get('host'):
+            if not self.pool:
                 self.logger.error("No hay configuración SSH disponible")
                 return False
                 
-            self.logger.info(f"Conectando SSH a {self.config['host']}:{self.config.get('port', 22)}...")
-            
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            self.ssh.connect(
-                hostname=self.config['host'],
-                port=self.config.get('port', 22),
-                username=self.config['username'],
-                password=self.config['password'],
-                timeout=self.config.get('timeout', 30),
-                banner_timeout=self.config.get('timeout', 30),
-                allow_agent=False,
-                look_for_keys=False
-            )
+            self.logger.debug(f"Obteniendo conexión SSH a {self.config['host']}:{self.config.get('port', 22)} del pool...")
             
-            self.sftp = self.ssh.open_sftp()
-            self.logger.info(f"Conexión SSH establecida a {self.config['host']}")
+            self.ssh = self.pool.obtener()
+            self.sftp = self.pool.obtener_sftp(self.ssh)
+            self.logger.debug(f"Conexión SSH establecida a {self.config['host']}")
             return True
             
         except socket.timeout:
@@ -402,37 +453,42 @@ class ConexionSSH:
             return False
     
     def desconectar(self):
-        """Cerrar conexión SSH"""
+        """Devolver la conexión SSH al pool (el transporte queda abierto)"""
         try:
-            if self.sftp:
-                self.sftp.close()
-            if self.ssh:
-                self.ssh.close()
-            self.logger.debug("Conexión SSH cerrada")
+            if self.ssh and self.pool:
+                if self.pool.liberar(self.ssh) == 0:
+                    self.ssh = None
+                    self.sftp = None
+            self.logger.debug("Conexión SSH devuelta al pool")
         except Exception as e:
-            self.logger.warning(f"Error cerrando conexión SSH: {e}")
+            self.logger.warning(f"Error liberando conexión SSH: {e}")
+    
+    @contextmanager
+    def _sesion_sftp(self):
+        """Checkout reentrante de la conexión del pool durante una operación"""
+        if not self.conectar():
+            raise ConnectionError("No se pudo obtener conexión SSH")
+        try:
+            yield self.sftp
+        except (paramiko.SSHException, EOFError, ConnectionError, socket.timeout):
+            self.pool.invalidar(self.ssh)
+            self.ssh = None
+            self.sftp = None
+            raise
+        finally:
+            self.desconectar()
     
     def probar_conexion(self):
         """Probar la conexión SSH"""
         try:
-            if not self.config.get('host'):
+            if not self.pool:
                 return False
-                
-            ssh_test = paramiko.SSHClient()
-            ssh_test.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            ssh_test.connect(
-                hostname=self.config['host'],
-                port=self.config.get('port', 22),
-                username=self.config['username'],
-                password=self.config['password'],
-                timeout=10,
-                banner_timeout=10,
-                allow_agent=False,
-                look_for_keys=False
-            )
             
-            ssh_test.close()
+            # Un comando trivial valida el transporte reutilizado del pool
+            with self.pool.conexion() as ssh_test:
+                stdin, stdout, stderr = ssh_test.exec_command("echo OK", timeout=10)
+                stdout.read()
+            
             self.logger.info(f"Conexión SSH exitosa a {self.config['host']}")
             return True
             
@@ -442,12 +498,28 @@ class ConexionSSH:
             return False
     
     def descargar_archivo(self, ruta_remota, ruta_local):
-        """Descargar archivo del servidor remoto"""
+        """Descargar archivo del servidor remoto (comprimido si el enlace lo amerita)"""
         try:
-            if not self.sftp and not self.conectar():
-                return False
-            
-            self.sftp.get(ruta_remota, ruta_local)
+            with self._sesion_sftp() as sftp:
+                transferencia = TransferenciaComprimida(self.ssh)
+                resumen = None
+                if transferencia.nivel():
+                    try:
+                        resumen = transferencia.descargar(ruta_remota, ruta_local)
+                    except Exception as e:
+                        self.logger.warning(f"Descarga comprimida no disponible, usando SFTP: {e}")
+                
+                if resumen:
+                    self.logger.info(
+                        f"Descarga comprimida (gzip -{resumen['nivel']}): {resumen['bytes_transferidos'] / 1024:.1f} KB "
+                        f"de {resumen['tamano'] / 1024:.1f} KB en {resumen['segundos']:.1f}s"
+                    )
+                else:
+                    inicio = time.time()
+                    sftp.get(ruta_remota, ruta_local)
+                    TransferenciaComprimida.registrar_ancho_banda(
+                        transferencia.servidor, os.path.getsize(ruta_local), time.time() - inicio
+                    )
             self.logger.info(f"Archivo descargado: {ruta_remota} -> {ruta_local}")
             return True
             
@@ -458,14 +530,30 @@ class ConexionSSH:
     def subir_archivo(self, ruta_local, ruta_remota):
         """Subir archivo al servidor remoto"""
         try:
-            if not self.sftp and not self.conectar():
-                return False
-            
-            # Crear directorio si no existe
-            directorio = os.path.dirname(ruta_remota)
-            self._crear_directorio_remoto(directorio)
-            
-            self.sftp.put(ruta_local, ruta_remota)
+            with self._sesion_sftp() as sftp:
+                # Crear directorio si no existe
+                directorio = os.path.dirname(ruta_remota)
+                self._crear_directorio_remoto(directorio)
+                
+                transferencia = TransferenciaComprimida(self.ssh)
+                resumen = None
+                if transferencia.nivel():
+                    try:
+                        resumen = transferencia.subir(ruta_local, ruta_remota)
+                    except Exception as e:
+                        self.logger.warning(f"Subida comprimida no disponible, usando SFTP: {e}")
+                
+                if resumen:
+                    self.logger.info(
+                        f"Subida comprimida (gzip -{resumen['nivel']}): {resumen['bytes_transferidos'] / 1024:.1f} KB "
+                        f"de {resumen['tamano'] / 1024:.1f} KB en {resumen['segundos']:.1f}s"
+                    )
+                else:
+                    inicio = time.time()
+                    sftp.put(ruta_local, ruta_remota)
+                    TransferenciaComprimida.registrar_ancho_banda(
+                        transferencia.servidor, os.path.getsize(ruta_local), time.time() - inicio
+                    )
             self.logger.info(f"Archivo subido: {ruta_local} -> {ruta_remota}")
             return True
             
@@ -473,6 +561,130 @@ class ConexionSSH:
             self.logger.error(f"Error subiendo archivo {ruta_local}: {e}")
             return False
     
+    def descargar_base_delta(self, ruta_remota, ruta_espejo):
+        """Actualizar el espejo local solo con las páginas remotas que cambiaron.
+        
+        Regresa el SHA-256 remoto con que se verificó el espejo, o None.
+        """
+        try:
+            if not self.pool:
+                return None
+            with self.pool.conexion() as ssh:
+                resumen = TransferenciaDeltaSQLite(ssh).descargar(ruta_remota, ruta_espejo)
+            self.logger.info(
+                f"Delta de descarga: {resumen['bloques_transferidos']}/{resumen['bloques_total']} páginas "
+                f"({resumen['bytes_transferidos'] / 1024:.1f} KB de {resumen['tamano'] / 1024:.1f} KB)"
+            )
+            return resumen['sha256']
+        except Exception as e:
+            self.logger.warning(f"Delta de descarga no disponible para {ruta_remota}: {e}")
+            return None
+    
+    def subir_base_delta(self, ruta_local, ruta_remota):
+        """Aplicar en el servidor solo las páginas cambiadas, dejando backup de la versión anterior"""
+        try:
+            if not self.pool:
+                return False
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            ruta_backup = f"{ruta_remota}.backup_{timestamp}"
+            with self.pool.conexion() as ssh:
+                resumen = TransferenciaDeltaSQLite(ssh).subir(ruta_local, ruta_remota, ruta_backup)
+            self.logger.info(
+                f"Delta de subida: {resumen['bloques_transferidos']}/{resumen['bloques_total']} páginas "
+                f"({resumen['bytes_transferidos'] / 1024:.1f} KB de {resumen['tamano'] / 1024:.1f} KB), "
+                f"backup en {ruta_backup}"
+            )
+            return True
+        except Exception as e:
+            self.logger.warning(f"Delta de subida no disponible para {ruta_remota}: {e}")
+            return False
+    
+    def aplicar_cambios(self, diario, ruta_remota):
+        """Aplicar el changeset del diario en la base remota.
+        
+        None si el servidor no lo recibió o lo rechazó sin aplicarlo, y
+        {'ok': None, 'desconocido': True} si se envió y la respuesta se perdió.
+        """
+        try:
+            if not self.pool:
+                return None
+            with self.pool.conexion() as ssh:
+                resultado = diario.aplicar_remoto(ssh, ruta_remota)
+            if resultado.get('ok'):
+                self.logger.info(
+                    f"Changeset aplicado en {ruta_remota}: {resultado['aplicados']} cambios, "
+                    f"{resultado['reasignados']} ids reasignados"
+                )
+            elif resultado.get('desconocido'):
+                self.logger.warning(f"Sin respuesta al aplicar el changeset en {ruta_remota}: {resultado['error']}")
+            return resultado
+        except Exception as e:
+            self.logger.warning(f"No se pudo aplicar el changeset en {ruta_remota}: {e}")
+            return None
+    
+    def aplicar_migraciones(self, ruta_remota):
+        """Aplicar las migraciones de esquema pendientes directamente en la base remota (None si falla)"""
+        try:
+            if not self.pool:
+                return None
+            with self.pool.conexion() as ssh:
+                return SentenciasRemotas(ssh, ruta_remota).migrador('migracion').aplicar()
+        except Exception as e:
+            self.logger.warning(f"No se pudieron aplicar las migraciones en {ruta_remota}: {e}")
+            return None
+    
+    def guardar_respaldo(self, ruta_repositorio, ruta_db, etiqueta, retencion):
+        """Instantánea deduplicada en el repositorio remoto seguida de la poda (None si falla)"""
+        try:
+            if not self.pool:
+                return None
+            with self.pool.conexion() as ssh:
+                repositorio = RepositorioRespaldos(ssh, ruta_repositorio)
+                info = repositorio.guardar(ruta_db, etiqueta)
+                self.logger.info(
+                    f"Instantánea {info['id']} guardada: {info['bloques_nuevos']}/{info['total_bloques']} bloques nuevos, "
+                    f"{info['bytes_nuevos'] / 1024:.1f} KB escritos de {info['tamano'] / 1024:.1f} KB"
+                )
+                try:
+                    info['poda'] = repositorio.podar(**retencion)
+                except Exception as e:
+                    self.logger.warning(f"No se pudo aplicar la retención en {ruta_repositorio}: {e}")
+            return info
+        except Exception as e:
+            self.logger.warning(f"No se pudo guardar la instantánea de {ruta_db}: {e}")
+            return None
+    
+    def restaurar_respaldo(self, ruta_repositorio, instantanea, ruta_local):
+        """Reconstruir una instantánea en el servidor y descargarla a ruta_local"""
+        ruta_remota = f"{ruta_repositorio}/restauraciones/{instantanea}.db"
+        try:
+            if not self.pool:
+                return False
+            with self.pool.conexion() as ssh:
+                info = RepositorioRespaldos(ssh, ruta_repositorio).restaurar(instantanea, ruta_remota)
+            self.logger.info(f"Instantánea {instantanea} reconstruida en {info['segundos']:.1f}s")
+            return self.descargar_archivo(ruta_remota, ruta_local)
+        except Exception as e:
+            self.logger.error(f"Error restaurando la instantánea {instantanea}: {e}")
+            return False
+        finally:
+            try:
+                with self._sesion_sftp() as sftp:
+                    sftp.remove(ruta_remota)
+            except Exception:
+                pass
+    
+    def verificar_respaldos(self, ruta_repositorio):
+        """Verificar bloque por bloque el repositorio de respaldos (None si no responde)"""
+        try:
+            if not self.pool:
+                return None
+            with self.pool.conexion() as ssh:
+                return RepositorioRespaldos(ssh, ruta_repositorio).verificar()
+        except Exception as e:
+            self.logger.error(f"Error verificando el repositorio {ruta_repositorio}: {e}")
+            return None
+    
     def _crear_directorio_remoto(self, directorio):
         """Crear directorio remoto recursivamente"""
         try:
@@ -494,10 +706,8 @@ class ConexionSSH:
     def renombrar_archivo(self, ruta_vieja, ruta_nueva):
         """Renombrar archivo en el servidor remoto"""
         try:
-            if not self.sftp and not self.conectar():
-                return False
-            
-            self.sftp.rename(ruta_vieja, ruta_nueva)
+            with self._sesion_sftp() as sftp:
+                sftp.rename(ruta_vieja, ruta_nueva)
             self.logger.info(f"Archivo renombrado: {ruta_vieja} -> {ruta_nueva}")
             return True
             
@@ -508,10 +718,8 @@ class ConexionSSH:
     def listar_directorio(self, ruta):
         """Listar contenido de directorio remoto"""
         try:
-            if not self.sftp and not self.conectar():
-                return []
-            
-            return self.sftp.listdir(ruta)
+            with self._sesion_sftp() as sftp:
+                return sftp.listdir(ruta)
             
         except Exception as e:
             self.logger.error(f"Error listando directorio {ruta}: {e}")
@@ -520,10 +728,8 @@ class ConexionSSH:
     def existe_archivo(self, ruta):
         """Verificar si existe archivo en servidor remoto"""
         try:
-            if not self.sftp and not self.conectar():
-                return False
-            
-            self.sftp.stat(ruta)
+            with self._sesion_sftp() as sftp:
+                sftp.stat(ruta)
             return True
             
         except:
@@ -561,6 +767,14 @@ class ConexionSSH:
 class GestorBaseDatos:
     """Gestiona operaciones de base de datos SQLite"""
     
+    # Tabla paginada -> columna de orden (desempate por id)
+    ORDEN_PAGINACION = {
+        'inscritos': 'fecha_registro',
+        'estudiantes': 'fecha_ingreso',
+        'egresados': 'fecha_graduacion',
+        'contratados': 'fecha_contratacion',
+    }
+    
     def __init__(self, conexion_ssh, config_paths, estado):
         self.conexion_ssh = conexion_ssh
         self.config_paths = config_paths
@@ -568,6 +782,13 @@ class GestorBaseDatos:
         self.logger = Logger()
         self.db_local_temp = None
         self.page_size = 50
+        self.tablas_fts = set()
+        self.diario = DiarioCambios()
+    
+    def _ruta_espejo(self):
+        """Copia local persistente de la base remota que sirve de base para los deltas"""
+        clave = f"{self.conexion_ssh.config.get('host')}:{self.config_paths.get('remote_db_escuela')}"
+        return os.path.join(tempfile.gettempdir(), f"migracion_espejo_{hashlib.md5(clave.encode()).hexdigest()[:12]}.db")
     
     def sincronizar_desde_remoto(self):
         """Descargar base de datos desde servidor remoto"""
@@ -576,8 +797,9 @@ class GestorBaseDatos:
             
             # Crear archivo temporal local
             temp_dir = tempfile.gettempdir()
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
             self.db_local_temp = os.path.join(temp_dir, f"migracion_temp_{timestamp}.db")
+            self.diario.reiniciar()
             
             # Verificar espacio en disco
             espacio_ok, espacio_mb = Utilidades.verificar_espacio_disco(temp_dir, 200)
@@ -589,7 +811,26 @@ class GestorBaseDatos:
             if not ruta_remota:
                 raise Exception("No se configuró ruta de base de datos remota")
             
-            if not self.conexion_ssh.descargar_archivo(ruta_remota, self.db_local_temp):
+            # Solo viajan las páginas que cambiaron desde la última sincronización;
+            # sin espejo conviene la descarga completa comprimida. El espejo lo
+            # comparten las sesiones: se parcha y se copia bajo su candado, y
+            # el SHA-256 remoto se comprueba sobre la copia de esta sesión
+            espejo = self._ruta_espejo()
+            with TransferenciaDeltaSQLite.candado_espejo(espejo):
+                sha256 = os.path.exists(espejo) and self.conexion_ssh.descargar_base_delta(ruta_remota, espejo)
+                try:
+                    descargada = bool(sha256) and bool(
+                        TransferenciaDeltaSQLite.copiar_verificada(espejo, self.db_local_temp, sha256)
+                    )
+                except ValueError as e:
+                    self.logger.warning(f"Copia del espejo descartada: {e}")
+                    descargada = False
+                if not descargada:
+                    descargada = self.conexion_ssh.descargar_archivo(ruta_remota, self.db_local_temp)
+                    if descargada:
+                        shutil.copyfile(self.db_local_temp, espejo)
+            
+            if not descargada:
                 # Si no existe, crear nueva
                 self.logger.warning("Base de datos remota no encontrada, creando nueva...")
                 self._crear_nueva_base_datos()
@@ -617,12 +858,52 @@ class GestorBaseDatos:
             if not ruta_remota:
                 raise Exception("No se configuró ruta de base de datos remota")
             
-            # Crear backup en servidor antes de subir
-            self.conexion_ssh.crear_backup_remoto(ruta_remota)
+            # Solo viajan las filas cambiadas, aplicadas en una transacción remota
+            if not self.diario.requiere_subida_completa:
+                if not self.diario.cambios:
+                    self.logger.info("Sin cambios locales que sincronizar")
+                    return True
+                
+                # Subir la base completa pisaría lo que cambió en el servidor: si el
+                # changeset no se aplicó, la sincronización falla y no hay otra vía
+                resultado = self.conexion_ssh.aplicar_cambios(self.diario, ruta_remota)
+                if resultado is None:
+                    self.logger.error("El servidor no aplicó los cambios locales; se conservan para reintentar")
+                    return False
+                
+                if resultado.get('desconocido'):
+                    # El COMMIT remoto pudo ocurrir: reintentar podría duplicar los cambios,
+                    # así que la copia local se reemplaza por el estado real del servidor
+                    self.logger.error("No se confirmó si el servidor aplicó los cambios; se vuelve a descargar la base")
+                    self.sincronizar_desde_remoto()
+                    return False
+                
+                if not resultado.get('ok'):
+                    for conflicto in resultado.get('conflictos', []):
+                        self.logger.error(
+                            f"Conflicto en {conflicto['tabla']} ({conflicto['operacion']} "
+                            f"fila {conflicto['fila']}): {conflicto['motivo']}"
+                        )
+                    return False
+                
+                self.diario.reiniciar()
+                self.estado.marcar_sincronizacion()
+                return True
+            
+            # Solo queda la subida completa cuando el diario no pudo registrar los cambios
+            # El delta deja el backup en el servidor y reemplaza con un rename atómico
+            if not self.conexion_ssh.subir_base_delta(self.db_local_temp, ruta_remota):
+                # Crear backup en servidor antes de subir
+                self.conexion_ssh.crear_backup_remoto(ruta_remota)
+                
+                # Subir base de datos
+                if not self.conexion_ssh.subir_archivo(self.db_local_temp, ruta_remota):
+                    raise Exception("Error subiendo base de datos al servidor")
             
-            # Subir base de datos
-            if not self.conexion_ssh.subir_archivo(self.db_local_temp, ruta_remota):
-                raise Exception("Error subiendo base de datos al servidor")
+            # Lo subido es ahora la versión remota: base del siguiente delta
+            with TransferenciaDeltaSQLite.candado_espejo(self._ruta_espejo()):
+                shutil.copyfile(self.db_local_temp, self._ruta_espejo())
+            self.diario.reiniciar()
             
             self.estado.marcar_sincronizacion()
             self.logger.info("Base de datos subida exitosamente al servidor")
@@ -735,9 +1016,11 @@ class GestorBaseDatos:
             ''', ('admin', password_hash, salt, 'administrador', 'Administrador del Sistema', 'admin@escuela.edu.mx', 'ADMIN-001'))
             
             conn.commit()
+            MigradorEsquema.para_conexion(conn, 'migracion').aplicar()
             conn.close()
             
-            # Subir al servidor
+            # Subir al servidor (la estructura nueva no pasa por el diario)
+            self.diario.reiniciar(requiere_subida_completa=True)
             self.sincronizar_hacia_remoto()
             
             self.estado.marcar_db_inicializada()
@@ -777,6 +1060,18 @@ class GestorBaseDatos:
                     self._crear_nueva_base_datos()
                     return
             
+            # Los cambios de esquema no pasan por el diario: se aplican también en el
+            # servidor, porque subir la copia completa pisaría otras sesiones
+            if MigradorEsquema.para_conexion(conn, 'migracion').aplicar():
+                if self.conexion_ssh.aplicar_migraciones(self.config_paths.get('remote_db_escuela')) is None:
+                    conn.close()
+                    raise Exception("No se pudieron aplicar las migraciones en el servidor")
+            self.tablas_fts = {
+                tabla for tabla in self.ORDEN_PAGINACION
+                if IndiceBusquedaTexto.tabla_fts(tabla) in tablas_encontradas
+                and IndiceBusquedaTexto.tabla_pendientes(tabla) in tablas_encontradas
+            }
+            
             self.logger.info(f"Base de datos verificada: {len(tablas)} tablas encontradas")
             conn.close()
             
@@ -797,11 +1092,14 @@ class GestorBaseDatos:
             conn = sqlite3.connect(self.db_local_temp)
             conn.row_factory = sqlite3.Row
             conn.execute("PRAGMA busy_timeout = 5000")
+            self.diario.instalar(conn)
             
             yield conn
             
             if conn:
+                cambios = self.diario.recoger(conn)
                 conn.commit()
+                self.diario.confirmar(cambios)
                 
         except Exception as e:
             if conn:
@@ -812,43 +1110,253 @@ class GestorBaseDatos:
             if conn:
                 conn.close()
     
+    # Paginación por cursor: cada página se delimita por la llave (orden, id)
+    # de su primera/última fila, así que la página N cuesta lo mismo que la 1.
+    
+    @staticmethod
+    def _codificar_token(direccion, valor_orden, id_registro):
+        """Serializar la llave de corte de una página como token opaco"""
+        crudo = json.dumps({'d': direccion, 'k': [valor_orden, id_registro]}, default=str)
+        return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decodificar_token(token):
+        """Recuperar (dirección, valor_orden, id) de un token; None si es inválido"""
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            valor_orden, id_registro = datos['k']
+            if datos['d'] not in ('sig', 'ant'):
+                return None
+            return datos['d'], valor_orden, id_registro
+        except Exception:
+            return None
+    
+    @staticmethod
+    def _expresion_orden(orden):
+        """Expresión de orden del cursor: los NULL se ordenan como '' (igual que en el índice)"""
+        return f"COALESCE({orden}, '')"
+    
+    @classmethod
+    def _condicion_cursor(cls, orden, direccion, valor_orden, id_registro):
+        """Filas después ('sig', DESC) o antes ('ant') de la llave (orden, id).
+        
+        Se compara la misma expresión COALESCE que ordena y que indexa la
+        migración 5: una fila con fecha NULL queda en el orden como '' y el
+        corte la alcanza. La comparación va expandida en lugar de por valor de
+        fila, que SQLite no usa para buscar en un índice de expresión.
+        """
+        expresion = cls._expresion_orden(orden)
+        valor_orden = '' if valor_orden is None else valor_orden
+        comparador = '<' if direccion == 'sig' else '>'
+        return (
+            f"({expresion} {comparador}= ? AND ({expresion} {comparador} ? OR id {comparador} ?))",
+            [valor_orden, valor_orden, id_registro]
+        )
+    
+    @staticmethod
+    def _llave_fila(df, posicion, orden):
+        """Llave (orden, id) de una fila del DataFrame como tipos nativos JSON"""
+        fila = df.iloc[posicion]
+        llave = []
+        for campo in (orden, 'id'):
+            valor = fila[campo]
+            if hasattr(valor, 'item'):
+                valor = valor.item()
+            if campo == orden and pd.isna(valor):
+                valor = ''
+            llave.append(valor)
+        return llave
+    
+    def _marcadores_paginacion(self, tabla, search_term):
+        """Tokens conocidos por número de página para la sesión actual"""
+        try:
+            marcadores = st.session_state.setdefault('marcadores_paginacion', {})
+        except Exception:
+            marcadores = self.__dict__.setdefault('_marcadores_paginacion', {})
+        return marcadores.setdefault((tabla, search_term, self.page_size), {})
+    
+    def _filtro_busqueda(self, tabla, search_term):
+        """Condición de búsqueda con sus parámetros.
+        
+        Si la base trae el índice FTS5 de la tabla (lo crea y mantiene la
+        aplicación escolar) y el término tiene al menos tres caracteres, los
+        ids se resuelven en el índice de trigramas, salvo las filas que aún
+        esperan en la cola de pendientes, que se evalúan con LIKE; si no,
+        LIKE sobre matrícula, nombre y email.
+        """
+        if not search_term:
+            return [], []
+        search_pattern = f"%{search_term}%"
+        condicion = "(matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?)"
+        params = [search_pattern, search_pattern, search_pattern]
+        if tabla in self.tablas_fts:
+            consulta_match = IndiceBusquedaTexto.consulta_match(search_term)
+            if consulta_match:
+                fts = IndiceBusquedaTexto.tabla_fts(tabla)
+                pendientes = IndiceBusquedaTexto.tabla_pendientes(tabla)
+                return [
+                    f"((id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?) "
+                    f"AND id NOT IN (SELECT id FROM {pendientes})) "
+                    f"OR (id IN (SELECT id FROM {pendientes}) AND {condicion}))"
+                ], [consulta_match] + params
+        return [condicion], params
+    
+    def _consultar_keyset(self, conn, tabla, orden, token=None, search_term=""):
+        """Página por cursor sobre (orden, id) DESC.
+        
+        Sin token regresa la primera página; un token 'sig' avanza después de
+        la llave que contiene y uno 'ant' retrocede antes de ella. Regresa
+        (df, token_siguiente, token_anterior, total); los tokens son None en
+        los extremos. Se pide una fila extra para saber si hay más allá del
+        corte. El total viaja en la misma sentencia como subconsulta escalar
+        sobre la búsqueda sin cursor: COUNT(*) OVER() contaría solo las filas
+        posteriores al corte.
+        """
+        condiciones, params = self._filtro_busqueda(tabla, search_term)
+        where_busqueda = ("WHERE " + condiciones[0]) if condiciones else ""
+        params = params + params
+        
+        direccion = None
+        if token:
+            decodificado = self._decodificar_token(token)
+            if decodificado is None:
+                self.logger.warning(f"Token de paginación inválido para {tabla}, regresando a la primera página")
+            else:
+                direccion, valor_orden, id_registro = decodificado
+                condicion_cursor, params_cursor = self._condicion_cursor(orden, direccion, valor_orden, id_registro)
+                condiciones.append(condicion_cursor)
+                params.extend(params_cursor)
+        
+        sentido = 'ASC' if direccion == 'ant' else 'DESC'
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        query = f"""
+            SELECT *, (SELECT COUNT(*) FROM {tabla} {where_busqueda}) AS _total_registros 
+            FROM {tabla} 
+            {where}
+            ORDER BY {self._expresion_orden(orden)} {sentido}, id {sentido} 
+            LIMIT ?
+        """
+        df = pd.read_sql_query(query, conn, params=params + [self.page_size + 1])
+        
+        df, total_records = self._separar_total(df)
+        if total_records is None:
+            # Página vacía: sin filas no llega el total; solo hay que
+            # contarlo aparte si el corte dejó fuera registros.
+            total_records = self._contar_registros(conn, tabla, search_term) if direccion else 0
+        
+        hay_mas = len(df) > self.page_size
+        df = df.iloc[:self.page_size]
+        if direccion == 'ant':
+            df = df.iloc[::-1]
+        df = df.reset_index(drop=True)
+        
+        if df.empty:
+            return df, None, None, total_records
+        
+        # Hacia atrás siempre existe la página de la que venimos; hacia
+        # adelante solo existe la anterior si llegamos con un token.
+        existe_siguiente = hay_mas if direccion != 'ant' else True
+        existe_anterior = direccion == 'sig' or (direccion == 'ant' and hay_mas)
+        
+        token_siguiente = self._codificar_token('sig', *self._llave_fila(df, -1, orden)) if existe_siguiente else None
+        token_anterior = self._codificar_token('ant', *self._llave_fila(df, 0, orden)) if existe_anterior else None
+        return df, token_siguiente, token_anterior, total_records
+    
+    def _consultar_salto(self, conn, tabla, orden, page, search_term):
+        """Salto directo a una página sin token: OFFSET con el mismo orden total.
+        
+        Aquí no hay corte por cursor, así que COUNT(*) OVER() cuenta la
+        búsqueda completa antes de aplicar LIMIT/OFFSET.
+        """
+        condiciones, params = self._filtro_busqueda(tabla, search_term)
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        query = f"""
+            SELECT *, COUNT(*) OVER() AS _total_registros FROM {tabla} 
+            {where}
+            ORDER BY {self._expresion_orden(orden)} DESC, id DESC 
+            LIMIT ? OFFSET ?
+        """
+        df = pd.read_sql_query(query, conn, params=params + [self.page_size + 1, (page - 1) * self.page_size])
+        
+        df, total_records = self._separar_total(df)
+        if total_records is None:
+            total_records = self._contar_registros(conn, tabla, search_term)
+        
+        hay_mas = len(df) > self.page_size
+        df = df.iloc[:self.page_size].reset_index(drop=True)
+        if df.empty:
+            return df, None, None, total_records
+        
+        token_siguiente = self._codificar_token('sig', *self._llave_fila(df, -1, orden)) if hay_mas else None
+        token_anterior = self._codificar_token('ant', *self._llave_fila(df, 0, orden))
+        return df, token_siguiente, token_anterior, total_records
+    
+    @staticmethod
+    def _separar_total(df):
+        """Quitar la columna _total_registros y regresar (df, total o None)"""
+        if '_total_registros' not in df.columns:
+            return df, None
+        total_records = int(df['_total_registros'].iloc[0]) if not df.empty else None
+        return df.drop(columns=['_total_registros']), total_records
+    
+    def _contar_registros(self, conn, tabla, search_term):
+        """Total de registros que cumplen la búsqueda (solo para páginas vacías)"""
+        condiciones, params = self._filtro_busqueda(tabla, search_term)
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        return conn.execute(f"SELECT COUNT(*) FROM {tabla} {where}", params).fetchone()[0]
+    
+    def _consultar_pagina(self, tabla, orden, page=1, search_term=""):
+        """Consulta paginada por número de página sobre el cursor (orden, id).
+        
+        Las páginas visitadas dejan registrados los tokens de sus vecinas, de
+        modo que avanzar o retroceder una página usa el cursor. Solo un salto
+        a una página nunca visitada recurre a OFFSET, y aun así deja sus
+        tokens listos para la navegación siguiente. La página y el total
+        llegan juntos en una sola consulta.
+        """
+        page = max(1, int(page))
+        marcadores = self._marcadores_paginacion(tabla, search_term)
+        
+        with self.obtener_conexion() as conn:
+            if page == 1 or page in marcadores:
+                df, token_siguiente, token_anterior, total_records = self._consultar_keyset(
+                    conn, tabla, orden, marcadores.get(page) if page > 1 else None, search_term
+                )
+            else:
+                df, token_siguiente, token_anterior, total_records = self._consultar_salto(
+                    conn, tabla, orden, page, search_term
+                )
+        
+        if token_siguiente:
+            marcadores[page + 1] = token_siguiente
+        if token_anterior and page > 1:
+            marcadores[page - 1] = token_anterior
+        
+        total_pages = math.ceil(total_records / self.page_size)
+        return df, total_pages, total_records
+    
+    def obtener_pagina_cursor(self, tabla, token=None, search_term=""):
+        """Navegación por tokens opacos para cualquier tabla paginada.
+        
+        Regresa (df, token_siguiente, token_anterior, total_registros).
+        """
+        try:
+            orden = self.ORDEN_PAGINACION[tabla]
+            with self.obtener_conexion() as conn:
+                df, token_siguiente, token_anterior, total_records = self._consultar_keyset(
+                    conn, tabla, orden, token, search_term
+                )
+            return df, token_siguiente, token_anterior, total_records
+        except Exception as e:
+            self.logger.error(f"Error obteniendo página de {tabla}: {e}")
+            return pd.DataFrame(), None, None, 0
+    
     def obtener_inscritos(self, page=1, search_term=""):
         """Obtener inscritos con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            with self.obtener_conexion() as conn:
-                if search_term:
-                    query = """
-                        SELECT * FROM inscritos 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                        ORDER BY fecha_registro DESC 
-                        LIMIT ? OFFSET ?
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params = (search_pattern, search_pattern, search_pattern, self.page_size, offset)
-                else:
-                    query = "SELECT * FROM inscritos ORDER BY fecha_registro DESC LIMIT ? OFFSET ?"
-                    params = (self.page_size, offset)
-                
-                df = pd.read_sql_query(query, conn, params=params)
-                
-                # Obtener total de registros
-                if search_term:
-                    count_query = """
-                        SELECT COUNT(*) FROM inscritos 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                    """
-                    count_params = (search_pattern, search_pattern, search_pattern)
-                else:
-                    count_query = "SELECT COUNT(*) FROM inscritos"
-                    count_params = ()
-                
-                total_records = pd.read_sql_query(count_query, conn, params=count_params).iloc[0, 0]
-                total_pages = math.ceil(total_records / self.page_size)
-                
-                self.logger.debug(f"Obtenidos {len(df)} inscritos (página {page}/{total_pages})")
-                return df, total_pages, total_records
+            df, total_pages, total_records = self._consultar_pagina('inscritos', self.ORDEN_PAGINACION['inscritos'], page, search_term)
+            self.logger.debug(f"Obtenidos {len(df)} inscritos (página {page}/{total_pages})")
+            return df, total_pages, total_records
         except Exception as e:
             self.logger.error(f"Error obteniendo inscritos: {e}")
             return pd.DataFrame(), 0, 0
@@ -856,39 +1364,7 @@ class GestorBaseDatos:
     def obtener_estudiantes(self, page=1, search_term=""):
         """Obtener estudiantes con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            with self.obtener_conexion() as conn:
-                if search_term:
-                    query = """
-                        SELECT * FROM estudiantes 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                        ORDER BY fecha_ingreso DESC 
-                        LIMIT ? OFFSET ?
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params = (search_pattern, search_pattern, search_pattern, self.page_size, offset)
-                else:
-                    query = "SELECT * FROM estudiantes ORDER BY fecha_ingreso DESC LIMIT ? OFFSET ?"
-                    params = (self.page_size, offset)
-                
-                df = pd.read_sql_query(query, conn, params=params)
-                
-                # Obtener total de registros
-                if search_term:
-                    count_query = """
-                        SELECT COUNT(*) FROM estudiantes 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                    """
-                    count_params = (search_pattern, search_pattern, search_pattern)
-                else:
-                    count_query = "SELECT COUNT(*) FROM estudiantes"
-                    count_params = ()
-                
-                total_records = pd.read_sql_query(count_query, conn, params=count_params).iloc[0, 0]
-                total_pages = math.ceil(total_records / self.page_size)
-                
-                return df, total_pages, total_records
+            return self._consultar_pagina('estudiantes', self.ORDEN_PAGINACION['estudiantes'], page, search_term)
         except Exception as e:
             self.logger.error(f"Error obteniendo estudiantes: {e}")
             return pd.DataFrame(), 0, 0
@@ -896,39 +1372,7 @@ class GestorBaseDatos:
     def obtener_egresados(self, page=1, search_term=""):
         """Obtener egresados con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            with self.obtener_conexion() as conn:
-                if search_term:
-                    query = """
-                        SELECT * FROM egresados 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                        ORDER BY fecha_graduacion DESC 
-                        LIMIT ? OFFSET ?
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params = (search_pattern, search_pattern, search_pattern, self.page_size, offset)
-                else:
-                    query = "SELECT * FROM egresados ORDER BY fecha_graduacion DESC LIMIT ? OFFSET ?"
-                    params = (self.page_size, offset)
-                
-                df = pd.read_sql_query(query, conn, params=params)
-                
-                # Obtener total de registros
-                if search_term:
-                    count_query = """
-                        SELECT COUNT(*) FROM egresados 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                    """
-                    count_params = (search_pattern, search_pattern, search_pattern)
-                else:
-                    count_query = "SELECT COUNT(*) FROM egresados"
-                    count_params = ()
-                
-                total_records = pd.read_sql_query(count_query, conn, params=count_params).iloc[0, 0]
-                total_pages = math.ceil(total_records / self.page_size)
-                
-                return df, total_pages, total_records
+            return self._consultar_pagina('egresados', self.ORDEN_PAGINACION['egresados'], page, search_term)
         except Exception as e:
             self.logger.error(f"Error obteniendo egresados: {e}")
             return pd.DataFrame(), 0, 0
@@ -936,39 +1380,7 @@ class GestorBaseDatos:
     def obtener_contratados(self, page=1, search_term=""):
         """Obtener contratados con paginación y búsqueda"""
         try:
-            offset = (page - 1) * self.page_size
-            
-            with self.obtener_conexion() as conn:
-                if search_term:
-                    query = """
-                        SELECT * FROM contratados 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                        ORDER BY fecha_contratacion DESC 
-                        LIMIT ? OFFSET ?
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params = (search_pattern, search_pattern, search_pattern, self.page_size, offset)
-                else:
-                    query = "SELECT * FROM contratados ORDER BY fecha_contratacion DESC LIMIT ? OFFSET ?"
-                    params = (self.page_size, offset)
-                
-                df = pd.read_sql_query(query, conn, params=params)
-                
-                # Obtener total de registros
-                if search_term:
-                    count_query = """
-                        SELECT COUNT(*) FROM contratados 
-                        WHERE matricula LIKE ? OR nombre_completo LIKE ? OR email LIKE ?
-                    """
-                    count_params = (search_pattern, search_pattern, search_pattern)
-                else:
-                    count_query = "SELECT COUNT(*) FROM contratados"
-                    count_params = ()
-                
-                total_records = pd.read_sql_query(count_query, conn, params=count_params).iloc[0, 0]
-                total_pages = math.ceil(total_records / self.page_size)
-                
-                return df, total_pages, total_records
+            return self._consultar_pagina('contratados', self.ORDEN_PAGINACION['contratados'], page, search_term)
         except Exception as e:
             self.logger.error(f"Error obteniendo contratados: {e}")
             return pd.DataFrame(), 0, 0
@@ -1196,6 +1608,12 @@ class ServicioBackup:
         self.logger = Logger()
         self.backup_dir = "backups_migracion"
         self.max_backups = 10
+        self.retencion = {'horas': 24, 'dias': 30, 'meses': 12}
+    
+    def _ruta_repositorio(self):
+        """Repositorio remoto de respaldos (por defecto junto a la base)"""
+        ruta_db = self.config_paths.get('remote_db_escuela', '')
+        return self.config_paths.get('backup_path') or f"{os.path.dirname(ruta_db)}/backups"
     
     def crear_backup(self, tipo_migracion, detalles):
         """Crear backup automático antes de una migración"""
@@ -1204,6 +1622,37 @@ class ServicioBackup:
                 os.makedirs(self.backup_dir)
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            metadata = {
+                'fecha_backup': datetime.now().isoformat(),
+                'tipo_migracion': tipo_migracion,
+                'detalles': detalles,
+                'usuario': st.session_state.get('usuario_actual', {}).get('usuario', 'desconocido')
+            }
+            
+            # Instantánea en el repositorio del servidor: la base no se descarga antes de migrar
+            ruta_remota = self.config_paths.get('remote_db_escuela')
+            if ruta_remota:
+                instantanea = self.conexion_ssh.guardar_respaldo(
+                    self._ruta_repositorio(), ruta_remota, tipo_migracion, self.retencion
+                )
+                if instantanea:
+                    metadata.update({
+                        'ubicacion': 'repositorio_remoto',
+                        'instantanea': instantanea['id'],
+                        'tamano': instantanea['tamano'],
+                        'bytes_nuevos': instantanea['bytes_nuevos'],
+                        'sha256': instantanea['sha256']
+                    })
+                    metadata_path = os.path.join(self.backup_dir, f"backup_{tipo_migracion}_{timestamp}.json")
+                    with open(metadata_path, 'w') as f:
+                        json.dump(metadata, f, indent=2, default=str)
+                    
+                    poda = instantanea.get('poda')
+                    self._limpiar_backups_antiguos(poda['conservadas'] if poda else None)
+                    self.estado.registrar_backup()
+                    return metadata_path
+            
+            self.logger.warning("Repositorio de respaldos no disponible, respaldando con descarga completa")
             backup_filename = f"backup_{tipo_migracion}_{timestamp}.zip"
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
@@ -1227,13 +1676,6 @@ class ServicioBackup:
                         zipf.write(temp_db_path, 'database.db')
                         
                         # Agregar metadatos
-                        metadata = {
-                            'fecha_backup': datetime.now().isoformat(),
-                            'tipo_migracion': tipo_migracion,
-                            'detalles': detalles,
-                            'usuario': st.session_state.get('usuario_actual', {}).get('usuario', 'desconocido')
-                        }
-                        
                         metadata_str = json.dumps(metadata, indent=2, default=str)
                         zipf.writestr('metadata.json', metadata_str)
                     
@@ -1256,8 +1698,8 @@ class ServicioBackup:
             self.logger.error(f"Error creando backup: {e}")
             return None
     
-    def _limpiar_backups_antiguos(self):
-        """Mantener solo los últimos N backups"""
+    def _limpiar_backups_antiguos(self, conservadas=None):
+        """Mantener solo los últimos N zip; las instantáneas siguen la retención del repositorio"""
         try:
             if not os.path.exists(self.backup_dir):
                 return
@@ -1276,6 +1718,23 @@ class ServicioBackup:
                     self.logger.info(f"Backup antiguo eliminado: {backup[0]}")
                 except Exception as e:
                     self.logger.warning(f"No se pudo eliminar backup antiguo: {e}")
+            
+            if conservadas is None:
+                return
+            
+            # Metadatos de instantáneas que la retención ya eliminó del servidor
+            for file in os.listdir(self.backup_dir):
+                if not (file.startswith('backup_') and file.endswith('.json')):
+                    continue
+                filepath = os.path.join(self.backup_dir, file)
+                try:
+                    with open(filepath, 'r') as f:
+                        instantanea = json.load(f).get('instantanea')
+                    if instantanea and instantanea not in conservadas:
+                        os.remove(filepath)
+                        self.logger.info(f"Instantánea fuera de retención: {instantanea}")
+                except Exception as e:
+                    self.logger.warning(f"No se pudo depurar metadato {file}: {e}")
                     
         except Exception as e:
             self.logger.error(f"Error limpiando backups antiguos: {e}")
@@ -1297,12 +1756,36 @@ class ServicioBackup:
                         'fecha': datetime.fromtimestamp(os.path.getmtime(filepath))
                     }
                     backups.append(file_info)
+                elif file.startswith('backup_') and file.endswith('.json'):
+                    filepath = os.path.join(self.backup_dir, file)
+                    try:
+                        with open(filepath, 'r') as f:
+                            metadata = json.load(f)
+                        backups.append({
+                            'nombre': f"{metadata['instantanea']}.db",
+                            'ruta': filepath,
+                            'instantanea': metadata['instantanea'],
+                            'tamaño': metadata.get('tamano', 0),
+                            'fecha': datetime.fromisoformat(metadata['fecha_backup'])
+                        })
+                    except Exception as e:
+                        self.logger.warning(f"Error leyendo metadato {file}: {e}")
             
             return sorted(backups, key=lambda x: x['fecha'], reverse=True)
             
         except Exception as e:
             self.logger.error(f"Error listando backups: {e}")
             return []
+    
+    def restaurar_backup(self, backup, ruta_local):
+        """Reconstruir una instantánea del repositorio remoto en ruta_local"""
+        if not backup.get('instantanea'):
+            return False
+        return self.conexion_ssh.restaurar_respaldo(self._ruta_repositorio(), backup['instantanea'], ruta_local)
+    
+    def verificar_backups(self):
+        """Verificar la integridad de todas las instantáneas del repositorio remoto"""
+        return self.conexion_ssh.verificar_respaldos(self._ruta_repositorio())
 
 # -----------------------------------------------------------------------------
 # 3.3 SERVICIO DE MIGRACIÓN
@@ -2009,6 +2492,17 @@ class BarraLateral:
                     else:
                         st.error("❌ Error creando backup")
             
+            if st.button("🔍 Verificar Backups", use_container_width=True):
+                with st.spinner("Verificando repositorio de respaldos..."):
+                    verificacion = self.servicio_backup.verificar_backups()
+                if verificacion is None:
+                    st.error("❌ No se pudo consultar el repositorio de respaldos")
+                elif verificacion['ok']:
+                    st.success(f"✅ {len(verificacion['instantaneas'])} instantáneas íntegras")
+                else:
+                    danadas = [i for i, r in verificacion['instantaneas'].items() if not r['ok']]
+                    st.error(f"❌ Instantáneas dañadas: {', '.join(danadas)}")
+            
             st.markdown("---")
             
             # Botones de control
@@ -2050,10 +2544,39 @@ class BarraLateral:
 # APLICACIÓN PRINCIPAL
 # =============================================================================
 
+@st.cache_resource(show_spinner=False)
+def obtener_estado_persistente():
+    """Estado único por proceso: el JSON se lee una vez y no en cada rerun"""
+    return EstadoPersistente()
+
+@st.cache_resource(show_spinner=False)
+def obtener_conexion_ssh(ssh_config):
+    """Conexión SSH única por proceso; la prueba inicial corre una vez y en segundo plano.
+    
+    El primer render no espera al servidor, y si el servidor responde, la
+    primera operación real ya encuentra la conexión abierta en el pool.
+    """
+    conexion = ConexionSSH(ssh_config)
+    estado = obtener_estado_persistente()
+    
+    def probar():
+        try:
+            if conexion.probar_conexion():
+                estado.set_ssh_conectado(True, None)
+            else:
+                estado.set_ssh_conectado(False, "Error en prueba inicial")
+        except Exception as e:
+            estado.set_ssh_conectado(False, str(e))
+    
+    threading.Thread(target=probar, name='prueba_ssh', daemon=True).start()
+    return conexion
+
 class AplicacionMigracion:
     """Aplicación principal de migración"""
     
     def __init__(self):
+        self.logger = Logger()
+        
         # Configuración de página
         st.set_page_config(
             page_title="Sistema Escuela Enfermería - Migración SSH REMOTA",
@@ -2084,11 +2607,9 @@ class AplicacionMigracion:
                 st.error("❌ No se configuró host SSH en secrets.toml")
                 return
             
-            # Inicializar estado persistente
-            self.estado = EstadoPersistente()
-            
-            # Inicializar conexión SSH
-            self.conexion_ssh = ConexionSSH(ssh_config)
+            # Estado persistente y conexión SSH: únicos por proceso, no se rehacen en cada rerun
+            self.estado = obtener_estado_persistente()
+            self.conexion_ssh = obtener_conexion_ssh(ssh_config)
             
             # Inicializar gestor de base de datos
             self.gestor_db = GestorBaseDatos(self.conexion_ssh, paths_config, self.estado)
@@ -2103,22 +2624,9 @@ class AplicacionMigracion:
             self.interfaz_login = InterfazLogin(self.servicio_auth, self.gestor_db, self.estado, self.conexion_ssh)
             self.interfaz_migracion = InterfazMigracion(self.servicio_migracion, self.servicio_auth, self.gestor_db, self.conexion_ssh)
             
-            # Probar conexión SSH inicial
-            self._probar_conexion_inicial()
-            
         except Exception as e:
             st.error(f"❌ Error inicializando aplicación: {e}")
     
-    def _probar_conexion_inicial(self):
-        """Probar conexión SSH al inicio"""
-        try:
-            if self.conexion_ssh.probar_conexion():
-                self.estado.set_ssh_conectado(True, None)
-            else:
-                self.estado.set_ssh_conectado(False, "Error en prueba inicial")
-        except Exception as e:
-            self.estado.set_ssh_conectado(False, str(e))
-    
     def _inicializar_sesion(self):
         """Inicializar estado de sesión"""
         session_defaults = {
@@ -2150,6 +2658,15 @@ class AplicacionMigracion:
                 self.interfaz_login.mostrar()
             else:
                 self.interfaz_migracion.mostrar()
+            
+            duracion = time.time() - INICIO_EJECUCION
+            if not st.session_state.get('primer_render_medido'):
+                st.session_state.primer_render_medido = True
+                self.logger.info(
+                    f"Primer render de la sesión en {duracion:.2f}s (SSH: {self.estado.estado.get('ssh_conectado')})"
+                )
+            else:
+                self.logger.debug(f"Rerun en {duracion:.2f}s")
                 
         except Exception as e:
             self._mostrar_error_critico(e)
@@ -0,0 +1,43 @@
+"""
+Configuración de pytest: las aplicaciones son módulos sueltos en la raíz del
+repositorio, así que se agregan al path de importación.
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def ruta_db(tmp_path):
+    """Base SQLite en disco con un par de tablas como las de escuela.db"""
+    ruta = str(tmp_path / 'escuela.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE inscritos (
+            id INTEGER PRIMARY KEY,
+            matricula TEXT,
+            nombre_completo TEXT,
+            email TEXT,
+            email_gmail TEXT,
+            promedio REAL,
+            fecha_registro TEXT
+        );
+        CREATE TABLE documentos_subidos (
+            id INTEGER PRIMARY KEY,
+            inscrito_id INTEGER,
+            nombre_archivo TEXT,
+            contenido BLOB
+        );
+        INSERT INTO inscritos (matricula, nombre_completo, email, promedio, fecha_registro) VALUES
+            ('A001', 'José Peña', 'jose@correo.mx', 9.5, '2024-01-10'),
+            ('A002', 'Ana Müller', 'ana@correo.mx', NULL, NULL),
+            ('A003', 'Luis Gómez', 'luis@correo.mx', 8, '2024-02-01');
+        INSERT INTO documentos_subidos (inscrito_id, nombre_archivo) VALUES (1, 'acta.pdf');
+    ''')
+    conn.commit()
+    conn.close()
+    return ruta
@@ -0,0 +1,157 @@
+"""
+Diario de cambios (changeset) de compartido.py: se registran los cambios en
+una copia local y se aplican con el mismo script que corre en el servidor,
+ejecutado aquí en un subproceso sobre la base "remota".
+"""
+
+import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from compartido import DiarioCambios
+
+@pytest.fixture
+def copia(ruta_db, tmp_path):
+    """Copia local descargada de la base del servidor"""
+    ruta = str(tmp_path / 'copia.db')
+    shutil.copy(ruta_db, ruta)
+    return ruta
+
+def registrar(diario, ruta, *sentencias):
+    """Ejecutar sentencias en la copia con el diario instalado y confirmarlas"""
+    conn = sqlite3.connect(ruta)
+    assert diario.instalar(conn)
+    for sentencia in sentencias:
+        conn.execute(sentencia)
+    conn.commit()
+    diario.confirmar(diario.recoger(conn))
+    conn.close()
+
+def aplicar_en_servidor(diario, ruta_remota):
+    proceso = subprocess.run(
+        [sys.executable, '-c', DiarioCambios.SCRIPT_REMOTO, ruta_remota],
+        input=json.dumps(diario.paquete()).encode('utf-8'), capture_output=True, check=True
+    )
+    return json.loads(proceso.stdout)
+
+def filas(ruta, sql):
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def test_registra_imagenes_anterior_y_nueva(copia):
+    diario = DiarioCambios()
+    
+    registrar(diario, copia, "UPDATE inscritos SET email = 'nuevo@correo.mx' WHERE id = 1")
+    
+    assert len(diario.cambios) == 1
+    cambio = diario.cambios[0]
+    assert (cambio['tabla'], cambio['operacion'], cambio['fila']) == ('inscritos', 'UPDATE', 1)
+    assert cambio['anterior']['email'] == 'jose@correo.mx'
+    assert cambio['nuevo']['email'] == 'nuevo@correo.mx'
+    assert diario.llaves['inscritos'] == 'id'
+
+def test_transaccion_revertida_no_queda_en_el_diario(copia):
+    diario = DiarioCambios()
+    conn = sqlite3.connect(copia)
+    diario.instalar(conn)
+    conn.execute("DELETE FROM inscritos WHERE id = 3")
+    conn.rollback()
+    
+    assert diario.recoger(conn) == []
+    conn.close()
+
+def test_aplica_insert_update_y_delete(ruta_db, copia):
+    diario = DiarioCambios()
+    registrar(
+        diario, copia,
+        "INSERT INTO inscritos (matricula, nombre_completo) VALUES ('A004', 'Nueva Inscrita')",
+        "UPDATE inscritos SET promedio = 7.25 WHERE id = 2",
+        "DELETE FROM inscritos WHERE id = 3",
+    )
+    
+    resultado = aplicar_en_servidor(diario, ruta_db)
+    
+    assert resultado == {'ok': True, 'aplicados': 3, 'reasignados': 0}
+    assert filas(ruta_db, "SELECT id, matricula, promedio FROM inscritos ORDER BY id") == [
+        (1, 'A001', 9.5), (2, 'A002', 7.25), (4, 'A004', None)
+    ]
+
+def test_conflicto_revierte_todo_el_changeset(ruta_db, copia):
+    diario = DiarioCambios()
+    registrar(
+        diario, copia,
+        "INSERT INTO inscritos (matricula) VALUES ('A004')",
+        "UPDATE inscritos SET email = 'local@correo.mx' WHERE id = 1",
+    )
+    # Otra aplicación modificó la misma fila en el servidor después de la descarga
+    conn = sqlite3.connect(ruta_db)
+    conn.execute("UPDATE inscritos SET email = 'servidor@correo.mx' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    
+    resultado = aplicar_en_servidor(diario, ruta_db)
+    
+    assert resultado['ok'] is False
+    assert resultado['conflictos'][0]['fila'] == 1
+    assert 'email' in resultado['conflictos'][0]['motivo']
+    assert filas(ruta_db, "SELECT COUNT(*) FROM inscritos") == [(3,)]
+
+def test_cambios_en_otras_columnas_no_son_conflicto(ruta_db, copia):
+    diario = DiarioCambios()
+    registrar(diario, copia, "UPDATE inscritos SET promedio = 10 WHERE id = 1")
+    conn = sqlite3.connect(ruta_db)
+    conn.execute("UPDATE inscritos SET email = 'servidor@correo.mx' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    
+    assert aplicar_en_servidor(diario, ruta_db)['ok'] is True
+    assert filas(ruta_db, "SELECT email, promedio FROM inscritos WHERE id = 1") == [('servidor@correo.mx', 10.0)]
+
+def test_id_ocupado_se_reasigna_y_se_corrigen_referencias(ruta_db, copia):
+    diario = DiarioCambios()
+    registrar(
+        diario, copia,
+        "INSERT INTO inscritos (id, matricula) VALUES (4, 'LOCAL')",
+        "INSERT INTO documentos_subidos (inscrito_id, nombre_archivo) VALUES (4, 'curp.pdf')",
+    )
+    # El servidor ya ocupó el id 4 con otro registro
+    conn = sqlite3.connect(ruta_db)
+    conn.execute("INSERT INTO inscritos (id, matricula) VALUES (4, 'SERVIDOR')")
+    conn.commit()
+    conn.close()
+    
+    resultado = aplicar_en_servidor(diario, ruta_db)
+    
+    assert resultado['ok'] is True
+    assert resultado['reasignados'] >= 1
+    nuevo_id = filas(ruta_db, "SELECT id FROM inscritos WHERE matricula = 'LOCAL'")[0][0]
+    assert nuevo_id != 4
+    assert filas(ruta_db, "SELECT inscrito_id FROM documentos_subidos WHERE nombre_archivo = 'curp.pdf'") == [
+        (nuevo_id,)
+    ]
+
+def test_tabla_without_rowid_requiere_subida_completa(copia):
+    conn = sqlite3.connect(copia)
+    conn.execute("CREATE TABLE ajustes (clave TEXT PRIMARY KEY, valor TEXT) WITHOUT ROWID")
+    conn.commit()
+    conn.close()
+    diario = DiarioCambios()
+    
+    registrar(diario, copia, "INSERT INTO ajustes VALUES ('tema', 'oscuro')")
+    
+    assert diario.requiere_subida_completa
+    assert diario.cambios[0]['operacion'] == 'COMPLETA'
+
+def test_base_remota_inexistente_falla_sin_aplicar(tmp_path):
+    diario = DiarioCambios()
+    
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        aplicar_en_servidor(diario, str(tmp_path / 'no_existe.db'))
+    assert b'No existe la base remota' in error.value.stderr
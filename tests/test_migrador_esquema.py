@@ -0,0 +1,106 @@
+"""
+Migraciones versionadas del esquema (MigradorEsquema de compartido.py) sobre
+una conexión sqlite3 local.
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+from compartido import MigradorEsquema
+
+ULTIMA_VERSION = MigradorEsquema.MIGRACIONES[-1][0]
+
+@pytest.fixture
+def conn(ruta_db):
+    conn = sqlite3.connect(ruta_db)
+    yield conn
+    conn.close()
+
+def indices(conn):
+    return {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+def columnas(conn, tabla):
+    return {fila[1] for fila in conn.execute(f'PRAGMA table_info("{tabla}")')}
+
+def test_base_nueva_llega_a_la_ultima_version(conn):
+    migrador = MigradorEsquema.para_conexion(conn, 'pruebas')
+    
+    reporte = migrador.aplicar()
+    
+    assert [r['version'] for r in reporte] == [m[0] for m in MigradorEsquema.MIGRACIONES]
+    assert migrador.version_actual() == ULTIMA_VERSION
+    assert {'idx_inscritos_email', 'idx_inscritos_matricula', 'idx_inscritos_cursor'} <= indices(conn)
+    assert {'sha256', 'tamano_original_bytes'} <= columnas(conn, 'documentos_subidos')
+    assert 'idx_documentos_subidos_sha256' in indices(conn)
+
+def test_tablas_ausentes_se_omiten(conn):
+    reporte = MigradorEsquema.para_conexion(conn, 'pruebas').aplicar()
+    
+    omitidos = {nombre for r in reporte for nombre in r['omitidos']}
+    assert {'idx_usuarios_usuario', 'idx_estudiantes_cursor'} <= omitidos
+    assert not any(nombre.startswith('idx_usuarios') for nombre in indices(conn))
+
+def test_segunda_corrida_no_hace_nada(conn):
+    MigradorEsquema.para_conexion(conn, 'pruebas').aplicar()
+    
+    assert MigradorEsquema.para_conexion(conn, 'otra').aplicar() == []
+    assert conn.execute("SELECT aplicacion FROM schema_version GROUP BY aplicacion").fetchall() == [('pruebas',)]
+
+def test_omitido_se_completa_cuando_aparece_la_tabla(conn):
+    migrador = MigradorEsquema.para_conexion(conn, 'pruebas')
+    migrador.aplicar()
+    conn.execute("CREATE TABLE usuarios (id INTEGER PRIMARY KEY, usuario TEXT, fecha_creacion TEXT)")
+    conn.commit()
+    
+    reporte = migrador.aplicar()
+    
+    assert all(r['completada'] for r in reporte)
+    assert {nombre for r in reporte for nombre in r['creados']} == {'idx_usuarios_usuario', 'idx_usuarios_cursor'}
+    assert {'idx_usuarios_usuario', 'idx_usuarios_cursor'} <= indices(conn)
+
+def test_indices_fecha_id_sin_uso_se_eliminan(conn):
+    migrador = MigradorEsquema.para_conexion(conn, 'pruebas')
+    migrador.version_actual()
+    # Base migrada por una versión anterior: registrada hasta la 5 con los índices (fecha, id)
+    for version in range(1, 6):
+        conn.execute("INSERT INTO schema_version (version, descripcion) VALUES (?, 'anterior')", (version,))
+    conn.execute("CREATE INDEX idx_inscritos_fecha_registro_id ON inscritos(fecha_registro, id)")
+    conn.commit()
+    
+    reporte = migrador.aplicar()
+    
+    assert reporte[-1]['version'] == 6
+    assert reporte[-1]['eliminados'] == ['idx_inscritos_fecha_registro_id']
+    assert 'idx_inscritos_fecha_registro_id' not in indices(conn)
+
+def test_indice_eliminado_recreado_se_vuelve_a_eliminar(conn):
+    migrador = MigradorEsquema.para_conexion(conn, 'pruebas')
+    migrador.aplicar()
+    # Una aplicación sin actualizar lo recrea al completar su versión 1
+    conn.execute("CREATE INDEX idx_inscritos_fecha_registro_id ON inscritos(fecha_registro, id)")
+    conn.commit()
+    
+    reporte = migrador.aplicar()
+    
+    assert reporte == [{
+        'version': 6, 'descripcion': MigradorEsquema.MIGRACIONES[-1][1], 'completada': True,
+        'columnas': [], 'creados': [], 'eliminados': ['idx_inscritos_fecha_registro_id']
+    }]
+    assert 'idx_inscritos_fecha_registro_id' not in indices(conn)
+
+def test_detalle_guarda_planes_antes_y_despues(conn):
+    MigradorEsquema.para_conexion(conn, 'pruebas').aplicar()
+    
+    detalle = json.loads(conn.execute("SELECT detalle FROM schema_version WHERE version = 5").fetchone()[0])
+    
+    plan = detalle['planes']['inscritos_recientes']
+    assert not any('idx_inscritos_cursor' in paso for paso in plan['antes'])
+    assert any('idx_inscritos_cursor' in paso for paso in plan['despues'])
+
+def test_error_regresa_none(conn):
+    migrador = MigradorEsquema.para_conexion(conn, 'pruebas')
+    conn.close()
+    
+    assert migrador.aplicar() is None
@@ -0,0 +1,115 @@
+"""
+Protocolo por tramas del trabajador SQL persistente de escuela35, probado
+con TrabajadorSQLLocal: el mismo script corre en un subproceso local.
+"""
+
+import io
+import os
+
+import pytest
+
+from escuela35 import RespuestaPerdida, TrabajadorNoIniciado, TrabajadorSQLLocal
+
+@pytest.fixture
+def trabajador(ruta_db):
+    trabajador = TrabajadorSQLLocal(ruta_db)
+    yield trabajador
+    trabajador.cerrar()
+
+def test_consulta_con_parametros(trabajador):
+    filas, error = trabajador.ejecutar("SELECT matricula, promedio FROM inscritos WHERE id = ?", [1])
+    
+    assert error is None
+    assert filas == [{'matricula': 'A001', 'promedio': 9.5}]
+
+def test_error_sql_regresa_mensaje_y_el_trabajador_sigue_vivo(trabajador):
+    filas, error = trabajador.ejecutar("SELECT * FROM tabla_inexistente")
+    
+    assert filas is None
+    assert error.startswith('Error: no such table')
+    assert trabajador.ejecutar("SELECT COUNT(*) AS n FROM inscritos") == ([{'n': 3}], None)
+
+def test_modificacion_persiste_en_la_base(trabajador, ruta_db):
+    _, error = trabajador.ejecutar(
+        "INSERT INTO inscritos (matricula, nombre_completo) VALUES (?, ?)", ['A004', 'Nuevo']
+    )
+    
+    assert error is None
+    otro = TrabajadorSQLLocal(ruta_db)
+    try:
+        assert otro.ejecutar("SELECT id FROM inscritos WHERE matricula = 'A004'")[0] == [{'id': 4}]
+    finally:
+        otro.cerrar()
+
+def test_blob_viaja_sin_convertirse_a_texto(trabajador):
+    contenido = bytes(range(256))
+    trabajador.ejecutar("UPDATE documentos_subidos SET contenido = ? WHERE id = 1", [contenido])
+    
+    filas, error = trabajador.ejecutar("SELECT contenido FROM documentos_subidos WHERE id = 1")
+    
+    assert error is None
+    assert filas[0]['contenido'] == contenido
+
+def test_script_que_falla_a_la_mitad_no_deja_transaccion_abierta(trabajador):
+    _, error = trabajador.ejecutar(
+        "BEGIN; INSERT INTO inscritos (id, matricula) VALUES (1, 'duplicado'); COMMIT;"
+    )
+    
+    assert 'UNIQUE' in error
+    assert trabajador.ejecutar("BEGIN IMMEDIATE") == ([], None)
+    assert trabajador.ejecutar("ROLLBACK") == ([], None)
+
+def test_funcion_normalizar_busqueda_registrada(trabajador):
+    filas, error = trabajador.ejecutar(
+        "SELECT nombre_completo FROM inscritos WHERE normalizar_busqueda(nombre_completo) LIKE ?",
+        ['%pena%']
+    )
+    
+    assert error is None
+    assert filas == [{'nombre_completo': 'José Peña'}]
+
+def test_lote_reporta_errores_por_consulta(trabajador):
+    resultados, errores = trabajador.ejecutar_lote({
+        'total': ("SELECT COUNT(*) AS n FROM inscritos", None),
+        'documentos': ("SELECT nombre_archivo FROM documentos_subidos WHERE inscrito_id = ?", [1]),
+        'roto': ("SELECT * FROM no_existe", None),
+    })
+    
+    assert resultados == {'total': [{'n': 3}], 'documentos': [{'nombre_archivo': 'acta.pdf'}]}
+    assert list(errores) == ['roto']
+
+@pytest.mark.parametrize('comprimir', [True, False])
+def test_columnar_conserva_tipos_entre_bloques(trabajador, comprimir):
+    df, error = trabajador.consultar_columnar(
+        "SELECT id, matricula, promedio, fecha_registro FROM inscritos ORDER BY id",
+        filas_por_bloque=1, comprimir=comprimir
+    )
+    
+    assert error is None
+    assert list(df.columns) == ['id', 'matricula', 'promedio', 'fecha_registro']
+    assert df['id'].tolist() == [1, 2, 3]
+    assert df['promedio'].dtype == 'float64'
+    assert df['promedio'].isna().tolist() == [False, True, False]
+    assert df['fecha_registro'].tolist() == ['2024-01-10', None, '2024-02-01']
+
+def test_columnar_con_error_no_desincroniza_el_protocolo(trabajador):
+    df, error = trabajador.consultar_columnar("SELECT * FROM no_existe")
+    
+    assert df is None
+    assert 'no such table' in error
+    assert trabajador.ejecutar("SELECT 1 AS uno") == ([{'uno': 1}], None)
+    assert trabajador.peticiones == 2
+
+def test_trabajador_que_no_arranca(tmp_path):
+    with pytest.raises(TrabajadorNoIniciado):
+        TrabajadorSQLLocal(os.path.join(str(tmp_path), 'no_existe', 'escuela.db'))
+
+def test_respuesta_perdida_cierra_el_trabajador(trabajador):
+    # El canal se corta después de enviar la petición: la respuesta nunca llega
+    _, error = trabajador.ejecutar("SELECT 1")
+    assert error is None
+    trabajador.lector = io.BytesIO(b'')
+    
+    with pytest.raises(RespuestaPerdida):
+        trabajador.ejecutar("SELECT 1")
+    assert not trabajador.vivo